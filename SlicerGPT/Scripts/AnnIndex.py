@@ -0,0 +1,118 @@
+import os
+import math
+import faiss
+import numpy as np
+
+# Exact search is what LangChain saved, the others trade recall for speed and memory
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq_fp16")
+
+# IVF and PQ training need enough points, and below this size IVF is no faster than flat
+MIN_IVF_VECTORS = 1024
+
+DEFAULT_SEARCH_PARAMS = {
+    "hnsw": {"efSearch": 64},
+    "ivf_flat": {"nprobe": 8},
+    "ivf_pq": {"nprobe": 8},
+}
+
+def index_file(index_type: str) -> str:
+    """
+    Returns:
+        str: File name of the given index type inside the merged index directory.
+    """
+    return "index.faiss" if index_type == "flat" else f"index_{index_type}.faiss"
+
+def factory_string(index_type: str, ntotal: int, d: int) -> str:
+    """
+    Build the `faiss.index_factory` description of an index type, sized for the corpus.
+    Corpora too small to train IVF centroids or PQ codebooks (small shards) use exact search.
+
+    Args:
+        index_type (str): One of `INDEX_TYPES`.
+        ntotal (int): Number of vectors that will be indexed.
+        d (int): Vector dimension.
+
+    Returns:
+        str: The FAISS factory string.
+    """
+    # FAISS wants ~39 training points per centroid, 4*sqrt(n) lists is the usual sweet spot
+    nlist = max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+    if index_type == "flat" or (index_type.startswith("ivf") and ntotal < MIN_IVF_VECTORS):
+        return "Flat"
+    if index_type == "hnsw":
+        return "HNSW32"
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_pq":
+        # 8-dimensional sub-vectors, with codebooks no larger than the training set can fit
+        m = next(m for m in (d // 8, d // 4, d // 2, d) if m > 0 and d % m == 0)
+        nbits = max(4, min(8, int(math.log2(ntotal / 39))))
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+def build_index(vectors, metric_type: int, index_type: str):
+    """
+    Build and train a FAISS index of the given type over a vector matrix.
+
+    Args:
+        vectors (np.ndarray): Float32 matrix of shape (n, d), row i becomes position i.
+        metric_type (int): `faiss.METRIC_L2` or `faiss.METRIC_INNER_PRODUCT`.
+        index_type (str): One of `INDEX_TYPES`.
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ntotal, d = vectors.shape
+    index = faiss.index_factory(d, factory_string(index_type, ntotal, d), metric_type)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    set_search_params(index, DEFAULT_SEARCH_PARAMS.get(index_type, {}))
+    return index
+
+def build_from_flat(flat_path: str, index_type: str, output_path: str):
+    """
+    Build an index of the given type from the vectors of a persisted flat index and save it atomically.
+
+    Args:
+        flat_path (str): Path of the flat `index.faiss`.
+        index_type (str): One of `INDEX_TYPES`.
+        output_path (str): Path of the index file to write.
+    """
+    flat = faiss.read_index(flat_path)
+    index = build_index(flat.reconstruct_n(0, flat.ntotal), flat.metric_type, index_type)
+    # Per process, several servers sharing the index may build it at the same time
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, output_path)
+    print(f"Built {index_type} index: {output_path}")
+
+def read_index(path: str, index_type: str, search_params: dict = None):
+    """
+    Read a persisted index with the search parameters of its type, overridden by `search_params`.
+    """
+    index = faiss.read_index(path)
+    set_search_params(index, {**DEFAULT_SEARCH_PARAMS.get(index_type, {}), **(search_params or {})})
+    return index
+
+def set_search_params(index, params: dict):
+    """
+    Apply search-time parameters such as `nprobe` or `efSearch`.
+
+    Args:
+        index (faiss.Index): The index to tune.
+        params (dict): Parameter name to value.
+    """
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        space.set_index_parameter(index, name, value)
+
+def index_memory_bytes(index) -> int:
+    """
+    Returns:
+        int: Size of the serialized index, a close estimate of its memory footprint.
+    """
+    return int(faiss.serialize_index(index).nbytes)
@@ -1,88 +1,216 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from threading import Thread
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import qt
 
 class AsyncRequest(qt.QObject):
-    """Class used to send HTTP asynchronous request."""
+    """Class used to send HTTP asynchronous request.
+
+    The requests run on a small pool of persistent worker threads and share one keep-alive
+    session, so no thread is started and no TCP connection is opened per message. Every
+    request has a timeout: a stuck server cannot hold a worker forever.
+    """
     # Define signals that will be emitted when the request is finished
     requestFinished = qt.Signal(dict)
     requestFailed = qt.Signal(str)
+    # Emitted for every chunk of a streamed answer, before requestFinished
+    tokenReceived = qt.Signal(str)
 
-    def __init__(self):
+    def __init__(self, workers=4, connect_timeout=3.05, read_timeout=300.0, retries=2):
+        """
+        Args:
+            workers: number of worker threads, also the size of the connection pool
+            connect_timeout: seconds to establish a connection
+            read_timeout: seconds without data from the server before a request fails,
+                between two chunks for a streamed answer
+            retries: retries of the failed connections, and of the GET requests answered 502, 503 or 504.
+                A POST that reached the server is never sent twice.
+        """
         super().__init__()
-        
-    def post(self, url, json_data):
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries, connect=retries, read=0, status=retries, backoff_factor=0.3,
+                      status_forcelist=(502, 503, 504), allowed_methods=frozenset({"GET"}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="AsyncRequest")
+
+        self.lock = threading.Lock()
+        # Requests sent or waiting for a worker, by (method, url, body): future and callbacks to notify
+        self.inflight = {}
+        self.queued = 0
+        self.running = 0
+        self.coalesced = 0
+        # Open streamed responses, closed by `close` to release their workers
+        self.responses = set()
+
+    def post(self, url, json_data, callback=None, timeout=None):
         """Run the asynchronous post request.
-        
+
         Args:
             url: request's URL
             json_data: JSON data to send
-            
+            callback: called on the main thread with (data, error) instead of emitting the signals
+            timeout: (connect, read) timeout in seconds, the constructor ones by default
+
+        Returns:
+            Future resolved with the response data, shared with an identical request already in flight.
+
         La réponse sera émise via le signal requestFinished.
         Les erreurs seront émises via le signal requestFailed.
         """
-        # Create a thread to execute the request
-        thread = Thread(target=self._execute_request, args=(url, json_data))
-        thread.daemon = True  # The thread will terminate when the main program terminates
-        thread.start()
-    
-    def _execute_request(self, url, json_data):
-        """Method executed in a separate thread."""
+        return self._submit(("POST", url, json_data), callback,
+                            lambda: self._execute_request("POST", url, json_data, timeout))
+
+    def get(self, url, callback=None, timeout=None):
+        """Run an asynchronous get request, see `post`."""
+        return self._submit(("GET", url, None), callback,
+                            lambda: self._execute_request("GET", url, None, timeout))
+
+    def stream(self, url, json_data, callback=None):
+        """Run an asynchronous post request on a Server-Sent Events endpoint.
+
+        Args:
+            url: request's URL
+            json_data: JSON data to send
+            callback: called on the main thread with (final event, error) instead of emitting
+                requestFinished and requestFailed
+
+        Every received chunk is emitted via the signal tokenReceived,
+        the final event (whole answer in "content") via requestFinished and errors via requestFailed.
+        """
+        return self._submit(("STREAM", url, json_data), callback, lambda: self._execute_stream(url, json_data))
+
+    def stats(self):
+        """Returns the requests waiting for a worker, running, and coalesced with an identical one so far."""
+        with self.lock:
+            return {"workers": self.workers, "queued": self.queued, "running": self.running,
+                    "coalesced": self.coalesced}
+
+    def close(self):
+        """Drop the waiting requests, abort the streamed ones and close the connections."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            responses = list(self.responses)
+        for response in responses:
+            response.close()
+        self.session.close()
+
+    def _submit(self, request, callback, fn):
+        method, url, json_data = request
+        key = (method, url, json.dumps(json_data, sort_keys=True))
+        with self.lock:
+            if key in self.inflight:
+                # The same request is already on its way, its result is delivered to both callers
+                future, callbacks = self.inflight[key]
+                callbacks.append(callback)
+                self.coalesced += 1
+                return future
+            callbacks = [callback]
+            self.queued += 1
+            future = self.executor.submit(self._run, key, fn)
+            self.inflight[key] = (future, callbacks)
+        return future
+
+    def _run(self, key, fn):
+        """Method executed by a worker thread."""
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        data, error = None, None
         try:
-            response = requests.post(url, json=json_data)
-            response.raise_for_status()  # Raises an exception if the status is not 2xx
-            
-            # Process the response
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    # Use moveToThread's thread to emit the signal safely
-                    qt.QApplication.instance().postEvent(
-                        self, 
-                        _CustomEvent(_CustomEvent.Success, data)
-                    )
-                except ValueError:
-                    # Handle plain text response
-                    qt.QApplication.instance().postEvent(
-                        self, 
-                        _CustomEvent(_CustomEvent.Success, {"content": response.text})
-                    )
-            else:
-                error_msg = f"HTTP Error: {response.status_code}"
-                qt.QApplication.instance().postEvent(
-                    self, 
-                    _CustomEvent(_CustomEvent.Error, error_msg)
-                )
-                
+            data = fn()
         except requests.exceptions.RequestException as e:
-            # In case of error, emit the error signal
-            error_msg = f"Request error: {str(e)}"
-            qt.QApplication.instance().postEvent(
-                self, 
-                _CustomEvent(_CustomEvent.Error, error_msg)
-            )
+            error = f"Request error: {str(e)}"
+        except _RequestError as e:
+            error = str(e)
+        except Exception as e:
+            error = f"Unexpected error: {str(e)}"
+        finally:
+            with self.lock:
+                self.running -= 1
+                _, callbacks = self.inflight.pop(key)
+        # Use Qt events to run the callbacks and emit the signals on the main thread
+        qt.QApplication.instance().postEvent(self, _CustomEvent(_CustomEvent.Done, (callbacks, data, error)))
+        if error is not None:
+            raise _RequestError(error)
+        return data
+
+    def _execute_request(self, method, url, json_data, timeout):
+        response = self.session.request(method, url, json=json_data, timeout=timeout or self.timeout)
+        response.raise_for_status()  # Raises an exception if the status is not 2xx
+        try:
+            return response.json()
+        except ValueError:
+            # Handle plain text response
+            return {"content": response.text}
+
+    def _execute_stream(self, url, json_data):
+        """Reads the events as they arrive."""
+        app = qt.QApplication.instance()
+        response = self.session.post(url, json=json_data, stream=True, timeout=self.timeout)
+        with self.lock:
+            self.responses.add(response)
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                if "token" in event:
+                    app.postEvent(self, _CustomEvent(_CustomEvent.Token, event["token"]))
+                elif "error" in event:
+                    raise _RequestError(f"Generation error: {event['error']}")
+                elif event.get("done"):
+                    return event
+            raise _RequestError("Stream closed before the end of the answer")
+        except (ValueError, AttributeError) as e:
+            # AttributeError comes from reading a response closed by `close`
+            raise _RequestError(f"Request error: {str(e)}")
+        finally:
+            with self.lock:
+                self.responses.discard(response)
+            response.close()
 
     # Override event method to handle our custom events
     def event(self, event):
         if event.type() == _CustomEvent.EventType:
-            if event.event_kind == _CustomEvent.Success:
-                self.requestFinished.emit(event.data)
-            elif event.event_kind == _CustomEvent.Error:
-                self.requestFailed.emit(event.data)
+            if event.event_kind == _CustomEvent.Done:
+                callbacks, data, error = event.data
+                for callback in callbacks:
+                    if callback is not None:
+                        callback(data, error)
+                # Coalesced callers without callback share one emission, the listeners see one answer
+                if None in callbacks:
+                    if error is not None:
+                        self.requestFailed.emit(error)
+                    else:
+                        self.requestFinished.emit(data)
+            elif event.event_kind == _CustomEvent.Token:
+                self.tokenReceived.emit(event.data)
             return True
         return qt.QObject.event(self, event)
 
 
+class _RequestError(Exception):
+    """Failed request, with the message given to requestFailed."""
+
+
 # Custom event class to safely pass data between threads
 class _CustomEvent(qt.QEvent):
     # Define custom event type
     EventType = qt.QEvent.Type(qt.QEvent.registerEventType())
-    
+
     # Event kinds
-    Success = 0
-    Error = 1
-    
+    Done = 0
+    Token = 1
+
     def __init__(self, event_kind, data):
         super().__init__(_CustomEvent.EventType)
         self.event_kind = event_kind
-        self.data = data
\ No newline at end of file
+        self.data = data
@@ -0,0 +1,172 @@
+import re
+import numpy as np
+
+CODE_FENCE = re.compile(r"(```.*?(?:```|$))", re.DOTALL)
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[`*-])")
+GAP_MARKER = "[...]"
+
+def looks_like_code(paragraph: str) -> bool:
+    """
+    Code and tables are kept whole, cutting them at periods would break them.
+    """
+    lines = paragraph.splitlines()
+    return (
+        paragraph.startswith("```")
+        or any(line.startswith(("    ", "\t", ">>>", "|")) for line in lines)
+        or any(line.rstrip().endswith((":", ";", "{", "}", ")")) for line in lines[:-1])
+    )
+
+def split_segments(text: str):
+    """
+    Split a chunk into the units the packer keeps or drops: sentences of prose paragraphs,
+    whole code blocks and tables.
+
+    Args:
+        text (str): The chunk content.
+
+    Returns:
+        List[str]: The segments, in order.
+    """
+    segments = []
+    for block in CODE_FENCE.split(text):
+        if block.startswith("```"):
+            segments.append(block.strip())
+            continue
+        for paragraph in PARAGRAPH_BREAK.split(block):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if looks_like_code(paragraph):
+                segments.append(paragraph)
+            else:
+                segments.extend(sentence.strip() for sentence in SENTENCE_END.split(paragraph) if sentence.strip())
+    return segments
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class ContextPacker:
+    """
+    Packs the retrieved chunks into a fixed token budget.
+
+    The chunks are over-retrieved, then near-duplicates are dropped (the same passage often
+    lives in several sources, e.g. the documentation and the forum), each chunk is trimmed to
+    the segments closest to the question, and the segments are added by decreasing relevance
+    until the budget is full, skipping the ones repeating an already added segment. Every
+    kept chunk first contributes its best segment.
+    """
+
+    def __init__(self, embed, count_tokens, max_tokens: int = 1024, duplicate_threshold: float = 0.9,
+                 max_documents: int = 4, min_relevance: float = 0.2):
+        """
+        Args:
+            embed (Callable[[List[str]], np.ndarray]): Embeds texts with the retrieval model, one row per text.
+            count_tokens (Callable[[str], int]): Number of tokens of a text with the model tokenizer.
+            max_tokens (int): Token budget of the context documents.
+            duplicate_threshold (float): Cosine similarity above which a chunk duplicates a better ranked one.
+            max_documents (int): Maximum number of chunks kept after deduplication.
+            min_relevance (float): Segments less similar to the question are only kept as a chunk's best segment.
+        """
+        self.embed = embed
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.max_documents = max_documents
+        self.min_relevance = min_relevance
+
+    def deduplicate(self, chunks):
+        """
+        Args:
+            chunks (List[Tuple[List[str], np.ndarray]]): Segments and normalized segment vectors of every chunk, best ranked first.
+
+        Returns:
+            Tuple[List[int], int]: Indices of the chunks kept and number of duplicates dropped.
+        """
+        kept, centroids, duplicates = [], [], 0
+        for i, (_, vectors) in enumerate(chunks):
+            centroid = normalize_rows(vectors.mean(axis=0))
+            if any(float(centroid @ other) >= self.duplicate_threshold for other in centroids):
+                duplicates += 1
+                continue
+            kept.append(i)
+            centroids.append(centroid)
+            if len(kept) >= self.max_documents:
+                break
+        return kept, duplicates
+
+    def pack(self, query_vector, docs):
+        """
+        Args:
+            query_vector (np.ndarray): Embedding of the question.
+            docs (List[Document]): The retrieved chunks, best ranked first.
+
+        Returns:
+            Tuple[List[str], dict]: The packed chunk texts, best ranked first, and packing statistics
+            (candidates, duplicates, documents, tokens before and after packing).
+        """
+        contents = [doc.page_content for doc in docs]
+        segments = [split_segments(content) or [content] for content in contents]
+        flat = [segment for chunk in segments for segment in chunk]
+        if not flat:
+            return [], {"candidates": len(docs), "duplicates": 0, "documents": 0, "tokens_before": 0, "tokens": 0}
+
+        vectors = normalize_rows(self.embed(flat))
+        chunks, start = [], 0
+        for chunk in segments:
+            chunks.append((chunk, vectors[start:start + len(chunk)]))
+            start += len(chunk)
+        kept, duplicates = self.deduplicate(chunks)
+
+        query_vector = normalize_rows(query_vector)
+        candidates = []
+        for i in kept:
+            chunk, chunk_vectors = chunks[i]
+            relevance = chunk_vectors @ query_vector
+            order = np.argsort(-relevance)
+            for rank, j in enumerate(order):
+                if rank and relevance[j] < self.min_relevance:
+                    break
+                # The best segment of every chunk first, then all the others by relevance
+                candidates.append((rank > 0, -float(relevance[j]), i, int(j)))
+        candidates.sort()
+
+        selected = {i: set() for i in kept}
+        selected_vectors = []
+        used = 0
+        for _, _, i, j in candidates:
+            # A sentence repeated by another source (the chunks overlap without being duplicates)
+            vector = chunks[i][1][j]
+            if any(float(vector @ other) >= self.duplicate_threshold for other in selected_vectors):
+                continue
+            tokens = self.count_tokens(chunks[i][0][j])
+            if used + tokens > self.max_tokens:
+                continue
+            selected[i].add(j)
+            selected_vectors.append(vector)
+            used += tokens
+
+        texts = []
+        for i in kept:
+            if not selected[i]:
+                continue
+            parts, previous = [], -1
+            for j in sorted(selected[i]):
+                if j != previous + 1:
+                    parts.append(GAP_MARKER)
+                parts.append(chunks[i][0][j])
+                previous = j
+            if previous != len(chunks[i][0]) - 1:
+                parts.append(GAP_MARKER)
+            texts.append("\n".join(parts))
+
+        stats = {
+            "candidates": len(docs),
+            "duplicates": duplicates,
+            "documents": len(texts),
+            "tokens_before": sum(self.count_tokens(content) for content in contents),
+            "tokens": sum(self.count_tokens(text) for text in texts),
+        }
+        return texts, stats
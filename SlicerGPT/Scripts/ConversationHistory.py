@@ -0,0 +1,158 @@
+import re
+
+THINK_PATTERN = re.compile(r"<think>.*?(?:</think>|$)\s*", re.DOTALL)
+
+def strip_reasoning(text: str) -> str:
+    """
+    Remove the `<think>` blocks of an answer, they are never useful in later turns.
+
+    Args:
+        text (str): The model answer.
+
+    Returns:
+        str: The answer without its reasoning trace.
+    """
+    return THINK_PATTERN.sub("", text).strip()
+
+
+class ConversationHistory:
+    """
+    Conversation history kept within a token budget.
+
+    The system prompt is always sent. Past turns are stored without their reasoning traces,
+    and once they exceed `max_tokens` the oldest ones are folded into a rolling summary,
+    sent as a second system message right after the system prompt.
+    """
+
+    def __init__(self, system_prompt: str, count_tokens, max_tokens: int = 2048, keep_turns: int = 2,
+                 summarize=None, summary_tokens: int = 256):
+        """
+        Args:
+            system_prompt (str): The system prompt.
+            count_tokens (Callable[[str], int]): Number of tokens of a text with the model tokenizer.
+            max_tokens (int): Token budget of the summary and the past turns.
+            keep_turns (int): Number of most recent turns never folded into the summary.
+            summarize (Callable[[str, List[dict]], str]): Produce a new summary from the previous one and
+                the turns to fold. Defaults to keeping the user questions only.
+            summary_tokens (int): Maximum size of the summary, longer summaries are cut.
+        """
+        self.system_prompt = system_prompt
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summarize = summarize or self.summarize_questions
+        self.summary_tokens = summary_tokens
+        self.system_tokens = count_tokens(system_prompt)
+        self.summary = ""
+        self.summary_size = 0
+        # One entry per turn: (user message, assistant message, tokens of both)
+        self.turns = []
+
+    @staticmethod
+    def summarize_questions(summary: str, turns) -> str:
+        """
+        Fallback summarizer: the topics the user already asked about.
+        """
+        questions = [turn["content"].strip().replace("\n", " ")[:200] for turn in turns if turn["role"] == "user"]
+        return "\n".join(filter(None, [summary] + [f"- The user asked: {question}" for question in questions]))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut a text to at most `max_tokens`, keeping its end (the most recent summary lines).
+        """
+        while text and self.count_tokens(text) > max_tokens:
+            lines = text.split("\n")
+            text = "\n".join(lines[1:]) if len(lines) > 1 else text[len(text) // 4:]
+        return text
+
+    def turn_tokens(self) -> int:
+        return sum(tokens for _, _, tokens in self.turns)
+
+    def tokens(self) -> int:
+        """
+        Returns:
+            int: Tokens of the summary and the past turns.
+        """
+        return self.summary_size + self.turn_tokens()
+
+    def add_turn(self, user_input: str, response: str, compress: bool = True):
+        """
+        Store a completed turn, then compress the history if it is over budget.
+
+        Args:
+            user_input (str): The user question, without the retrieved context.
+            response (str): The model answer.
+            compress (bool): Compress right away. Otherwise the caller runs `compress` later,
+                e.g. once the answer was delivered, meanwhile `messages` leaves the oldest turns out.
+        """
+        response = strip_reasoning(response)
+        self.turns.append((
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": response},
+            self.count_tokens(user_input) + self.count_tokens(response),
+        ))
+        if compress:
+            self.compress()
+
+    def compress(self, summarize=None):
+        """
+        Fold the oldest turns into the summary until the history fits in `max_tokens`.
+
+        Args:
+            summarize (Callable[[str, List[dict]], str]): Summarizer of this call, the history one by default.
+        """
+        if self.tokens() <= self.max_tokens or len(self.turns) <= self.keep_turns:
+            return
+        folded = []
+        while len(self.turns) > self.keep_turns and self.tokens() > self.max_tokens:
+            folded.append(self.turns.pop(0))
+        try:
+            summary = (summarize or self.summarize)(
+                self.summary, [message for user, assistant, _ in folded for message in (user, assistant)]
+            )
+        except Exception as e:
+            print(f"Could not summarize the conversation ({e}), keeping the questions only.")
+            summary = self.summarize_questions(self.summary, [user for user, _, _ in folded])
+        # The summarizer may answer with an (empty) reasoning block
+        self.summary = self.truncate(strip_reasoning(summary), min(self.summary_tokens, self.max_tokens // 2))
+        self.summary_size = self.count_tokens(self.summary) if self.summary else 0
+
+    def messages(self, available_tokens: int = None):
+        """
+        Build the history messages of a request.
+
+        Args:
+            available_tokens (int): Tokens left for the summary and the past turns once the system prompt,
+                the question and the answer are accounted for. Older turns that do not fit are left out
+                of this request, without being summarized.
+
+        Returns:
+            Tuple[List[dict], dict]: The messages, system prompt first, and the tokens used by
+            the "system", "summary" and "history" components.
+        """
+        budget = self.max_tokens if available_tokens is None else min(self.max_tokens, available_tokens)
+        summary_size = self.summary_size if self.summary_size <= budget else 0
+        budget -= summary_size
+
+        kept = []
+        for user, assistant, tokens in reversed(self.turns):
+            if tokens > budget:
+                break
+            kept.insert(0, (user, assistant))
+            budget -= tokens
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary_size:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        for user, assistant in kept:
+            messages += [dict(user), dict(assistant)]
+        return messages, {
+            "system": self.system_tokens,
+            "summary": summary_size,
+            "history": sum(tokens for _, _, tokens in self.turns[len(self.turns) - len(kept):]),
+        }
+
+    def clear(self):
+        self.summary = ""
+        self.summary_size = 0
+        self.turns = []
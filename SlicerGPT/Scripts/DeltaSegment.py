@@ -0,0 +1,163 @@
+import os
+import json
+import sqlite3
+import threading
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+UPDATES_FILE = "updates.sqlite"
+
+class DeltaSegment:
+    """
+    Pending updates of a persisted store: documents added since the last compaction
+    and tombstones of deleted main-segment documents.
+
+    Everything lives in one SQLite file next to the store, every update is a single
+    transaction, so a restart sees either the whole update or none of it.
+    Delta documents get the positions `base + seq`, after the main segment positions.
+    """
+
+    def __init__(self, path: str, base: int, d: int, metric_type: int):
+        """
+        Args:
+            path (str): Persisted store directory.
+            base (int): Number of vectors in the main segment.
+            d (int): Vector dimension.
+            metric_type (int): FAISS metric of the main segment.
+        """
+        self.db_path = os.path.join(path, UPDATES_FILE)
+        self.base = base
+        self.d = d
+        self.metric_type = metric_type
+        self.lock = threading.RLock()
+        self.connection = None
+        self.index = faiss.IndexIDMap2(faiss.IndexFlat(d, metric_type))
+        self.tombstones = set()
+        if os.path.isfile(self.db_path):
+            self.load()
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS delta ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL UNIQUE, "
+                "page_content TEXT NOT NULL, metadata TEXT NOT NULL, vector BLOB NOT NULL)"
+            )
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tombstones (position INTEGER PRIMARY KEY)")
+            self.connection.commit()
+        return self.connection
+
+    def load(self):
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute("SELECT seq, vector FROM delta ORDER BY seq").fetchall()
+            if rows:
+                ids = np.array([self.base + seq for seq, _ in rows], dtype=np.int64)
+                vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+                self.index.add_with_ids(vectors, ids)
+            self.tombstones = {row[0] for row in connection.execute("SELECT position FROM tombstones")}
+
+    def __len__(self):
+        return int(self.index.ntotal)
+
+    def add(self, documents, vectors):
+        """
+        Append documents to the delta segment.
+
+        Args:
+            documents (List[Tuple[str, Document]]): (docstore id, document) pairs.
+            vectors (np.ndarray): Their embeddings, one row per document.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                seqs = []
+                for (doc_id, doc), vector in zip(documents, vectors):
+                    cursor = connection.execute(
+                        "INSERT INTO delta (doc_id, page_content, metadata, vector) VALUES (?, ?, ?, ?)",
+                        (doc_id, doc.page_content, json.dumps(doc.metadata, default=str), vector.tobytes()),
+                    )
+                    seqs.append(cursor.lastrowid)
+            self.index.add_with_ids(vectors, np.array([self.base + seq for seq in seqs], dtype=np.int64))
+
+    def delete(self, doc_ids, main_positions) -> int:
+        """
+        Delete documents: delta documents are dropped, main-segment ones get a tombstone.
+
+        Args:
+            doc_ids (List[str]): Docstore ids to delete.
+            main_positions (Dict[str, int]): Main-segment positions of those ids.
+
+        Returns:
+            int: Number of documents deleted.
+        """
+        doc_ids = list(doc_ids)
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                placeholders = ",".join("?" * len(doc_ids))
+                seqs = [row[0] for row in connection.execute(
+                    f"SELECT seq FROM delta WHERE doc_id IN ({placeholders})", doc_ids
+                )] if doc_ids else []
+                if seqs:
+                    connection.execute(f"DELETE FROM delta WHERE seq IN ({','.join('?' * len(seqs))})", seqs)
+                tombstones = [p for p in main_positions.values() if p not in self.tombstones]
+                connection.executemany("INSERT OR IGNORE INTO tombstones VALUES (?)", [(p,) for p in tombstones])
+            if seqs:
+                self.index.remove_ids(np.array([self.base + seq for seq in seqs], dtype=np.int64))
+            self.tombstones.update(tombstones)
+            return len(seqs) + len(tombstones)
+
+    def search(self, vectors, k: int):
+        """
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: FAISS-style scores and positions of the delta hits.
+        """
+        with self.lock:
+            return self.index.search(vectors, k)
+
+    def get(self, positions):
+        """
+        Materialize delta documents by position.
+
+        Returns:
+            Dict[int, Document]: Documents found, by position.
+        """
+        seqs = [int(p) - self.base for p in positions]
+        if not seqs:
+            return {}
+        with self.lock:
+            rows = self.connect().execute(
+                f"SELECT seq, doc_id, page_content, metadata FROM delta WHERE seq IN ({','.join('?' * len(seqs))})",
+                seqs,
+            ).fetchall()
+        return {
+            self.base + seq: Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+            for seq, doc_id, page_content, metadata in rows
+        }
+
+    def rows(self):
+        """
+        Returns:
+            List[Tuple[str, Document, np.ndarray]]: Every delta document with its vector, in insertion order.
+        """
+        if not os.path.isfile(self.db_path):
+            return []
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT doc_id, page_content, metadata, vector FROM delta ORDER BY seq"
+            ).fetchall()
+        return [
+            (doc_id, Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata)),
+             np.frombuffer(blob, dtype=np.float32))
+            for doc_id, page_content, metadata, blob in rows
+        ]
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,152 @@
+import os
+import json
+import sqlite3
+import threading
+from langchain_core.documents import Document
+
+DOCSTORE_FILE = "docstore.sqlite"
+
+class SQLiteDocstore:
+    """
+    On-disk docstore addressed by vector index position.
+
+    Documents stay in a SQLite file and only the hits of a query are materialized
+    as `Document` objects, instead of unpickling the whole corpus at startup.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open an existing docstore read-only.
+
+        Args:
+            path (str): Directory containing the docstore file.
+        """
+        db_path = os.path.abspath(os.path.join(path, DOCSTORE_FILE))
+        if not os.path.isfile(db_path):
+            raise FileNotFoundError(f"No docstore found at {db_path}")
+        self.connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def build(path: str, documents):
+        """
+        Write a docstore file.
+
+        Args:
+            path (str): Output directory.
+            documents (Iterable[Tuple[str, Document]]): (docstore id, document) pairs,
+                in vector index position order.
+        """
+        db_path = os.path.join(path, DOCSTORE_FILE)
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        connection = sqlite3.connect(db_path)
+        try:
+            connection.execute(
+                "CREATE TABLE documents ("
+                "position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, "
+                "page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            connection.executemany(
+                "INSERT INTO documents VALUES (?, ?, ?, ?)",
+                (
+                    (position, doc_id, doc.page_content, json.dumps(doc.metadata, default=str))
+                    for position, (doc_id, doc) in enumerate(documents)
+                ),
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def get(self, positions):
+        """
+        Materialize the documents stored at the given index positions.
+
+        Args:
+            positions (List[int]): Vector index positions.
+
+        Returns:
+            Dict[int, Document]: Documents found, by position. Unknown positions are missing.
+        """
+        positions = [int(p) for p in positions]
+        if not positions:
+            return {}
+        placeholders = ",".join("?" * len(positions))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT position, doc_id, page_content, metadata FROM documents WHERE position IN ({placeholders})",
+                positions,
+            ).fetchall()
+        return {
+            row[0]: Document(id=row[1], page_content=row[2], metadata=json.loads(row[3])) for row in rows
+        }
+
+    def positions_of(self, doc_ids):
+        """
+        Look up the index positions of documents by docstore id.
+
+        Args:
+            doc_ids (List[str]): Docstore ids.
+
+        Returns:
+            Dict[str, int]: Position of every id found.
+        """
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT doc_id, position FROM documents WHERE doc_id IN ({placeholders})", doc_ids
+            ).fetchall()
+        return dict(rows)
+
+    def iter_documents(self):
+        """
+        Iterate over all documents in position order.
+
+        Yields:
+            Tuple[int, str, Document]: Position, docstore id and document.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT position, doc_id, page_content, metadata FROM documents ORDER BY position"
+            ).fetchall()
+        for position, doc_id, page_content, metadata in rows:
+            yield position, doc_id, Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class InMemoryDocstoreView:
+    """
+    Exposes a LangChain docstore with the same position-based interface as `SQLiteDocstore`.
+    """
+
+    def __init__(self, docstore, index_to_docstore_id):
+        self.docstore = docstore
+        self.index_to_docstore_id = index_to_docstore_id
+
+    def __len__(self):
+        return len(self.index_to_docstore_id)
+
+    def get(self, positions):
+        docs = {}
+        for position in positions:
+            doc_id = self.index_to_docstore_id.get(int(position))
+            if doc_id is not None:
+                docs[int(position)] = self.docstore.search(doc_id)
+        return docs
+
+    def iter_documents(self):
+        for position, doc_id in sorted(self.index_to_docstore_id.items()):
+            yield position, doc_id, self.docstore.search(doc_id)
+
+    def close(self):
+        pass
@@ -0,0 +1,91 @@
+"""
+Import time, query latency and vector drift of the embedding backends, against "huggingface".
+
+Usage (from the Scripts directory):
+    python EmbeddingBenchmark.py --backends huggingface onnx --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+import faiss
+import numpy as np
+from Embeddings import EMBEDDING_BACKENDS, create_embeddings
+from IndexBenchmark import PROMPTS
+from IndexStore import current_path
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+def import_time(backend: str, model_name: str) -> float:
+    """
+    Time importing and instantiating a backend in a fresh interpreter, so that modules
+    already imported by this process (torch, onnxruntime) do not hide the cold start.
+
+    Returns:
+        float: Seconds until the backend can embed a query.
+    """
+    code = (
+        "import time; start = time.perf_counter(); "
+        "from Embeddings import create_embeddings; "
+        f"create_embeddings({backend!r}, {model_name!r}).embed_query('warmup'); "
+        "print(time.perf_counter() - start)"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def query_latencies(embeddings, queries, repeat: int):
+    """
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Per-query latencies in ms and the query vectors.
+    """
+    embeddings.embed_query("warmup")
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            embeddings.embed_query(query)
+            latencies.append(time.perf_counter() - start)
+    vectors = np.array(embeddings.embed_documents(queries), dtype=np.float32)
+    return np.array(latencies) * 1000, vectors
+
+def cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--merged-index", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "SlicerFAISSMerged"),
+                        help="Persisted merged index used to compare the top-k hits of each backend, skipped if missing.")
+    args = parser.parse_args()
+
+    live_path = current_path(args.merged_index)
+    index = faiss.read_index(os.path.join(live_path, "index.faiss")) if live_path is not None else None
+
+    # The index was built with the huggingface embeddings, they are the reference whatever the backends
+    reference = np.array(create_embeddings("huggingface", args.model).embed_documents(PROMPTS), dtype=np.float32)
+    if index is not None:
+        _, reference_hits = index.search(reference, args.k)
+
+    print(f"{len(PROMPTS)} queries x {args.repeat}, model {args.model}")
+    print(f"{'backend':<13}{'import s':>10}{'p50 ms':>10}{'p99 ms':>10}{'cos mean':>10}{'cos min':>10}{'top-k':>8}")
+    for backend in args.backends:
+        cold_start = import_time(backend, args.model)
+        latencies, vectors = query_latencies(create_embeddings(backend, args.model), PROMPTS, args.repeat)
+        similarity = cosine(reference, vectors)
+
+        overlap = float("nan")
+        if index is not None:
+            _, hits = index.search(vectors, args.k)
+            overlap = np.mean([len(set(r) & set(h)) / args.k for r, h in zip(reference_hits, hits)])
+        print(f"{backend:<13}{cold_start:>10.2f}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}"
+              f"{similarity.mean():>10.4f}{similarity.min():>10.4f}{overlap:>8.2f}")
+
+if __name__ == "__main__":
+    main()
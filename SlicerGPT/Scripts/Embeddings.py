@@ -0,0 +1,131 @@
+# pip install onnxruntime tokenizers huggingface_hub (only for the "onnx" backend)
+import platform
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ("huggingface", "onnx")
+
+def create_embeddings(backend: str, model_name: str, **kwargs):
+    """
+    Instantiate an embedding backend. Backends are imported lazily so that the ONNX
+    backend never pulls torch and transformers in.
+
+    Args:
+        backend (str): One of `EMBEDDING_BACKENDS`.
+        model_name (str): HuggingFace model name.
+        **kwargs: Backend specific options.
+
+    Returns:
+        Embeddings: A LangChain compatible embedder.
+    """
+    if backend == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name, **kwargs)
+    if backend == "onnx":
+        return OnnxEmbeddings(model_name=model_name, **kwargs)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+
+def default_onnx_file(quantized: bool) -> str:
+    """
+    Returns:
+        str: Path, inside the sentence-transformers model repository, of the ONNX export
+        matching this CPU (int8 quantized exports are per instruction set).
+    """
+    if not quantized:
+        return "onnx/model.onnx"
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence-transformers encoder running on ONNX Runtime, without torch.
+
+    Reproduces the sentence-transformers pipeline of MiniLM-style models (mean pooling
+    over the attention mask followed by L2 normalization), so its vectors can be searched
+    against indexes built with `HuggingFaceEmbeddings`.
+    """
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", quantized: bool = True,
+                 onnx_file: str = None, max_length: int = 256, batch_size: int = 32, num_threads: int = None):
+        """
+        Args:
+            model_name (str): HuggingFace repository providing `tokenizer.json` and the ONNX exports.
+            quantized (bool): Use the int8 quantized export instead of the float32 one.
+            onnx_file (str): Explicit ONNX file of the repository, overrides `quantized`.
+            max_length (int): Maximum number of tokens per text, the model's `max_seq_length`.
+            batch_size (int): Number of texts encoded per forward pass.
+            num_threads (int): ONNX Runtime intra-op threads, defaults to the runtime's choice.
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+        from huggingface_hub import hf_hub_download
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.onnx_file = onnx_file or default_onnx_file(quantized)
+
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(model_name, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            hf_hub_download(model_name, self.onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts):
+        """
+        Encode texts into normalized sentence embeddings.
+
+        Args:
+            texts (List[str]): Texts to encode.
+
+        Returns:
+            np.ndarray: Float32 matrix with one row per text.
+        """
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                inputs["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            token_embeddings = self.session.run(None, inputs)[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        return np.vstack(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+class DeferredEmbeddings(Embeddings):
+    """
+    Embedder still loading in the background, e.g. while the index loads: embedding
+    calls wait until it is available.
+    """
+
+    def __init__(self, future):
+        """
+        Args:
+            future (Future): Resolved with the real embedder.
+        """
+        self.future = future
+
+    def embed_documents(self, texts):
+        return self.future.result().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.future.result().embed_query(text)
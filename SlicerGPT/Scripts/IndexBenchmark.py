@@ -0,0 +1,93 @@
+"""
+Recall vs. latency benchmark of the vector index types supported by VectorStoreManager.
+
+Usage (from the Scripts directory):
+    python IndexBenchmark.py --k 3 --queries 500
+"""
+import os
+import time
+import argparse
+import faiss
+import numpy as np
+import AnnIndex
+from IndexStore import current_path
+from VectorStoreManager import VectorStoreManager
+
+PROMPTS = [
+    'What is 3D Slicer?',
+    'How to create a custom extension for 3D Slicer using Python?',
+    'How to extract a volume using the Segment Editor module?',
+    'What is the difference between vtkMRMLModelNode and vtkMRMLSegmentationNode?',
+    'How to export a segmentation as an STL file using Python?',
+    'How to load a large DICOM volume without slowing down Slicer?',
+    'How to use the CLI module to automate a task in C++?',
+    'What is the structure of a .mrml file in 3D Slicer?',
+    'How to enable GPU acceleration for volume rendering?',
+    'How to save a Python script as a module in Slicer?',
+    'Can 3D Slicer run in headless mode (without GUI)?',
+    'How to interface 3D Slicer with a DICOM PACS server?',
+    'How to apply a smoothing filter to a 3D model in Slicer?',
+    'How to automatically save modifications to a node?',
+    'What is the best method to merge multiple segmentations?',
+    'How to use the Elastix registration tool in Slicer?',
+]
+
+def make_queries(manager, vectors, count: int, seed: int = 0):
+    """
+    Real user prompts completed with perturbed corpus vectors up to `count` queries.
+    """
+    queries = manager.embed_queries(PROMPTS)
+    rng = np.random.default_rng(seed)
+    extra = max(0, count - len(queries))
+    if extra:
+        sampled = vectors[rng.choice(len(vectors), size=extra, replace=len(vectors) < extra)]
+        noise = rng.normal(scale=0.05 * float(np.std(vectors)), size=sampled.shape).astype(np.float32)
+        queries = np.vstack([queries, sampled + noise])
+    return np.ascontiguousarray(queries[:count], dtype=np.float32)
+
+def recall_at_k(found, truth) -> float:
+    hits = sum(len(set(f[f != -1]) & set(t[t != -1])) for f, t in zip(found, truth))
+    return hits / max(1, sum(int((t != -1).sum()) for t in truth))
+
+def benchmark(index, queries, truth, k: int) -> dict:
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, positions = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(positions[0])
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": recall_at_k(found, truth),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "memory_mb": AnnIndex.index_memory_bytes(index) / 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-root", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "SlicerFAISS"))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--types", nargs="+", default=list(AnnIndex.INDEX_TYPES), choices=AnnIndex.INDEX_TYPES)
+    args = parser.parse_args()
+
+    manager = VectorStoreManager(args.index_root)
+    flat = faiss.read_index(os.path.join(current_path(manager.merged_index_path), "index.faiss"))
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    queries = make_queries(manager, vectors, args.queries)
+    _, truth = flat.search(queries, args.k)
+
+    print(f"{flat.ntotal} vectors, d={flat.d}, {len(queries)} queries, k={args.k}")
+    print(f"{'type':<10}{'build s':>10}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'memory MB':>12}")
+    for index_type in args.types:
+        start = time.perf_counter()
+        index = flat if index_type == "flat" else AnnIndex.build_index(vectors, flat.metric_type, index_type)
+        build_time = time.perf_counter() - start
+        result = benchmark(index, queries, truth, args.k)
+        print(f"{index_type:<10}{build_time:>10.2f}{result['recall']:>10.3f}{result['p50_ms']:>10.3f}"
+              f"{result['p99_ms']:>10.3f}{result['memory_mb']:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import faiss
+import numpy as np
+import AnnIndex
+from MappedIndex import MappedVectorIndex
+from Docstore import SQLiteDocstore, InMemoryDocstoreView
+from DeltaSegment import DeltaSegment
+from LexicalIndex import BM25Index
+
+FINGERPRINT_FILE = "fingerprint.json"
+LEXICAL_DIR = "bm25"
+# Name of the live version directory of a store
+CURRENT_FILE = "CURRENT"
+
+def compute_fingerprint(index_dirs, embedding_model: str) -> str:
+    """
+    Hash the content of FAISS sub-index directories together with the embedding model name.
+
+    Args:
+        index_dirs (List[str]): Sub-index directories, in a stable order.
+        embedding_model (str): Name of the embedding model the vectors come from.
+
+    Returns:
+        str: Hex digest identifying this set of sub-indexes.
+    """
+    digest = hashlib.sha256()
+    digest.update(embedding_model.encode("utf-8"))
+    for sub_index_dir in index_dirs:
+        for file_name in sorted(os.listdir(sub_index_dir)):
+            file_path = os.path.join(sub_index_dir, file_name)
+            if not os.path.isfile(file_path):
+                continue
+            digest.update(os.path.basename(sub_index_dir).encode("utf-8"))
+            digest.update(file_name.encode("utf-8"))
+            with open(file_path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+def read_current_version(path: str):
+    """
+    Returns:
+        str | None: The live version of a store directory, None if it has none.
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE), "r", encoding="utf-8") as file:
+            version = file.read().strip()
+    except OSError:
+        return None
+    return version if version and os.path.isdir(os.path.join(path, version)) else None
+
+def current_path(path: str):
+    """
+    Resolve a store directory to the directory holding its live files.
+
+    Returns:
+        str | None: The live version directory, the store directory itself for a store written
+        before versioning, or None if there is no store.
+    """
+    version = read_current_version(path)
+    if version is not None:
+        return os.path.join(path, version)
+    if os.path.isfile(os.path.join(path, FINGERPRINT_FILE)):
+        return path
+    return None
+
+def read_fingerprint(path: str):
+    """
+    Read the fingerprint stored in a persisted store directory.
+
+    Returns:
+        str | None: The stored fingerprint, or None if there is no usable store.
+    """
+    live_path = current_path(path)
+    if live_path is None:
+        return None
+    try:
+        with open(os.path.join(live_path, FINGERPRINT_FILE), "r", encoding="utf-8") as file:
+            return json.load(file).get("fingerprint")
+    except (OSError, ValueError):
+        return None
+
+def prune_versions(path: str, keep):
+    """
+    Delete everything in a store directory but the pointer file and the `keep` versions:
+    replaced versions, versions of interrupted writes and files of the unversioned layout.
+    Files still open (by another process on Windows) are left for the next prune.
+    """
+    for entry in os.listdir(path):
+        if entry == CURRENT_FILE or entry in keep:
+            continue
+        entry_path = os.path.join(path, entry)
+        if os.path.isdir(entry_path):
+            shutil.rmtree(entry_path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+
+
+class IndexStore:
+    """
+    One searchable unit: a vector index and the docstore addressed by its positions.
+    The merged index is a single store, the sharded mode keeps one store per source.
+    """
+
+    def __init__(self, name: str, vector_index, docstore, path: str = None, version_path: str = None):
+        """
+        Args:
+            name (str): Store name (the source sub-directory in sharded mode).
+            vector_index: A FAISS index or a `MappedVectorIndex`.
+            docstore: A `SQLiteDocstore` or an `InMemoryDocstoreView`.
+            path (str): Persisted store directory, None for in-memory stores which cannot be updated.
+            version_path (str): Directory of the version the store was opened from, the live one by default.
+        """
+        self.name = name
+        self.vector_index = vector_index
+        self.docstore = docstore
+        self.path = path
+        self.version_path = version_path or (current_path(path) if path is not None else None)
+        self.lexical = None
+        self.lexical_lock = threading.Lock()
+        self.ann_thread = None
+        self.delta = None
+        if path is not None:
+            self.delta = DeltaSegment(self.version_path, vector_index.ntotal, vector_index.d, self.metric_type)
+        # Searches using the store, it is closed once replaced and released by all of them
+        self.users = 0
+        self.retired = False
+        self.users_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, name: str, path: str, mmap: bool = False, index_type: str = "flat", search_params: dict = None):
+        """
+        Open a store persisted with `IndexStore.persist`, without unpickling anything.
+
+        Args:
+            name (str): Store name.
+            path (str): Persisted store directory.
+            mmap (bool): Memory-map the flat vectors instead of reading them in the heap.
+            index_type (str): One of `AnnIndex.INDEX_TYPES`. A missing approximate index is built from the
+                flat vectors in the background, the store searches the flat index until it is ready.
+            search_params (dict): Search-time parameters overriding the index type defaults.
+        """
+        version_path = current_path(path)
+        if version_path is None:
+            raise FileNotFoundError(f"No persisted store in {path}")
+        index_path = os.path.join(version_path, AnnIndex.index_file(index_type))
+        ann_ready = mmap or os.path.isfile(index_path)
+        if mmap:
+            vector_index = MappedVectorIndex(version_path)
+        elif ann_ready:
+            vector_index = AnnIndex.read_index(index_path, index_type, search_params)
+        else:
+            # Training IVF-PQ takes tens of seconds, exact search answers meanwhile
+            vector_index = faiss.read_index(os.path.join(version_path, "index.faiss"))
+        store = cls(name, vector_index, SQLiteDocstore(version_path), path=path, version_path=version_path)
+        if not ann_ready:
+            store.build_ann_index(index_type, search_params)
+        return store
+
+    def build_ann_index(self, index_type: str, search_params: dict = None):
+        """
+        Build the approximate index of the store version in a background thread and swap it in
+        once ready. A failed build is reported and the store keeps searching the flat index.
+
+        Returns:
+            threading.Thread: The build thread.
+        """
+        def run():
+            index_path = os.path.join(self.version_path, AnnIndex.index_file(index_type))
+            try:
+                AnnIndex.build_from_flat(os.path.join(self.version_path, "index.faiss"), index_type, index_path)
+                index = AnnIndex.read_index(index_path, index_type, search_params)
+            except Exception as e:
+                print(f"Could not build the {index_type} index of {self.name} ({e}), its searches stay exact.")
+                return
+            with self.users_lock:
+                if not self.retired:
+                    self.vector_index = index
+
+        self.ann_thread = threading.Thread(target=run, name=f"ann-{self.name}", daemon=True)
+        self.ann_thread.start()
+        return self.ann_thread
+
+    @classmethod
+    def from_langchain(cls, name: str, store):
+        """
+        Wrap an in-memory LangChain FAISS store, used when the persisted format cannot be written.
+        """
+        return cls(name, store.index, InMemoryDocstoreView(store.docstore, store.index_to_docstore_id))
+
+    @staticmethod
+    def persist(store, path: str, fingerprint: str, embedding_model: str, keep_previous: bool = False):
+        """
+        Save a LangChain FAISS store in the persisted format.
+
+        Args:
+            store (FAISS): The LangChain vector store.
+            path (str): Output directory.
+            fingerprint (str): Fingerprint of the sub-indexes the store was built from.
+            embedding_model (str): Name of the embedding model.
+            keep_previous (bool): Keep the previous version for the open store still using it, see `write`.
+        """
+        IndexStore.write(path, store.index, (
+            (doc_id, store.docstore.search(doc_id))
+            for _, doc_id in sorted(store.index_to_docstore_id.items())
+        ), fingerprint, embedding_model, keep_previous=keep_previous)
+
+    @staticmethod
+    def write(path: str, flat_index, documents, fingerprint: str, embedding_model: str, keep_previous: bool = False):
+        """
+        Write a new version of a store directory.
+
+        The version is written to its own sub-directory, then made live by atomically replacing
+        the `CURRENT` pointer file. An interrupted save leaves the previous version live, and
+        nothing open by a running store is moved or deleted.
+
+        Args:
+            path (str): Store directory.
+            flat_index (faiss.Index): Flat index holding the vectors.
+            documents (Iterable[Tuple[str, Document]]): (docstore id, document) pairs in index position order.
+            fingerprint (str): Fingerprint of the sub-indexes the store was built from.
+            embedding_model (str): Name of the embedding model.
+            keep_previous (bool): Keep the previous version, still used by an open store which deletes
+                it when closed. It is deleted right away otherwise.
+        """
+        os.makedirs(path, exist_ok=True)
+        previous = read_current_version(path)
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        version_path = os.path.join(path, version)
+        os.makedirs(version_path)
+        faiss.write_index(flat_index, os.path.join(version_path, "index.faiss"))
+        MappedVectorIndex.export(flat_index, version_path)
+        SQLiteDocstore.build(version_path, documents)
+        with open(os.path.join(version_path, FINGERPRINT_FILE), "w", encoding="utf-8") as file:
+            json.dump({"fingerprint": fingerprint, "embedding_model": embedding_model}, file)
+
+        pointer_path = os.path.join(path, CURRENT_FILE)
+        with open(pointer_path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(version)
+        os.replace(pointer_path + ".tmp", pointer_path)
+        prune_versions(path, keep=(version, previous) if keep_previous else (version,))
+
+    @property
+    def lower_is_better(self) -> bool:
+        """
+        Returns:
+            bool: True if scores are distances (L2), False if they are similarities (inner product).
+        """
+        if isinstance(self.vector_index, MappedVectorIndex):
+            return self.vector_index.metric == "l2"
+        return self.vector_index.metric_type == faiss.METRIC_L2
+
+    @property
+    def metric_type(self) -> int:
+        return faiss.METRIC_L2 if self.lower_is_better else faiss.METRIC_INNER_PRODUCT
+
+    def search(self, vectors, k: int):
+        """
+        Search the main and delta segments, skipping deleted documents.
+
+        Args:
+            vectors (np.ndarray): Query embeddings of shape (nq, d).
+            k (int): Number of hits per query.
+
+        Returns:
+            List[Tuple[Tuple[str, int, float], ...]]: (store name, position, score) hits of each query.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        tombstones = self.delta.tombstones if self.delta is not None else ()
+        # The approximate index may be swapped in during the search
+        vector_index = self.vector_index
+        # Over-fetch so that k live hits remain once the tombstoned ones are skipped
+        scores, positions = vector_index.search(vectors, min(k + len(tombstones), max(vector_index.ntotal, k)))
+        if self.delta is not None and len(self.delta):
+            delta_scores, delta_positions = self.delta.search(vectors, k)
+            scores = np.hstack([scores, delta_scores])
+            positions = np.hstack([positions, delta_positions])
+
+        results = []
+        for query_scores, query_positions in zip(scores, positions):
+            hits = [
+                (self.name, int(position), float(score))
+                for score, position in zip(query_scores, query_positions)
+                if position != -1 and int(position) not in tombstones
+            ]
+            hits.sort(key=lambda hit: hit[2], reverse=not self.lower_is_better)
+            results.append(tuple(hits[:k]))
+        return results
+
+    def lexical_index(self):
+        """
+        Returns:
+            BM25Index: The BM25 index of the main segment, loaded from disk or built on first use.
+        """
+        with self.lexical_lock:
+            if self.lexical is None:
+                lexical_path = os.path.join(self.version_path, LEXICAL_DIR) if self.path is not None else None
+                if lexical_path is not None and BM25Index.exists(lexical_path):
+                    self.lexical = BM25Index.load(lexical_path)
+                else:
+                    self.lexical = BM25Index.build(
+                        (position, doc.page_content) for position, _, doc in self.docstore.iter_documents()
+                    )
+                    if lexical_path is not None:
+                        try:
+                            self.lexical.save(lexical_path)
+                        except OSError as e:
+                            print(f"Could not persist the BM25 index of {self.name} ({e}).")
+            return self.lexical
+
+    def lexical_search(self, query: str, k: int):
+        """
+        BM25 search over the main segment, skipping deleted documents.
+        Documents of the delta segment are only indexed once compacted.
+
+        Args:
+            query (str): The text query.
+            k (int): Number of hits.
+
+        Returns:
+            Tuple[Tuple[str, int, float], ...]: (store name, position, BM25 score) hits, best first.
+        """
+        tombstones = self.delta.tombstones if self.delta is not None else ()
+        return tuple((self.name, position, score) for position, score in self.lexical_index().search(query, k, tombstones))
+
+    def get(self, positions):
+        """
+        Materialize documents by position, from the main or the delta segment.
+
+        Returns:
+            List[Document]: Documents in the same order as `positions`, skipping unknown positions.
+        """
+        positions = [int(p) for p in positions]
+        found = self.get_by_position(positions)
+        return [found[p] for p in positions if p in found]
+
+    def get_by_position(self, positions):
+        """
+        Returns:
+            Dict[int, Document]: The documents found, by position. Deleted delta documents are missing.
+        """
+        positions = [int(p) for p in positions]
+        base = self.vector_index.ntotal
+        found = self.docstore.get([p for p in positions if p < base])
+        if self.delta is not None:
+            found.update(self.delta.get([p for p in positions if p >= base]))
+        return found
+
+    def require_delta(self):
+        if self.delta is None:
+            raise RuntimeError(f"Store {self.name} is not persisted and cannot be updated.")
+        return self.delta
+
+    def add(self, documents, vectors):
+        """
+        Append documents to the delta segment.
+
+        Args:
+            documents (List[Tuple[str, Document]]): (docstore id, document) pairs.
+            vectors (np.ndarray): Their embeddings.
+        """
+        self.require_delta().add(documents, vectors)
+
+    def delete(self, doc_ids) -> int:
+        """
+        Delete documents by docstore id, from the delta segment or with a tombstone.
+
+        Returns:
+            int: Number of documents deleted.
+        """
+        doc_ids = list(doc_ids)
+        return self.require_delta().delete(doc_ids, self.docstore.positions_of(doc_ids))
+
+    def pending_updates(self) -> int:
+        """
+        Returns:
+            int: Number of delta documents and tombstones waiting for compaction.
+        """
+        if self.delta is None:
+            return 0
+        return len(self.delta) + len(self.delta.tombstones)
+
+    def compact(self):
+        """
+        Fold the delta segment and tombstones into a new version of the store directory.
+        This store keeps serving its own version, it must be reopened to see the new one
+        and its version is deleted when it is closed.
+        """
+        delta = self.require_delta()
+        with delta.lock:
+            flat = faiss.read_index(os.path.join(self.version_path, "index.faiss"))
+            with open(os.path.join(self.version_path, FINGERPRINT_FILE), "r", encoding="utf-8") as file:
+                info = json.load(file)
+
+            keep = np.array([p for p in range(flat.ntotal) if p not in delta.tombstones], dtype=np.int64)
+            vectors = flat.reconstruct_n(0, flat.ntotal)[keep] if flat.ntotal else np.zeros((0, flat.d), np.float32)
+            documents = [(doc_id, doc) for position, doc_id, doc in self.docstore.iter_documents()
+                         if position not in delta.tombstones]
+            delta_rows = delta.rows()
+            if delta_rows:
+                vectors = np.vstack([vectors, np.stack([vector for _, _, vector in delta_rows])])
+                documents += [(doc_id, doc) for doc_id, doc, _ in delta_rows]
+
+            compacted = faiss.IndexFlat(flat.d, flat.metric_type)
+            compacted.add(np.ascontiguousarray(vectors, dtype=np.float32))
+            IndexStore.write(self.path, compacted, documents, info["fingerprint"], info["embedding_model"],
+                             keep_previous=True)
+
+    def memory_report(self) -> dict:
+        """
+        Returns:
+            dict: `mapped_bytes` and `resident_bytes` of the vector index.
+        """
+        if isinstance(self.vector_index, MappedVectorIndex):
+            return self.vector_index.memory_report()
+        return {"mapped_bytes": 0, "resident_bytes": AnnIndex.index_memory_bytes(self.vector_index)}
+
+    def acquire(self):
+        with self.users_lock:
+            if self.retired:
+                raise RuntimeError(f"Store {self.name} was replaced.")
+            self.users += 1
+        return self
+
+    def release(self):
+        with self.users_lock:
+            self.users -= 1
+            close = self.retired and self.users == 0
+        if close:
+            self.close()
+
+    def retire(self):
+        """
+        Close the store now or, if searches still use it, when the last one releases it.
+        """
+        with self.users_lock:
+            self.retired = True
+            close = self.users == 0
+        if close:
+            self.close()
+
+    def close(self):
+        self.docstore.close()
+        if self.delta is not None:
+            self.delta.close()
+        if isinstance(self.vector_index, MappedVectorIndex):
+            self.vector_index.close()
+        with self.lexical_lock:
+            self.lexical = None
+        if self.path is not None and self.version_path != self.path and current_path(self.path) != self.version_path:
+            # Replaced by a compaction, nothing reads this version anymore
+            shutil.rmtree(self.version_path, ignore_errors=True)
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import math
+import shutil
+import numpy as np
+from collections import Counter
+
+TERMS_FILE = "terms.json"
+ARRAY_FILES = ("offsets", "docs", "tfs", "lengths")
+
+# Identifiers such as `slicer.util.loadVolume` or `vtkMRMLSegmentationNode` are kept whole
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:\.[A-Za-z0-9_]+)*")
+
+def tokenize(text: str):
+    """
+    Split text into lowercase terms. Dotted identifiers produce the full identifier and its parts.
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        List[str]: The terms, with repetitions.
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text):
+        token = match.lower()
+        tokens.append(token)
+        if "." in token:
+            tokens.extend(part for part in token.split(".") if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25 inverted index stored as flat numpy arrays (CSR layout): the postings of term `t`
+    are `docs[offsets[t]:offsets[t + 1]]` with their term frequencies in `tfs`.
+    The arrays are memory-mapped when loaded, so opening the index is almost free.
+    """
+
+    def __init__(self, terms, offsets, docs, tfs, lengths, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            terms (Dict[str, int]): Term to term id.
+            offsets (np.ndarray): Start of each term's postings, of length n_terms + 1.
+            docs (np.ndarray): Document positions of all postings.
+            tfs (np.ndarray): Term frequency of each posting.
+            lengths (np.ndarray): Length in terms of every document.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        self.terms = terms
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(lengths)
+        self.avg_length = float(np.mean(lengths)) if self.n_docs else 0.0
+
+    @classmethod
+    def build(cls, documents):
+        """
+        Build the index from documents in position order.
+
+        Args:
+            documents (Iterable[Tuple[int, str]]): (position, text) pairs, positions must be 0..n-1.
+
+        Returns:
+            BM25Index: The in-memory index.
+        """
+        postings = {}
+        lengths = []
+        for position, text in documents:
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((position, count))
+
+        terms = {term: term_id for term_id, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        docs = []
+        tfs = []
+        for term in sorted(postings):
+            term_postings = postings[term]
+            offsets[terms[term] + 1] = offsets[terms[term]] + len(term_postings)
+            docs.extend(position for position, _ in term_postings)
+            tfs.extend(min(count, 65535) for _, count in term_postings)
+        return cls(terms, offsets, np.array(docs, dtype=np.int32), np.array(tfs, dtype=np.uint16),
+                   np.array(lengths, dtype=np.int32))
+
+    def save(self, path: str):
+        """
+        Write the index to a directory, atomically.
+
+        Args:
+            path (str): Output directory.
+        """
+        tmp_path = path.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, TERMS_FILE), "w", encoding="utf-8") as file:
+            json.dump(self.terms, file)
+        for name in ARRAY_FILES:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Open an index written with `save`, memory-mapping the posting arrays.
+
+        Args:
+            path (str): Index directory.
+        """
+        with open(os.path.join(path, TERMS_FILE), "r", encoding="utf-8") as file:
+            terms = json.load(file)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAY_FILES}
+        return cls(terms, **arrays)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, TERMS_FILE))
+
+    def search(self, query: str, k: int, exclude=()):
+        """
+        Rank documents by BM25 score.
+
+        Args:
+            query (str): The text query.
+            k (int): Number of hits to return.
+            exclude (Set[int]): Positions to skip (deleted documents).
+
+        Returns:
+            List[Tuple[int, float]]: (position, score) hits, best first. Documents sharing no term are omitted.
+        """
+        if not self.n_docs:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term, query_count in Counter(tokenize(query)).items():
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / self.avg_length)
+            scores[docs] += query_count * idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        for position in exclude:
+            if position < self.n_docs:
+                scores[position] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(position), float(scores[position])) for position in candidates]
@@ -0,0 +1,197 @@
+"""
+Calibrate the llama.cpp runtime parameters of the base model on this machine.
+
+Measures prompt evaluation and generation speed for every combination of thread count,
+batch size and context size, and stores the fastest configuration where `Model` loads it.
+
+Usage (from the Scripts directory):
+    python LlamaCalibration.py --threads 1 2 4 8 --batch 128 256 512 --ctx 4096 8192
+"""
+import os
+import json
+import time
+import argparse
+import multiprocessing
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "LlamaConfig.json")
+DEFAULT_PARAMS = {
+    "n_ctx": 8196,
+    # Same default as llama.cpp, one thread per physical core on SMT machines
+    "n_threads": max(multiprocessing.cpu_count() // 2, 1),
+    "n_batch": 512,
+}
+# Environment variables overriding the calibrated values
+ENV_OVERRIDES = {
+    "n_ctx": "SLICERGPT_N_CTX",
+    "n_threads": "SLICERGPT_N_THREADS",
+    "n_threads_batch": "SLICERGPT_N_THREADS_BATCH",
+    "n_batch": "SLICERGPT_N_BATCH",
+}
+
+def load_params(model_file: str, path: str = DEFAULT_CONFIG_PATH, overrides: dict = None) -> dict:
+    """
+    Resolve the llama.cpp parameters: explicit overrides, then environment variables,
+    then the calibrated configuration of this machine, then the defaults.
+    An explicit `n_threads` also sets `n_threads_batch`, unless it is given as well.
+
+    Args:
+        model_file (str): GGUF file name of the model, a calibration of another model is ignored.
+        path (str): Calibration file written by `calibrate`.
+        overrides (dict): Explicit values, None values are ignored.
+
+    Returns:
+        dict: Keyword arguments for `Llama` (n_ctx, n_threads, n_threads_batch, n_batch).
+    """
+    params = dict(DEFAULT_PARAMS)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            calibration = json.load(file)
+        if calibration.get("model") == model_file and calibration.get("cpu_count") == multiprocessing.cpu_count():
+            params.update(calibration["params"])
+        else:
+            print(f"Ignoring the llama.cpp calibration of {path}, it was made for another model or machine.")
+    except (OSError, ValueError, KeyError):
+        pass
+
+    explicit = {name: int(os.environ[variable]) for name, variable in ENV_OVERRIDES.items() if os.environ.get(variable)}
+    explicit.update({name: value for name, value in (overrides or {}).items() if value is not None})
+    if "n_threads" in explicit:
+        # The calibrated batch threads were measured with the calibrated thread count
+        explicit.setdefault("n_threads_batch", explicit["n_threads"])
+    params.update(explicit)
+    params.setdefault("n_threads_batch", params["n_threads"])
+    return params
+
+def measure(load_model, params: dict, prompt_tokens: int, generated_tokens: int) -> dict:
+    """
+    Measure one configuration.
+
+    Args:
+        load_model (Callable[..., Llama]): Loads the model with the given keyword arguments.
+        params (dict): The configuration.
+        prompt_tokens (int): Length of the evaluated prompt.
+        generated_tokens (int): Number of generated tokens.
+
+    Returns:
+        dict: The configuration with its prompt evaluation and generation speeds, in tokens per second.
+    """
+    llm = load_model(**params, verbose=False)
+    try:
+        # A realistic prompt: the beginning of the system prompt repeated to the wanted length
+        text = "You are an expert 3D Slicer technical assistant. Use exact module names and numbered steps. "
+        tokens = llm.tokenize(text.encode("utf-8"), add_bos=False)
+        tokens = (tokens * (prompt_tokens // len(tokens) + 1))[:prompt_tokens]
+
+        llm.reset()
+        start = time.perf_counter()
+        llm.eval(tokens)
+        prompt_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        generated = 0
+        # The prompt is already in the KV cache, generate only re-evaluates its last token
+        for token in llm.generate(tokens, temp=0.0):
+            generated += 1
+            if generated >= generated_tokens:
+                break
+        generation_time = time.perf_counter() - start
+    finally:
+        llm.close()
+
+    return {
+        **params,
+        "prompt_tps": prompt_tokens / prompt_time,
+        "generation_tps": generated / generation_time,
+        # Time of a typical request: evaluate the prompt, then generate the answer
+        "latency_s": prompt_time + generation_time,
+    }
+
+def select_best(measurements, tolerance: float = 0.05) -> dict:
+    """
+    Pick the lowest latency configuration, preferring a larger context when it costs
+    less than `tolerance` of extra latency.
+
+    Returns:
+        dict: Parameters of the chosen configuration.
+    """
+    fastest = min(measurements, key=lambda m: m["latency_s"])
+    candidates = [
+        m for m in measurements
+        if m["n_threads"] == fastest["n_threads"] and m["n_batch"] == fastest["n_batch"]
+        and m["latency_s"] <= fastest["latency_s"] * (1 + tolerance)
+    ]
+    best = max(candidates, key=lambda m: m["n_ctx"])
+    return {name: best[name] for name in ("n_ctx", "n_threads", "n_threads_batch", "n_batch")}
+
+def calibrate(load_model, model_file: str, threads, batches, contexts, prompt_tokens: int = 512,
+              generated_tokens: int = 64, path: str = DEFAULT_CONFIG_PATH) -> dict:
+    """
+    Measure every configuration and store the best one.
+
+    Args:
+        load_model (Callable[..., Llama]): Loads the model with the given keyword arguments.
+        model_file (str): GGUF file name of the model.
+        threads (List[int]): Thread counts to try.
+        batches (List[int]): `n_batch` values to try.
+        contexts (List[int]): Context sizes to try.
+        prompt_tokens (int): Length of the evaluated prompt.
+        generated_tokens (int): Number of generated tokens.
+        path (str): Output file.
+
+    Returns:
+        dict: The stored calibration.
+    """
+    measurements = []
+    for n_ctx in contexts:
+        for n_batch in batches:
+            for n_threads in threads:
+                params = {"n_ctx": n_ctx, "n_threads": n_threads, "n_threads_batch": n_threads, "n_batch": n_batch}
+                result = measure(load_model, params, min(prompt_tokens, n_ctx - generated_tokens), generated_tokens)
+                measurements.append(result)
+                print(f"{n_ctx:>7}{n_batch:>8}{n_threads:>9}{result['prompt_tps']:>12.1f}"
+                      f"{result['generation_tps']:>12.1f}{result['latency_s']:>11.2f}")
+
+    calibration = {
+        "model": model_file,
+        "cpu_count": multiprocessing.cpu_count(),
+        "params": select_best(measurements),
+        "measurements": measurements,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(calibration, file, indent=2)
+    os.replace(path + ".tmp", path)
+    return calibration
+
+def default_thread_counts():
+    counts = [1]
+    while counts[-1] * 2 <= multiprocessing.cpu_count():
+        counts.append(counts[-1] * 2)
+    if counts[-1] != multiprocessing.cpu_count():
+        counts.append(multiprocessing.cpu_count())
+    return counts
+
+def main():
+    from llama_cpp import Llama
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default="unsloth/Qwen3-0.6B-GGUF")
+    parser.add_argument("--file", default="Qwen3-0.6B-Q8_0.gguf")
+    parser.add_argument("--threads", type=int, nargs="+", default=default_thread_counts())
+    parser.add_argument("--batch", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--ctx", type=int, nargs="+", default=[4096, 8196])
+    parser.add_argument("--prompt-tokens", type=int, default=512)
+    parser.add_argument("--generated-tokens", type=int, default=64)
+    parser.add_argument("--output", default=DEFAULT_CONFIG_PATH)
+    args = parser.parse_args()
+
+    def load_model(**params):
+        return Llama.from_pretrained(repo_id=args.repo, filename=args.file, n_gpu_layers=-1, **params)
+
+    print(f"{'n_ctx':>7}{'n_batch':>8}{'threads':>9}{'prompt t/s':>12}{'gen t/s':>12}{'latency s':>11}")
+    calibration = calibrate(load_model, args.file, args.threads, args.batch, args.ctx,
+                            args.prompt_tokens, args.generated_tokens, args.output)
+    print(f"Best configuration: {calibration['params']}, saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,27 @@
 import os
+import re
 import signal
 import time
 import logging
 import sys
+import json
+import math
+import asyncio
 import threading
-from fastapi import FastAPI, Request
+import uuid
+from contextlib import contextmanager
+from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import uvicorn
 from pydantic import BaseModel
 from typing import Any, Optional
 from Model import Model
 from VectorStoreManager import VectorStoreManager
+from Embeddings import DeferredEmbeddings, create_embeddings
+from Startup import StartupStages
+import Metrics
+import Tracing
+from Scheduler import RequestScheduler, RequestControl, RequestCancelled, QueueFullError
 
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -19,8 +31,23 @@ class Message(BaseModel):
     role: str
     content: str
     mrml_scene: Optional[str] = None
+    # Compact scene digest changes (see SceneDigest), sent instead of the XML scene
+    scene_delta: Optional[dict] = None
     think: bool
     use_api: bool
+    # Requests of different sessions have their own history and are scheduled fairly
+    session_id: Optional[str] = None
+    # ID to cancel the request with, generated by the server if missing
+    request_id: Optional[str] = None
+    # Seconds after which the request is aborted, queue time included
+    timeout: Optional[float] = None
+    # Debugging: record a trace of the request stages (see /traces), and profile it
+    trace: bool = False
+    profile: bool = False
+
+class CancelRequest(BaseModel):
+    request_id: Optional[str] = None
+    session_id: Optional[str] = None
 
 class ThinkBool(BaseModel):
     think: bool
@@ -35,33 +62,300 @@ server_should_exit = False
 server_pid = os.getpid()
 
 
-logger.info("Initializing vector store and model...")
+logger.info("Initializing vector store and model in the background...")
 start_time = time.time()
 base_dir = os.path.dirname(os.path.abspath(__file__))
 faiss_path = os.path.join(base_dir, "..", "Data", "SlicerFAISS")
 
-manager = VectorStoreManager(faiss_path)
-chatbot = Model(manager=manager)
-logger.info(f"Initialization complete in {time.time() - start_time:.2f} seconds")
+# Memory-map the index so several Slicer sessions on one machine share its pages
+index_mmap = os.environ.get("SLICERGPT_INDEX_MMAP", "0") == "1"
+index_type = os.environ.get("SLICERGPT_INDEX_TYPE", "flat")
+index_sharded = os.environ.get("SLICERGPT_INDEX_SHARDED", "0") == "1"
+# "hybrid" fuses the embedding search with BM25, for questions naming Slicer identifiers
+retrieval_mode = os.environ.get("SLICERGPT_RETRIEVAL_MODE", "dense")
+# "onnx" embeds queries with the quantized ONNX export of the model and avoids importing torch
+embedding_backend = os.environ.get("SLICERGPT_EMBEDDING_BACKEND", "huggingface")
+embedding_model = "sentence-transformers/all-MiniLM-L6-v2"
+
+chatbot = Model(
+    manager=None,
+    retrieval_mode=retrieval_mode,
+    prompt_cache_dir=os.path.join(base_dir, "..", "Data", "PromptCache"),
+    response_cache_path=os.path.join(base_dir, "..", "Data", "ResponseCache", "responses.sqlite"),
+    # Opt-in speculative decoding: "lookup" or "draft" (with SLICERGPT_DRAFT_REPO and SLICERGPT_DRAFT_FILE)
+    speculative=os.environ.get("SLICERGPT_SPECULATIVE") or None,
+    num_pred_tokens=int(os.environ.get("SLICERGPT_NUM_PRED_TOKENS", "10")),
+    draft_model_name=os.environ.get("SLICERGPT_DRAFT_REPO"),
+    draft_file_name=os.environ.get("SLICERGPT_DRAFT_FILE"),
+    # Speculative decoding keeps the logits of the whole context, it is disabled beyond this budget
+    max_logits_memory=int(os.environ.get("SLICERGPT_LOGITS_MEMORY_MB", "1024")) * 2 ** 20,
+    load_llm=False,
+)
+# Requests beyond this many waiting ones are rejected with 429
+scheduler = RequestScheduler(max_queue=int(os.environ.get("SLICERGPT_MAX_QUEUE", "16")))
+# Deadline of the requests that do not set their own, so a stuck generation cannot pin the worker
+default_timeout = float(os.environ.get("SLICERGPT_REQUEST_TIMEOUT", "300"))
+
+# Offline runs can keep the metrics in a file, rewritten every SLICERGPT_METRICS_INTERVAL seconds
+metrics_exporter = None
+if os.environ.get("SLICERGPT_METRICS_FILE"):
+    metrics_exporter = Metrics.FileExporter(os.environ["SLICERGPT_METRICS_FILE"],
+                                            float(os.environ.get("SLICERGPT_METRICS_INTERVAL", "15"))).start()
+
+# Trace every request with SLICERGPT_TRACE=1, profile them too with SLICERGPT_PROFILE=1.
+# The last SLICERGPT_MAX_TRACES traces are kept, /traces lists the ones above SLICERGPT_SLOW_TRACE_MS
+trace_all = os.environ.get("SLICERGPT_TRACE", "0") == "1"
+profile_all = os.environ.get("SLICERGPT_PROFILE", "0") == "1"
+slow_trace_ms = float(os.environ.get("SLICERGPT_SLOW_TRACE_MS", "0"))
+trace_store = Tracing.TraceStore(int(os.environ.get("SLICERGPT_MAX_TRACES", "100")))
+traces_dir = os.path.join(base_dir, "..", "Data", "Traces")
+
+# The port is bound right away, the embedder, the index and the base model load concurrently.
+# Retrieval and the API model answer as soon as their stages are ready, see /ready.
+startup = StartupStages(("embeddings", "index", "model"))
+
+def load_index():
+    manager = VectorStoreManager(faiss_path, embedding_model=embedding_model, mmap=index_mmap,
+                                 index_type=index_type, sharded=index_sharded, retrieval_mode=retrieval_mode,
+                                 embeddings=DeferredEmbeddings(embeddings_future))
+    logger.info(f"Vector index memory: {manager.memory_report()}")
+    chatbot.manager = manager
+    return manager
+
+def log_stage(future):
+    if future.exception() is not None:
+        logger.error(f"Initialization failed: {future.exception()}")
+    elif startup.is_ready(*startup.stages):
+        logger.info(f"Initialization complete in {time.time() - start_time:.2f} seconds")
+
+embeddings_future = startup.run("embeddings", create_embeddings, embedding_backend, embedding_model)
+for future in (embeddings_future, startup.run("index", load_index), startup.run("model", chatbot.load_llm)):
+    future.add_done_callback(log_stage)
 
 @inferenceServer.post("/setThink")
 async def setThink(think: ThinkBool):
     chatbot.enable_thinking = think.think
 
 
+def require_ready(message: Message):
+    """
+    Raises:
+        HTTPException: 503 with a Retry-After header while a stage the message needs is loading.
+    """
+    stages = ["embeddings", "index"]
+    if not (message.use_api and chatbot.client is not None):
+        stages.append("model")
+    if not startup.is_ready(*stages):
+        status = startup.report()
+        waiting = ", ".join(f"{name} {status[name]['status']}" for name in stages if status[name]["status"] != "ready")
+        Metrics.REQUEST_ERRORS.inc(reason="not_ready")
+        raise HTTPException(status_code=503, detail=f"The server is still starting ({waiting})",
+                            headers={"Retry-After": "5"})
+
+def request_control(message: Message) -> RequestControl:
+    return RequestControl(message.request_id or uuid.uuid4().hex, message.timeout or default_timeout)
+
+def schedule(message: Message, fn, control: RequestControl):
+    """
+    Queue an inference request of the message session.
+
+    Returns:
+        Future: Resolved with the result of `fn`, run on the inference worker thread.
+
+    Raises:
+        HTTPException: 429 with a Retry-After header when the queue is full.
+    """
+    try:
+        return scheduler.submit(message.session_id or "default", fn, control)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting request of session {message.session_id}: {e}")
+        Metrics.REQUEST_ERRORS.inc(reason="queue_full")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+def compress_history(message: Message, control: RequestControl):
+    """
+    Queue the history compression of the message session once its answer was delivered.
+    It may summarize with the base model, so it runs on the worker, before the next request of the session.
+    """
+    session = chatbot.sessions.get(message.session_id)
+    try:
+        scheduler.submit(message.session_id or "default", lambda: chatbot.compress_history(session, control), control)
+    except QueueFullError:
+        # The history stays over budget until the next answer, the oldest turns are left out meanwhile
+        logger.warning(f"Queue full, not compressing the history of session {message.session_id}")
+
+@contextmanager
+def traced(message: Message, control: RequestControl, endpoint: str, queue_wait: float):
+    """
+    Record the trace of the enclosed request handling, when the message or the server asks for it.
+    Must be entered on the thread running the request, the spans are opened there.
+
+    Yields:
+        Trace | None: The active trace, None for an untraced request.
+    """
+    profile = message.profile or profile_all
+    if not (message.trace or trace_all or profile):
+        yield None
+        return
+    trace = Tracing.Trace(control.request_id, endpoint=endpoint, session=message.session_id or "default",
+                          model="api" if message.use_api else "local", queue_wait_ms=queue_wait * 1000)
+    profiler = Tracing.SamplingProfiler().start() if profile else None
+    status = "ok"
+    try:
+        with Tracing.activate(trace):
+            yield trace
+    except RequestCancelled:
+        status = control.reason
+        raise
+    except Exception as e:
+        status = "error"
+        trace.root.set(error=str(e))
+        raise
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            # Folded stacks, e.g. `flamegraph.pl <request_id>.folded > flamegraph.svg` or speedscope
+            trace.profile = os.path.join(traces_dir, re.sub(r"[^\w.-]", "_", control.request_id) + ".folded")
+            profiler.write(trace.profile)
+            trace.root.set(profile_samples=profiler.samples)
+        trace.finish(status=status)
+        trace_store.add(trace)
+        logger.info(f"Trace of request {control.request_id}: {trace.duration_ms:.1f} ms, "
+                    f"{trace.summary()['stages_ms']}")
+
 @inferenceServer.post("/generate")
-async def generate(message: Message):
+async def generate(message: Message, http_response: Response):
     logger.info("Starting generate function execution")
+    require_ready(message)
     start_time = time.time()
+    control = request_control(message)
+    # The trace of a debugged request is read back with /traces/{request_id}
+    http_response.headers["X-Request-ID"] = control.request_id
+
+    def run():
+        queue_wait = time.time() - start_time
+        logger.info(f"Request {control.request_id} waited {queue_wait:.4f} seconds in queue")
+        Metrics.QUEUE_WAIT_SECONDS.observe(queue_wait)
+        with traced(message, control, "generate", queue_wait):
+            session = chatbot.sessions.get(message.session_id)
+            content = chatbot.generate_response(message.content, message.mrml_scene, message.think, message.use_api,
+                                                message.scene_delta, session, control)
+            # The server missed a scene delta, the next request must carry the whole digest
+            return {"content": content, "scene_resync": not session.scene_in_sync}
     
+    # The event loop only awaits the worker, /health, /cancel and /shutdown stay responsive
+    future = schedule(message, run, control)
     try:
-        response = chatbot.generate_response(message.content, message.mrml_scene, message.think, message.use_api)
+        response = await asyncio.wrap_future(future)
         logger.info(f"generate function completed in {time.time() - start_time:.4f} seconds")
+        Metrics.REQUEST_SECONDS.observe(time.time() - start_time)
+        compress_history(message, control)
         return response
+    except RequestCancelled as e:
+        logger.info(str(e))
+        Metrics.REQUEST_ERRORS.inc(reason=control.reason)
+        raise HTTPException(status_code=504 if control.reason == "deadline exceeded" else 409, detail=str(e))
+    except asyncio.CancelledError:
+        # The client disconnected, stop the generation nobody will read
+        control.cancel("client disconnected")
+        raise
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}")
+        Metrics.REQUEST_ERRORS.inc(reason="error")
         raise
 
+def server_sent_event(data: dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+@inferenceServer.post("/generateStream")
+async def generate_stream(message: Message):
+    """
+    Stream the answer as Server-Sent Events: `{"request_id": ...}` first, one `{"token": ...}` event
+    per decoded chunk, then `{"done": true, "content": ..., "scene_resync": ...}` with the whole answer,
+    or `{"error": ..., "cancelled": ...}`.
+    """
+    logger.info("Starting generate_stream function execution")
+    require_ready(message)
+    start_time = time.time()
+    control = request_control(message)
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def emit(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def run():
+        queue_wait = time.time() - start_time
+        logger.info(f"Request {control.request_id} waited {queue_wait:.4f} seconds in queue")
+        Metrics.QUEUE_WAIT_SECONDS.observe(queue_wait)
+        session = chatbot.sessions.get(message.session_id)
+        chunks = []
+        try:
+            with traced(message, control, "generateStream", queue_wait) as trace:
+                for chunk in chatbot.stream_response(message.content, message.mrml_scene, message.think, message.use_api,
+                                                     message.scene_delta, session, control):
+                    if not chunks:
+                        logger.info(f"First token in {time.time() - start_time:.4f} seconds")
+                        Metrics.TIME_TO_FIRST_TOKEN.observe(time.time() - start_time)
+                        if trace is not None:
+                            trace.root.set(first_token_ms=(time.time() - start_time) * 1000)
+                    chunks.append(chunk)
+                    emit({"token": chunk})
+            logger.info(f"generate_stream function completed in {time.time() - start_time:.4f} seconds")
+            Metrics.REQUEST_SECONDS.observe(time.time() - start_time)
+            done = {
+                "done": True, "content": "".join(chunks),
+                # The server missed a scene delta, the next request must carry the whole digest
+                "scene_resync": not session.scene_in_sync
+            }
+            if trace is not None:
+                done["trace"] = trace.summary()
+            emit(done)
+            compress_history(message, control)
+        except RequestCancelled as e:
+            logger.info(str(e))
+            Metrics.REQUEST_ERRORS.inc(reason=control.reason)
+            emit({"error": str(e), "cancelled": True})
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            Metrics.REQUEST_ERRORS.inc(reason="error")
+            emit({"error": str(e)})
+        finally:
+            emit(None)
+
+    # Rejected requests get their 429 before the stream starts
+    schedule(message, run, control)
+
+    async def stream():
+        finished = False
+        try:
+            yield server_sent_event({"request_id": control.request_id})
+            while True:
+                event = await events.get()
+                if event is None:
+                    finished = True
+                    return
+                yield server_sent_event(event)
+        finally:
+            if not finished:
+                # The client disconnected, stop the generation at the next token
+                control.cancel("client disconnected")
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Request-ID": control.request_id})
+
+@inferenceServer.post("/cancel")
+async def cancel(request: CancelRequest):
+    """
+    Cancel a request by ID, or all the requests of a session. A running generation stops at
+    its next token, a waiting request is dropped when it reaches the worker.
+    """
+    if request.request_id is None and request.session_id is None:
+        raise HTTPException(status_code=422, detail="request_id or session_id is required")
+    cancelled = scheduler.cancel(request.request_id, request.session_id)
+    logger.info(f"Cancelled {cancelled} requests (request {request.request_id}, session {request.session_id})")
+    return {"cancelled": cancelled}
+
 @inferenceServer.post("/addKey")
 async def addKey(apiKey: ApiKey):
     logger.info("Adding API key")
@@ -73,6 +367,66 @@ async def addKey(apiKey: ApiKey):
 
 
 
+@inferenceServer.get("/cacheStats")
+async def cache_stats():
+    """Hit rates of the retrieval and response caches"""
+    retrieval = chatbot.manager.cache_stats() if chatbot.manager is not None else {}
+    return {"retrieval": retrieval, "responses": chatbot.response_cache.stats()}
+
+
+@inferenceServer.get("/queue")
+async def queue_stats():
+    """Depth and recent wait times of the inference queue"""
+    return {**scheduler.stats(), "sessions": len(chatbot.sessions)}
+
+
+@inferenceServer.delete("/session/{session_id}")
+async def delete_session(session_id: str):
+    """Forget the history and scene of a session"""
+    return {"deleted": chatbot.sessions.remove(session_id)}
+
+
+@inferenceServer.get("/ready")
+async def ready():
+    """
+    Initialization progress: status and timings of every stage, and which models can answer.
+    """
+    retrieval = startup.is_ready("embeddings", "index")
+    return {
+        "ready": startup.is_ready(*startup.stages),
+        "retrieval": retrieval,
+        "local_model": startup.is_ready("model"),
+        "api_model": retrieval and chatbot.client is not None,
+        "failed": startup.failed(),
+        "uptime_s": time.time() - start_time,
+        "stages": startup.report(),
+    }
+
+
+@inferenceServer.get("/traces")
+async def traces(min_duration_ms: Optional[float] = None, limit: int = 20):
+    """
+    Summaries of the recent traced requests lasting at least `min_duration_ms`
+    (SLICERGPT_SLOW_TRACE_MS by default), newest first.
+    """
+    return {"traces": trace_store.list(slow_trace_ms if min_duration_ms is None else min_duration_ms, limit)}
+
+
+@inferenceServer.get("/traces/{request_id}")
+async def trace(request_id: str):
+    """Every span of a traced request"""
+    result = trace_store.get(request_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No trace of request {request_id}")
+    return result
+
+
+@inferenceServer.get("/metrics")
+async def metrics():
+    """Latency, throughput and usage metrics in the Prometheus text format"""
+    return PlainTextResponse(Metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @inferenceServer.get("/health")
 async def health_check():
     """Simple enpoint to check the server's status"""
@@ -83,6 +437,10 @@ async def health_check():
 async def shutdown():
     """Endpoint who stops the server"""
     logger.info("Shutdown request received")
+    # Abort the running generation, it would otherwise keep the process busy until it ends
+    scheduler.shutdown()
+    if metrics_exporter is not None:
+        metrics_exporter.stop()
     
     def stop_server():
         logger.info("Shutting down server...")
@@ -0,0 +1,154 @@
+import os
+import json
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+NORMS_FILE = "norms.npy"
+META_FILE = "vectors.json"
+
+class MappedVectorIndex:
+    """
+    Read-only exact vector index backed by memory-mapped numpy files.
+
+    The vectors are never copied into the process heap: pages are faulted in lazily
+    by the OS and shared between every process mapping the same files.
+    The `search` method mirrors `faiss.Index.search` so both can be used interchangeably.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a mapped index previously written with `MappedVectorIndex.export`.
+
+        Args:
+            path (str): Directory containing the exported vector files.
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.metric = meta["metric"]
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, NORMS_FILE), mmap_mode="r")
+        self.ntotal, self.d = self.vectors.shape
+
+    def close(self):
+        """
+        Drop the mappings, the files are unmapped once no search holds a view of them.
+        """
+        self.vectors = self.norms = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.isfile(os.path.join(path, f)) for f in (VECTORS_FILE, NORMS_FILE, META_FILE))
+
+    @staticmethod
+    def export(faiss_index, path: str):
+        """
+        Write the vectors of a flat FAISS index as memory-mappable files.
+
+        Args:
+            faiss_index: A flat (exact) FAISS index.
+            path (str): Output directory.
+        """
+        import faiss
+
+        if faiss_index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            metric = "ip"
+        elif faiss_index.metric_type == faiss.METRIC_L2:
+            metric = "l2"
+        else:
+            raise ValueError(f"Unsupported FAISS metric for memory mapping: {faiss_index.metric_type}")
+
+        vectors = np.ascontiguousarray(faiss_index.reconstruct_n(0, faiss_index.ntotal), dtype=np.float32)
+        np.save(os.path.join(path, VECTORS_FILE), vectors)
+        np.save(os.path.join(path, NORMS_FILE), np.einsum("ij,ij->i", vectors, vectors))
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as file:
+            json.dump({"metric": metric, "ntotal": int(vectors.shape[0]), "dim": int(vectors.shape[1])}, file)
+
+    def search(self, queries, k: int, block_size: int = 65536):
+        """
+        Exact k-nearest-neighbour search.
+
+        Args:
+            queries (np.ndarray): Query matrix of shape (nq, d).
+            k (int): Number of neighbours to return per query.
+            block_size (int): Number of stored vectors scored at once, bounds temporary memory.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Distances and positions of shape (nq, k), padded with -1
+            like FAISS when fewer than k vectors are stored.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        nq = queries.shape[0]
+        best_scores = np.full((nq, 0), np.inf, dtype=np.float32)
+        best_ids = np.full((nq, 0), -1, dtype=np.int64)
+
+        for start in range(0, self.ntotal, block_size):
+            block = self.vectors[start:start + block_size]
+            products = queries @ block.T
+            if self.metric == "l2":
+                scores = self.norms[start:start + block_size][None, :] - 2 * products
+                scores += np.einsum("ij,ij->i", queries, queries)[:, None]
+            else:
+                # Negate so that smaller is always better while selecting
+                scores = -products
+            ids = np.broadcast_to(np.arange(start, start + block.shape[0], dtype=np.int64), scores.shape)
+
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_ids = np.concatenate([best_ids, ids], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_ids = np.take_along_axis(best_ids, keep, axis=1)
+
+        order = np.argsort(best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        if self.metric == "ip":
+            best_scores = -best_scores
+
+        if best_scores.shape[1] < k:
+            missing = k - best_scores.shape[1]
+            fill = -np.inf if self.metric == "ip" else np.inf
+            best_scores = np.pad(best_scores, ((0, 0), (0, missing)), constant_values=fill)
+            best_ids = np.pad(best_ids, ((0, 0), (0, missing)), constant_values=-1)
+        return best_scores, best_ids
+
+    def memory_report(self) -> dict:
+        """
+        Report how much of the mapped files is currently resident in this process.
+
+        Returns:
+            dict: `mapped_bytes` (size of the mapped files) and `resident_bytes`
+            (resident pages of those mappings, None when /proc is not available).
+        """
+        files = {os.path.realpath(os.path.join(self.path, f)) for f in (VECTORS_FILE, NORMS_FILE)}
+        mapped = sum(os.path.getsize(f) for f in files)
+        return {"mapped_bytes": mapped, "resident_bytes": resident_bytes_of(files)}
+
+
+def resident_bytes_of(files) -> int:
+    """
+    Sum the resident set size of the memory mappings of the given files, using /proc/self/smaps.
+
+    Args:
+        files (Iterable[str]): Real paths of the mapped files.
+
+    Returns:
+        int | None: Resident bytes, or None if /proc/self/smaps is unavailable (non-Linux).
+    """
+    try:
+        with open("/proc/self/smaps", "r") as smaps:
+            resident = 0
+            current = None
+            for line in smaps:
+                fields = line.split(None, 5)
+                if not fields:
+                    continue
+                if not fields[0].endswith(":") and len(fields) >= 5:
+                    # Mapping header: address perms offset dev inode [path]
+                    current = fields[5].strip() if len(fields) == 6 else None
+                elif fields[0] == "Rss:" and current in files:
+                    resident += int(fields[1]) * 1024
+            return resident
+    except OSError:
+        return None
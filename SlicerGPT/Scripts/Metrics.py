@@ -0,0 +1,208 @@
+"""
+Process wide metrics in the Prometheus text exposition format.
+
+The server exposes them on /metrics. Offline runs (benchmarks, scripts) can write them to a file
+with `FileExporter`, whose output is also readable by the node exporter textfile collector.
+"""
+import os
+import sys
+import math
+import time
+import threading
+from abc import ABC, abstractmethod
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SPEED_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+def format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Metric(ABC):
+    kind = None
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            lines.extend(self.samples())
+        return lines
+
+    @abstractmethod
+    def samples(self):
+        """Exposition lines of the values, called with the lock held."""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return [f"{self.name}{format_labels(key)} {format_value(value)}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    """
+    Gauge set explicitly, or read from `fn` when rendered.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, fn=None):
+        super().__init__(name, documentation)
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        if self.fn is not None:
+            value = self.fn()
+            return [] if value is None else [f"{self.name} {format_value(value)}"]
+        return [f"{self.name}{format_labels(key)} {format_value(value)}" for key, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        lines = []
+        for key, (counts, total) in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', format_value(bound)),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: All the metrics in the Prometheus text format.
+        """
+        with self.lock:
+            metrics = list(self.metrics)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+def process_rss_bytes():
+    """
+    Returns:
+        int | None: Resident memory of this process, None when it cannot be read.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == "darwin":
+        # Peak rather than current resident memory, in bytes on macOS
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+REGISTRY = Registry()
+
+QUERY_EMBEDDING_SECONDS = REGISTRY.register(Histogram(
+    "slicergpt_query_embedding_seconds", "Time to embed the uncached queries of a search."))
+VECTOR_SEARCH_SECONDS = REGISTRY.register(Histogram(
+    "slicergpt_vector_search_seconds", "Time of the FAISS (and BM25 in hybrid mode) search of a batch of queries."))
+PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "slicergpt_prompt_tokens", "Tokens of the prompts sent to a model.", TOKEN_BUCKETS))
+PROMPT_EVAL_SPEED = REGISTRY.register(Histogram(
+    "slicergpt_prompt_eval_tokens_per_second", "Prompt evaluation speed of the base model.", SPEED_BUCKETS))
+DECODE_SPEED = REGISTRY.register(Histogram(
+    "slicergpt_decode_tokens_per_second", "Decoding speed of the base model.", SPEED_BUCKETS))
+TIME_TO_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "slicergpt_time_to_first_token_seconds", "Time from the request arrival to its first streamed token."))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "slicergpt_request_seconds", "Time from the request arrival to its complete answer."))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "slicergpt_queue_wait_seconds", "Time a request waited for the inference worker."))
+ANSWERS = REGISTRY.register(Counter(
+    "slicergpt_answers_total", "Answers by model: local, api, or cache for semantic cache hits."))
+API_FALLBACKS = REGISTRY.register(Counter(
+    "slicergpt_api_fallbacks_total", "API model failures answered by the base model instead."))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    "slicergpt_request_errors_total", "Failed requests by reason."))
+RESIDENT_MEMORY = REGISTRY.register(Gauge(
+    "process_resident_memory_bytes", "Resident memory size of the server process.", process_rss_bytes))
+
+
+class FileExporter:
+    """
+    Writes the metrics to a file every `interval` seconds and when stopped, atomically.
+    """
+
+    def __init__(self, path: str, interval: float = 15.0, registry: Registry = REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="metrics-exporter", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(self.registry.render())
+            file.write(f"# Written at {time.time():.3f}\n")
+        os.replace(self.path + ".tmp", self.path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
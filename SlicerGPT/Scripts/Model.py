@@ -1,58 +1,177 @@
-from llama_cpp import Llama
+import llama_cpp
+from llama_cpp import Llama, StoppingCriteriaList
 from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import SystemMessage, UserMessage
 from azure.core.credentials import AzureKeyCredential
 
 import os
+import logging
+from ConversationHistory import ConversationHistory
+from ContextPacker import ContextPacker
+from PromptCache import PromptCache
+from SceneDigest import SceneState
+from Sessions import Session, SessionStore
+from ResponseCache import ResponseCache, fingerprint
+from QueryCache import normalize_query
+from Scheduler import RequestCancelled
+import LlamaCalibration
+import Metrics
+import Tracing
+from SpeculativeDecoding import create_draft_model, scores_memory
 os.environ["INFERENCE_API_TOKEN"] = ""
 
 
+logger = logging.getLogger("model")
+
 FAISS_DIR = "./SlicerFAISS"
+# Token estimate used while the base model tokenizer is not loaded
+CHARS_PER_TOKEN = 4
+
+SYSTEM_PROMPT = (
+    "You are an expert 3D Slicer technical assistant. Your responses must be:\n"
+    "1. TECHNICALLY PRECISE - Use exact module/feature names and correct steps\n"
+    "2. CONCISE - Break complex tasks into numbered steps\n"
+    "3. PRACTICAL - Include troubleshooting tips for common issues\n"
+    "4. SAFE - Never suggest modifying critical system files\n\n"
+    
+    "Response Format Guidelines:\n"
+    "- Start with a brief direct answer\n"
+    "- Follow with detailed steps if needed\n"
+    "- For GUI operations, specify the exact menu path (e.g. 'Modules > Segment Editor')\n"
+    
+    "Documentation Resources:\n"
+    "- Official Manual: https://slicer.readthedocs.io\n"
+    "- User Forum: https://discourse.slicer.org/\n"
+    "- Training: https://training.slicer.org/\n\n"
+    
+    "Special Cases:\n"
+    "- For Python scripting questions, include both the script and where to paste it\n"
+    "- For DICOM issues, verify if the user has the DICOM module loaded\n"
+    "- When unsure, you have exact Slicer version in the MRML scene the user will give to you"
+)
 
 class Model:
-    def __init__(self, manager, model_name="unsloth/Qwen3-0.6B-GGUF", file_name="Qwen3-0.6B-Q8_0.gguf"):
+    def __init__(self, manager, model_name="unsloth/Qwen3-0.6B-GGUF", file_name="Qwen3-0.6B-Q8_0.gguf",
+                 n_ctx=None, n_threads=None, n_batch=None, llama_config_path=LlamaCalibration.DEFAULT_CONFIG_PATH,
+                 history_tokens=2048, answer_tokens=1024, context_tokens=1024, retrieval_k=8, retrieval_mode=None,
+                 prompt_cache_dir=None, response_cache_path=None, response_cache_threshold=0.95,
+                 speculative=None, num_pred_tokens=10, draft_model_name=None, draft_file_name=None,
+                 max_logits_memory=2 ** 30, load_llm=True):
+        """
+        Args:
+            manager (VectorStoreManager): Retrieves the context documents, can be set once loaded.
+            model_name (str): HuggingFace repository of the GGUF model.
+            file_name (str): GGUF file of the repository.
+            n_ctx (int): Context window of the base model.
+            n_threads (int): Threads used by llama.cpp.
+            n_batch (int): Prompt evaluation batch size.
+                These three default to the environment (SLICERGPT_N_CTX...), then to the calibration
+                of this machine written by LlamaCalibration.py, then to the llama.cpp defaults.
+            llama_config_path (str): Calibration file.
+            history_tokens (int): Token budget of the conversation history (summary and past turns).
+            answer_tokens (int): Tokens of the context window kept free for the answer.
+            context_tokens (int): Token budget of the context documents.
+            retrieval_k (int): Number of chunks retrieved before deduplication and packing.
+            retrieval_mode (str): "dense" or "hybrid" (embeddings fused with BM25), None for the manager's mode.
+            prompt_cache_dir (str): Directory of the system prompt KV cache snapshots, used for warm starts.
+            response_cache_path (str): SQLite file of the semantic response cache, None to keep it in memory.
+            response_cache_threshold (float): Minimum cosine similarity for two questions to share an answer.
+            speculative (str): Opt-in speculative decoding, "lookup" (n-grams of the prompt) or "draft"
+                (small GGUF model), None to decode one token at a time. See SpeculativeBenchmark.py.
+            num_pred_tokens (int): Number of tokens drafted at every speculative step.
+            draft_model_name (str): HuggingFace repository of the draft GGUF.
+            draft_file_name (str): Draft GGUF file, it must share the tokenizer of the base model.
+            max_logits_memory (int): Bytes of logits speculative decoding may keep, (n_ctx, n_vocab) float32.
+                Speculative decoding is disabled when n_ctx does not fit in it.
+            load_llm (bool): Load the base model now, otherwise `load_llm` must be called, e.g. in a
+                background thread: until then only the API model answers.
+        """
 
-        self.llm = Llama.from_pretrained(
-            repo_id=model_name,
-            filename=file_name,
-            verbose=True,
-            n_ctx=8196,
-            n_gpu_layers=-1,
-            n_threads=1
+        self.llama_params = LlamaCalibration.load_params(
+            file_name, llama_config_path, {"n_ctx": n_ctx, "n_threads": n_threads, "n_batch": n_batch}
         )
+        print(f"llama.cpp parameters: {self.llama_params}")
+        self.model_name = model_name
+        self.speculative = speculative
+        self.num_pred_tokens = num_pred_tokens
+        self.draft_model_name = draft_model_name
+        self.draft_file_name = draft_file_name
+        self.max_logits_memory = max_logits_memory
+        self.prompt_cache_dir = prompt_cache_dir
+        self.llm = None
+        self.prompt_cache = None
         self.endpoint = "https://models.github.ai/inference"
         self.api_model = "openai/gpt-4.1"
         self.client = None
 
         self.manager = manager
-        self.history = [{
-            "role": "system",
-            "content": (
-                "You are an expert 3D Slicer technical assistant. Your responses must be:\n"
-                "1. TECHNICALLY PRECISE - Use exact module/feature names and correct steps\n"
-                "2. CONCISE - Break complex tasks into numbered steps\n"
-                "3. PRACTICAL - Include troubleshooting tips for common issues\n"
-                "4. SAFE - Never suggest modifying critical system files\n\n"
-                
-                "Response Format Guidelines:\n"
-                "- Start with a brief direct answer\n"
-                "- Follow with detailed steps if needed\n"
-                "- For GUI operations, specify the exact menu path (e.g. 'Modules > Segment Editor')\n"
-                
-                "Documentation Resources:\n"
-                "- Official Manual: https://slicer.readthedocs.io\n"
-                "- User Forum: https://discourse.slicer.org/\n"
-                "- Training: https://training.slicer.org/\n\n"
-                
-                "Special Cases:\n"
-                "- For Python scripting questions, include both the script and where to paste it\n"
-                "- For DICOM issues, verify if the user has the DICOM module loaded\n"
-                "- When unsure, you have exact Slicer version in the MRML scene the user will give to you"
-            )
-        }]
+        self.model_file = file_name
+        self.n_ctx = self.llama_params["n_ctx"]
+        self.answer_tokens = answer_tokens
+        self.history_tokens = history_tokens
+        self.summary_tokens = 256
+        self.retrieval_k = retrieval_k
+        self.retrieval_mode = retrieval_mode
+        # Over-retrieved chunks are deduplicated and trimmed to the question into a fixed budget.
+        # Segments are embedded directly, they would evict the questions from the query embedding cache.
+        self.context_packer = ContextPacker(lambda texts: self.manager.embeddings.embed_documents(texts),
+                                            self.count_tokens, max_tokens=context_tokens)
+        # One conversation history and scene digest per client session
+        self.sessions = SessionStore(self.new_session)
+        self.last_usage = {}
+        self.response_cache = ResponseCache(response_cache_path, threshold=response_cache_threshold)
 
-        # self.history = []
         self.has_history = True
+        if load_llm:
+            self.load_llm()
+
+    def load_llm(self):
+        """
+        Load the base model and prefill the system prompt in its KV cache.
+        """
+        speculative = self.speculative
+        if speculative is not None:
+            # The vocabulary alone is loaded to size the logits before allocating them
+            vocab = Llama.from_pretrained(repo_id=self.model_name, filename=self.model_file, verbose=False,
+                                          vocab_only=True)
+            n_vocab = vocab.n_vocab()
+            vocab.close()
+            memory = scores_memory(self.n_ctx, n_vocab)
+            if memory > self.max_logits_memory:
+                max_ctx = self.max_logits_memory // scores_memory(1, n_vocab)
+                print(f"Speculative decoding disabled: {memory / 2 ** 20:.0f} MiB of logits for n_ctx {self.n_ctx}, "
+                      f"more than {self.max_logits_memory / 2 ** 20:.0f} MiB. Set n_ctx to {max_ctx} at most to use it.")
+                speculative = None
+        draft_model = create_draft_model(speculative, self.num_pred_tokens, self.draft_model_name,
+                                         self.draft_file_name, n_gpu_layers=-1, **self.llama_params)
+        llm = Llama.from_pretrained(
+            repo_id=self.model_name,
+            filename=self.model_file,
+            verbose=True,
+            n_gpu_layers=-1,
+            draft_model=draft_model,
+            # The drafted tokens are verified against the logits of every position
+            logits_all=draft_model is not None,
+            **self.llama_params
+        )
+        if draft_model is not None:
+            memory = scores_memory(llm.n_ctx(), llm.n_vocab())
+            print(f"Speculative decoding ({speculative}, {self.num_pred_tokens} tokens): "
+                  f"{memory / 2 ** 20:.0f} MiB of logits, lower n_ctx to reduce it")
+
+        # Prefill the system prompt once, every request then only evaluates its own suffix
+        prompt_cache = PromptCache(llm, self.prompt_cache_dir)
+        prompt_cache.warm_start(SYSTEM_PROMPT)
+        self.prompt_cache = prompt_cache
+        self.llm = llm
+
+    @property
+    def llm_ready(self) -> bool:
+        return self.llm is not None
+
+    def require_llm(self):
+        if self.llm is None:
+            raise RuntimeError("The local model is still loading, use the API model or retry later")
 
     def initialize_azure_client(self, key):
         safe_key = "".join(key.split())
@@ -61,19 +180,123 @@ class Model:
             credential=AzureKeyCredential(safe_key),
         )
 
+    def new_session(self, session_id):
+        conversation = ConversationHistory(
+            SYSTEM_PROMPT, self.count_tokens, max_tokens=self.history_tokens,
+            summarize=self.summarize, summary_tokens=self.summary_tokens
+        )
+        return Session(session_id, conversation, SceneState())
+
+    def count_tokens(self, text):
+        if self.llm is None:
+            # Estimate until the tokenizer is loaded, only the budgets depend on it
+            return len(text) // CHARS_PER_TOKEN + 1
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    def summarize(self, summary, messages, control=None):
+        """
+        Fold conversation turns into the rolling summary with the base model.
+
+        Args:
+            summary (str): The current summary, possibly empty.
+            messages (List[dict]): The user and assistant messages to fold.
+            control (RequestControl): Stops the summarization once the request is cancelled.
+
+        Returns:
+            str: The new summary.
+        """
+        if self.llm is None:
+            return ConversationHistory.summarize_questions(summary, messages)
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        return self.complete_llm(
+            messages=[{
+                "role": "user",
+                "content": (
+                    "Update the summary of a conversation between a user and a 3D Slicer assistant. "
+                    "Keep the user's goals, the data and modules involved and the conclusions, "
+                    "in a few short bullet points.\n\n"
+                    f"Current summary:\n{summary or '(empty)'}\n\n"
+                    f"New messages:\n{transcript}" + self.think(False)
+                ),
+            }],
+            max_tokens=self.summary_tokens,
+            temperature=0,
+            control=control,
+        )
+
     def think(self, enable_thinking):
         return " /think" if enable_thinking is True else " /no_think"
 
 
-    def generate_response(self, user_input, mrml_scene, enable_thinking, use_api):
-        
-        # print(mrml_scene)
+    def scene_text(self, mrml_scene, scene_delta, session):
+        """
+        Returns:
+            str: The scene given to the model, the full XML if it was sent, the compact digest otherwise.
+        """
+        with Tracing.span("scene", delta=scene_delta is not None):
+            if scene_delta is not None:
+                session.scene_in_sync = session.scene.apply(scene_delta)
+                if mrml_scene is None:
+                    return session.scene.render()
+            return mrml_scene or ""
+
+    def response_cache_key(self, mrml_scene, enable_thinking, use_api):
+        """
+        Returns:
+            str: Fingerprint of everything besides the question an answer depends on:
+            the scene, the model and its settings.
+        """
+        if use_api:
+            return fingerprint(self.api_model, SYSTEM_PROMPT, mrml_scene)
+        return fingerprint(self.model_file, bool(enable_thinking), SYSTEM_PROMPT, mrml_scene)
+
+    def question_embedding(self, user_input):
+        # Normalized like the retrieval queries, so a cache miss reuses the vector for the search
+        return self.manager.embed_queries([normalize_query(user_input)])[0]
+
+    def cached_response(self, user_input, mrml_scene, enable_thinking, use_api):
+        """
+        Look up the semantic response cache.
+
+        Returns:
+            Tuple[str | None, np.ndarray]: The cached answer or None, and the question embedding.
+        """
+        with Tracing.span("response_cache") as span:
+            embedding = self.question_embedding(user_input)
+            response = self.response_cache.get(
+                embedding, self.response_cache_key(mrml_scene, enable_thinking, use_api and self.client is not None)
+            )
+            span.set(hit=response is not None)
+        if response is not None:
+            self.last_usage = {"response_cache": "hit"}
+            logger.debug(f"Response cache hit: {self.response_cache.stats()}")
+            Metrics.ANSWERS.inc(model="cache")
+        return response, embedding
+
+    def build_messages(self, user_input, mrml_scene, enable_thinking, use_api, session):
+        """
+        Retrieve the context documents and build the chat messages of a question.
+
+        Args:
+            user_input (str): The user question.
+            mrml_scene (str): The scene text given to the model, see `scene_text`.
+            enable_thinking (bool): Enable the thinking mode of the base model.
+            use_api (bool): The question is sent to the API model.
+            session (Session): The session whose history is sent.
 
-        docs = self.manager.search(user_input, k=3)
-        print(docs[0])
+        Returns:
+            List[dict]: The chat messages, history included.
+        """
+        with Tracing.span("retrieval", k=self.retrieval_k, mode=self.retrieval_mode or self.manager.retrieval_mode):
+            docs = self.manager.search(user_input, k=self.retrieval_k, mode=self.retrieval_mode)
+        with Tracing.span("context_packing") as span:
+            documents, packing = self.context_packer.pack(self.question_embedding(user_input), docs)
+            span.set(**packing)
+        logger.debug(f"Context packing: {packing}")
+        building = Tracing.start_span("prompt_building")
         context = (
             "Context documents:\n"
-            + "\n---\n".join([doc.page_content for doc in docs]) + "\n\n"
+            + "\n---\n".join(documents) + "\n\n"
 
             "MRML Scene:\n"
             + mrml_scene + "\n\n"
@@ -84,39 +307,288 @@ class Model:
 
             f"User question: {user_input}"
         )
-        
+
         think = self.think(enable_thinking) if not use_api else ""
-        messages = self.history + [{"role": "user", "content": context + user_input + think}]
+        question = {"role": "user", "content": context + user_input + think}
+
+        usage = {
+            "documents": packing["tokens"],
+            "mrml_scene": self.count_tokens(mrml_scene),
+            "question": self.count_tokens(question["content"]),
+        }
+        usage["question"] -= usage["documents"] + usage["mrml_scene"]
+        available = self.n_ctx - self.answer_tokens - session.conversation.system_tokens - sum(usage.values())
+        history, history_usage = session.conversation.messages(max(0, available))
+        usage.update(history_usage)
+        usage["total"] = sum(usage.values())
+        usage["packing"] = packing
+        self.last_usage = usage
+        logger.debug(f"Prompt tokens: {usage}")
+        Metrics.PROMPT_TOKENS.observe(usage["total"])
+        building.finish(prompt_tokens=usage["total"])
+
+        return history + [question]
+
+    def update_history(self, user_input, response, session):
+        # Summarizing can take as long as an answer, it runs once the answer is delivered (see compress_history)
+        session.conversation.add_turn(user_input, response, compress=False)
+
+    def compress_history(self, session, control=None):
+        """
+        Fold the oldest turns of a session into its summary, if its history is over budget.
 
-        if use_api and self.client is not None:
+        Args:
+            session (Session): The session.
+            control (RequestControl): Cancellation and deadline of the request that added the last turn.
+                A cancelled summarization keeps the user questions only.
+        """
+        with Tracing.span("history_compression"):
+            session.conversation.compress(lambda summary, messages: self.summarize(summary, messages, control))
+
+    def generate_response(self, user_input, mrml_scene, enable_thinking, use_api, scene_delta=None, session=None,
+                          control=None):
+        session = session or self.sessions.get()
+        mrml_scene = self.scene_text(mrml_scene, scene_delta, session)
+        response, embedding = self.cached_response(user_input, mrml_scene, enable_thinking, use_api)
+        if response is not None:
+            self.update_history(user_input, response, session)
+            return response
+
+        messages = self.build_messages(user_input, mrml_scene, enable_thinking, use_api, session)
+        if control is not None:
+            control.check()
+        used_api = use_api and self.client is not None
+
+        if used_api:
             try:
-                resp = self.client.complete(
-                messages=messages,
-                temperature=0,
-                top_p=1.0,
-                model=self.api_model
-                )
+                with Tracing.span("api", model=self.api_model):
+                    resp = self.client.complete(
+                    messages=messages,
+                    temperature=0,
+                    top_p=1.0,
+                    model=self.api_model
+                    )
             except Exception as e:
                 print(f"An error occured while calling the client: {e}, using the Base model instead...")
+                Metrics.API_FALLBACKS.inc()
                 messages[-1]["content"] += self.think(enable_thinking)
-                resp = self.llm.create_chat_completion(
-                messages=messages,
-                )
-                
+                response = self.complete_llm(messages, control=control)
+                used_api = False
+            else:
+                response = resp["choices"][0]["message"]["content"]
     
         else:
-            resp = self.llm.create_chat_completion(
-                messages=messages,
-            )
+            response = self.complete_llm(messages, control=control)
 
-        response = resp["choices"][0]["message"]["content"]
+        # A cancelled answer is truncated, it is neither kept in the history nor cached
+        if control is not None:
+            control.check()
 
         # Update history
-        self.history.append({"role": "user", "content": user_input})
-        self.history.append({"role": "assistant", "content": response})
+        self.update_history(user_input, response, session)
+        self.response_cache.put(embedding, self.response_cache_key(mrml_scene, enable_thinking, used_api), user_input, response)
+        Metrics.ANSWERS.inc(model="api" if used_api else "local")
 
         return response
 
+    def log_prompt_cache(self):
+        if self.prompt_cache.last_metrics:
+            self.last_usage["prompt_cache"] = self.prompt_cache.last_metrics
+            logger.debug(f"Prompt cache: {self.prompt_cache.last_metrics}")
+
+    def complete_llm(self, messages, control=None, **kwargs):
+        """
+        Args:
+            messages (List[dict]): The chat messages.
+            control (RequestControl): Stops the generation at the next token once the request is cancelled.
+            **kwargs: Sampling arguments.
+
+        Returns:
+            str: The base model answer, evaluating only the prompt suffix that is not in the KV cache.
+        """
+        self.require_llm()
+        if not self.prompt_cache.enabled and control is not None:
+            # create_chat_completion takes no stopping criteria, stream to check the control between tokens
+            return "".join(self.stream_llm(messages, control, **kwargs))
+
+        perf = self.llama_perf()
+        span = Tracing.start_span("llm")
+        try:
+            if not self.prompt_cache.enabled:
+                return self.llm.create_chat_completion(messages=messages, **kwargs)["choices"][0]["message"]["content"]
+            if control is not None:
+                kwargs["stopping_criteria"] = StoppingCriteriaList([control.stopping_criteria])
+            resp = self.prompt_cache.complete(messages, **kwargs)
+            self.log_prompt_cache()
+            return resp["choices"][0]["text"]
+        finally:
+            # Prefill and decoding are not separated in time here, the llama.cpp counters split them
+            span.finish(**self.observe_llama_speed(perf))
+
+    def stream_llm(self, messages, control=None, **kwargs):
+        """
+        Args:
+            messages (List[dict]): The chat messages.
+            control (RequestControl): Aborts the generation at the next token once the request is cancelled.
+            **kwargs: Sampling arguments.
+
+        Yields:
+            str: Text chunks of the base model answer, as they are decoded.
+
+        Raises:
+            RequestCancelled: The request was cancelled or exceeded its deadline.
+        """
+        self.require_llm()
+        perf = self.llama_perf()
+        # The prompt is evaluated when the first chunk is requested, decoding goes on until the end
+        span = Tracing.start_span("llm")
+        prefill = Tracing.start_span("prefill")
+        decode = None
+        try:
+            if not self.prompt_cache.enabled:
+                chunks = (
+                    chunk["choices"][0]["delta"].get("content")
+                    for chunk in self.llm.create_chat_completion(messages=messages, stream=True, **kwargs)
+                )
+            else:
+                chunks = (chunk["choices"][0]["text"] for chunk in self.prompt_cache.complete(messages, stream=True, **kwargs))
+                self.log_prompt_cache()
+                prefill.set(**self.prompt_cache.last_metrics)
+            for text in chunks:
+                if decode is None:
+                    prefill.finish()
+                    decode = Tracing.start_span("decode")
+                if control is not None:
+                    control.check()
+                if text:
+                    yield text
+        finally:
+            prefill.finish()
+            if decode is not None:
+                decode.finish()
+            span.finish(**self.observe_llama_speed(perf))
+
+    def llama_perf(self):
+        """
+        Returns:
+            Tuple[float, int, float, int]: llama.cpp cumulated prompt evaluation time (ms) and tokens,
+            then decoding time (ms) and tokens.
+        """
+        data = llama_cpp.llama_perf_context(self.llm._ctx.ctx)
+        return data.t_p_eval_ms, data.n_p_eval, data.t_eval_ms, data.n_eval
+
+    def observe_llama_speed(self, before):
+        """
+        Record the prompt evaluation and decoding speeds of the generation started at the `before` counters.
+
+        Returns:
+            dict: Tokens and milliseconds of the prompt evaluation and of the decoding.
+        """
+        prompt_ms, prompt_tokens, eval_ms, eval_tokens = (
+            after - start for after, start in zip(self.llama_perf(), before)
+        )
+        if prompt_tokens > 0 and prompt_ms > 0:
+            Metrics.PROMPT_EVAL_SPEED.observe(prompt_tokens * 1000 / prompt_ms)
+        if eval_tokens > 0 and eval_ms > 0:
+            Metrics.DECODE_SPEED.observe(eval_tokens * 1000 / eval_ms)
+        return {"prompt_eval_tokens": prompt_tokens, "prompt_eval_ms": prompt_ms,
+                "decode_tokens": eval_tokens, "decode_ms": eval_ms}
+
+    def stream_api(self, messages, control=None):
+        """
+        Yields:
+            str: Text chunks of the API model answer, as they are received.
+
+        Raises:
+            RequestCancelled: The request was cancelled or exceeded its deadline.
+        """
+        span = Tracing.start_span("api", model=self.api_model)
+        try:
+            updates = self.client.complete(
+                messages=messages,
+                temperature=0,
+                top_p=1.0,
+                model=self.api_model,
+                stream=True
+            )
+        except BaseException as e:
+            span.finish(error=type(e).__name__)
+            raise
+        first = Tracing.start_span("first_token")
+        try:
+            for update in updates:
+                if control is not None:
+                    control.check()
+                if update.choices and update.choices[0].delta.content:
+                    first.finish()
+                    yield update.choices[0].delta.content
+        finally:
+            first.finish()
+            span.finish()
+            # Closes the HTTP response when the request is cancelled
+            updates.close()
+
+    def stream_response(self, user_input, mrml_scene, enable_thinking, use_api, scene_delta=None, session=None,
+                        control=None):
+        """
+        Streaming variant of `generate_response`: the answer is yielded chunk by chunk and
+        added to the history once complete.
+
+        Args:
+            user_input (str): The user question.
+            mrml_scene (str): The MRML scene of the user, as XML.
+            enable_thinking (bool): Enable the thinking mode of the base model.
+            use_api (bool): Send the question to the API model.
+            scene_delta (dict): Scene digest changes, used when no XML is sent.
+            session (Session): The conversation state, defaults to the default session.
+            control (RequestControl): Cancellation and deadline of the request, checked between tokens.
+
+        Yields:
+            str: Text chunks of the answer.
+
+        Raises:
+            RequestCancelled: The request was cancelled or exceeded its deadline, the partial answer is dropped.
+        """
+        session = session or self.sessions.get()
+        mrml_scene = self.scene_text(mrml_scene, scene_delta, session)
+        response, embedding = self.cached_response(user_input, mrml_scene, enable_thinking, use_api)
+        if response is not None:
+            self.update_history(user_input, response, session)
+            yield response
+            return
+
+        messages = self.build_messages(user_input, mrml_scene, enable_thinking, use_api, session)
+        if control is not None:
+            control.check()
+        chunks = []
+        use_llm = not (use_api and self.client is not None)
+
+        if not use_llm:
+            try:
+                for chunk in self.stream_api(messages, control):
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                # Once tokens were shown the answer cannot be restarted with another model
+                if chunks or isinstance(e, RequestCancelled):
+                    raise
+                print(f"An error occured while calling the client: {e}, using the Base model instead...")
+                Metrics.API_FALLBACKS.inc()
+                messages[-1]["content"] += self.think(enable_thinking)
+                use_llm = True
+
+        if use_llm:
+            for chunk in self.stream_llm(messages, control):
+                chunks.append(chunk)
+                yield chunk
+
+        response = "".join(chunks)
+        self.update_history(user_input, response, session)
+        Metrics.ANSWERS.inc(model="local" if use_llm else "api")
+        if response:
+            self.response_cache.put(embedding, self.response_cache_key(mrml_scene, enable_thinking, not use_llm),
+                                    user_input, response)
+
 # if __name__ == "__main__":
 
     # manager = VectorStoreManager(FAISS_DIR)
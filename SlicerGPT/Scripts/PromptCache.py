@@ -0,0 +1,215 @@
+import os
+import json
+import hashlib
+import numpy as np
+import llama_cpp
+from llama_cpp import Llama
+from llama_cpp.llama import LlamaState
+from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+class PromptCache:
+    """
+    Reuse of the llama.cpp KV cache across requests.
+
+    Prompts are formatted with the model chat template and tokenized here, so the tokens
+    already evaluated in the KV cache can be compared with the new prompt: llama.cpp only
+    evaluates the suffix after the longest common prefix. The prefill of the system prompt
+    is kept as a state snapshot, in memory and on disk, and restored whenever another
+    prompt (e.g. a summarization request) evicted it.
+    """
+
+    def __init__(self, llm: Llama, snapshot_dir: str = None):
+        """
+        Args:
+            llm (Llama): The base model.
+            snapshot_dir (str): Directory of the system prompt snapshots, None to keep them in memory only.
+        """
+        self.llm = llm
+        self.snapshot_dir = snapshot_dir
+        self.formatter = None
+        template = llm.metadata.get("tokenizer.chat_template")
+        if template:
+            # Same formatter as the one `create_chat_completion` uses for GGUF templates
+            eos_id, bos_id = llm.token_eos(), llm.token_bos()
+            self.formatter = Jinja2ChatFormatter(
+                template=template,
+                eos_token=llm._model.token_get_text(eos_id) if eos_id != -1 else "",
+                bos_token=llm._model.token_get_text(bos_id) if bos_id != -1 else "",
+                stop_token_ids=[eos_id],
+            )
+        self.prefix_tokens = []
+        self.prefix_state = None
+        self.last_metrics = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.formatter is not None
+
+    def tokenize(self, messages):
+        """
+        Format chat messages with the model template.
+
+        Returns:
+            Tuple[List[int], ChatFormatterResponse]: The prompt tokens and the formatter response (stop words).
+        """
+        result = self.formatter(messages=messages)
+        tokens = self.llm.tokenize(result.prompt.encode("utf-8"), add_bos=not result.added_special, special=True)
+        return tokens, result
+
+    def snapshot_path(self, tokens):
+        if self.snapshot_dir is None:
+            return None
+        digest = hashlib.sha256()
+        for part in (llama_cpp.__version__, os.path.basename(self.llm.model_path), str(self.llm.n_ctx())):
+            digest.update(part.encode("utf-8"))
+        digest.update(np.asarray(tokens, dtype=np.int32).tobytes())
+        return os.path.join(self.snapshot_dir, f"prefix-{digest.hexdigest()[:24]}.state")
+
+    def save_state(self) -> LlamaState:
+        """
+        Snapshot the KV cache. Only the logits of the last evaluated token are kept: the next
+        prompt always evaluates at least one token, so the older ones are never read.
+        `Llama.save_state` copies the logits of every evaluated token, (n_tokens, n_vocab) floats
+        with speculative decoding: it is given a view of the last row instead.
+        """
+        scores = self.llm.scores
+        last = max(min(self.llm.n_tokens, len(scores)) - 1, 0)
+        self.llm.scores = scores[last:last + 1]
+        try:
+            state = self.llm.save_state()
+        finally:
+            self.llm.scores = scores
+        return state
+
+    @staticmethod
+    def write_state(state: LlamaState, path: str):
+        """
+        Write a snapshot as a JSON header line followed by the raw input ids, scores and llama.cpp state.
+        The snapshot is never unpickled: a file dropped in the cache directory cannot run code.
+        """
+        input_ids = np.ascontiguousarray(state.input_ids, dtype=np.intc)
+        scores = np.ascontiguousarray(state.scores, dtype=np.single)
+        header = {
+            "version": 1,
+            "n_tokens": int(state.n_tokens),
+            "seed": int(state.seed),
+            "input_ids": int(input_ids.shape[0]),
+            "scores": list(scores.shape),
+            "llama_state_size": int(state.llama_state_size),
+        }
+        with open(path + ".tmp", "wb") as file:
+            file.write(json.dumps(header).encode("utf-8") + b"\n")
+            file.write(input_ids.tobytes())
+            file.write(scores.tobytes())
+            file.write(bytes(state.llama_state[:state.llama_state_size]))
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def read_state(path: str) -> LlamaState:
+        """Read a snapshot written by `write_state`, raises ValueError if the file is truncated or invalid."""
+        with open(path, "rb") as file:
+            header = json.loads(file.readline().decode("utf-8"))
+            data = file.read()
+        if header.get("version") != 1:
+            raise ValueError(f"unsupported snapshot version {header.get('version')}")
+        rows, columns = header["scores"]
+        ids_size = header["input_ids"] * np.dtype(np.intc).itemsize
+        scores_size = rows * columns * np.dtype(np.single).itemsize
+        if len(data) != ids_size + scores_size + header["llama_state_size"]:
+            raise ValueError("truncated snapshot")
+        input_ids = np.frombuffer(data, dtype=np.intc, count=header["input_ids"]).copy()
+        scores = np.frombuffer(data, dtype=np.single, count=rows * columns, offset=ids_size).reshape(rows, columns).copy()
+        return LlamaState(
+            input_ids=input_ids,
+            scores=scores,
+            n_tokens=header["n_tokens"],
+            llama_state=data[ids_size + scores_size:],
+            llama_state_size=header["llama_state_size"],
+            seed=header["seed"],
+        )
+
+    def warm_start(self, system_prompt: str):
+        """
+        Prefill the KV cache with the system prompt, from the disk snapshot when there is one.
+
+        Args:
+            system_prompt (str): The system prompt starting every conversation.
+        """
+        if not self.enabled:
+            return
+        # The template decides where the system part ends: it is what two prompts with different questions share
+        first, _ = self.tokenize([{"role": "system", "content": system_prompt}, {"role": "user", "content": "a"}])
+        second, _ = self.tokenize([{"role": "system", "content": system_prompt}, {"role": "user", "content": "b"}])
+        self.prefix_tokens = first[:Llama.longest_token_prefix(first, second)]
+
+        path = self.snapshot_path(self.prefix_tokens)
+        if path is not None and os.path.isfile(path):
+            try:
+                state = self.read_state(path)
+                self.llm.load_state(state)
+                self.prefix_state = state
+                print(f"Restored the system prompt KV cache ({len(self.prefix_tokens)} tokens) from {path}")
+                return
+            except Exception as e:
+                print(f"Could not restore the KV cache snapshot {path} ({e}), evaluating the system prompt.")
+
+        self.llm.reset()
+        self.llm.eval(self.prefix_tokens)
+        self.prefix_state = self.save_state()
+        if path is not None:
+            try:
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                self.write_state(self.prefix_state, path)
+            except OSError as e:
+                print(f"Could not save the KV cache snapshot ({e}).")
+
+    def prepare(self, tokens) -> dict:
+        """
+        Make the KV cache hold the longest available prefix of a prompt, restoring the
+        system prompt snapshot if the cache currently holds less of it.
+
+        Args:
+            tokens (List[int]): The prompt tokens.
+
+        Returns:
+            dict: `prefix_tokens` reused from the cache, `evaluated_tokens` left to evaluate
+            and whether the snapshot was `restored`.
+        """
+        # llama.cpp always re-evaluates the last prompt token to get its logits
+        live = Llama.longest_token_prefix(self.llm.input_ids[:self.llm.n_tokens], tokens[:-1])
+        shared = Llama.longest_token_prefix(self.prefix_tokens, tokens[:-1])
+        restored = False
+        if self.prefix_state is not None and shared > live:
+            self.llm.load_state(self.prefix_state)
+            live = shared
+            restored = True
+        self.last_metrics = {"prefix_tokens": live, "evaluated_tokens": len(tokens) - live, "restored": restored}
+        return self.last_metrics
+
+    def complete(self, messages, stream: bool = False, **kwargs):
+        """
+        `create_chat_completion` equivalent going through the prefix reuse.
+
+        Args:
+            messages (List[dict]): The chat messages.
+            stream (bool): Return an iterator of chunks instead of the whole completion.
+            **kwargs: Sampling arguments of `Llama.create_completion`.
+
+        Returns:
+            A text completion (`choices[0]["text"]`), or an iterator of completion chunks.
+        """
+        tokens, result = self.tokenize(messages)
+        self.prepare(tokens)
+        options = {"temperature": 0.2, "top_p": 0.95, "top_k": 40, "min_p": 0.05, "max_tokens": None}
+        options.update(kwargs)
+        # Criteria of the caller (e.g. cancellation) come on top of the chat template ones
+        stopping_criteria = options.pop("stopping_criteria", None)
+        if result.stopping_criteria is not None:
+            stopping_criteria = llama_cpp.StoppingCriteriaList([*result.stopping_criteria, *(stopping_criteria or [])])
+        return self.llm.create_completion(
+            prompt=tokens,
+            stop=result.stop,
+            stopping_criteria=stopping_criteria,
+            stream=stream,
+            **options
+        )
@@ -0,0 +1,71 @@
+import sys
+import threading
+from collections import OrderedDict
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings share a cache entry.
+    The embedding model is uncased, so lowercasing does not change the results.
+    """
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by the total size of its entries.
+    """
+
+    def __init__(self, max_bytes: int, sizeof=sys.getsizeof):
+        """
+        Args:
+            max_bytes (int): Maximum total size of the cached keys and values, in bytes.
+            sizeof (Callable): Function returning the size of a value in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self.entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
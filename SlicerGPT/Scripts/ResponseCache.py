@@ -0,0 +1,164 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+def fingerprint(*parts) -> str:
+    """
+    Returns:
+        str: Short hash of the given strings, e.g. the scene text or the model settings.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+class ResponseCache:
+    """
+    Semantic cache of the model answers.
+
+    An answer is reused when a new question embeds close enough to a cached one (cosine
+    similarity above `threshold`) and was asked on the same scene with the same model settings.
+    Entries live in a SQLite file, with their normalized embeddings kept in memory, and are
+    evicted least recently used first beyond `max_entries` or once older than `ttl` seconds.
+    """
+
+    def __init__(self, path: str = None, threshold: float = 0.95, max_entries: int = 1024, ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            path (str): SQLite file of the cache, None to keep it in memory only.
+            threshold (float): Minimum cosine similarity between two questions sharing an answer.
+            max_entries (int): Maximum number of cached answers.
+            ttl (float): Lifetime of an answer in seconds.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, question TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.commit()
+        # key -> (ids, normalized embeddings matrix) of the live entries
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self.connection.commit()
+            self.entries = {}
+            for entry_id, key, blob in self.connection.execute("SELECT id, key, embedding FROM responses ORDER BY id"):
+                self.add_entry(key, entry_id, np.frombuffer(blob, dtype=np.float32))
+
+    def add_entry(self, key: str, entry_id: int, embedding):
+        ids, embeddings = self.entries.get(key, ([], None))
+        embeddings = embedding[None, :] if embeddings is None else np.vstack([embeddings, embedding])
+        self.entries[key] = (ids + [entry_id], embeddings)
+
+    def remove_entries(self, entry_ids):
+        entry_ids = set(entry_ids)
+        for key in list(self.entries):
+            ids, embeddings = self.entries[key]
+            keep = [i for i, entry_id in enumerate(ids) if entry_id not in entry_ids]
+            if len(keep) == len(ids):
+                continue
+            if keep:
+                self.entries[key] = ([ids[i] for i in keep], embeddings[keep])
+            else:
+                del self.entries[key]
+
+    @staticmethod
+    def normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def get(self, embedding, key: str):
+        """
+        Look up an answer.
+
+        Args:
+            embedding (np.ndarray): Embedding of the question.
+            key (str): Fingerprint of the scene and model settings the answer must match.
+
+        Returns:
+            str | None: The cached answer, or None.
+        """
+        embedding = self.normalize(embedding)
+        with self.lock:
+            ids, embeddings = self.entries.get(key, ([], None))
+            if embeddings is not None:
+                similarities = embeddings @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = self.connection.execute(
+                        "SELECT response, created FROM responses WHERE id = ?", (ids[best],)
+                    ).fetchone()
+                    if row is not None and row[1] >= time.time() - self.ttl:
+                        with self.connection:
+                            self.connection.execute("UPDATE responses SET last_used = ? WHERE id = ?", (time.time(), ids[best]))
+                        self.hits += 1
+                        return row[0]
+                    self.remove_entries([ids[best]])
+            self.misses += 1
+            return None
+
+    def put(self, embedding, key: str, question: str, response: str):
+        """
+        Store an answer, evicting the least recently used and expired entries.
+
+        Args:
+            embedding (np.ndarray): Embedding of the question.
+            key (str): Fingerprint of the scene and model settings.
+            question (str): The question, kept for inspection.
+            response (str): The answer.
+        """
+        embedding = self.normalize(embedding)
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                cursor = self.connection.execute(
+                    "INSERT INTO responses (key, question, embedding, response, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, question, embedding.tobytes(), response, now, now),
+                )
+                self.add_entry(key, cursor.lastrowid, embedding)
+                evicted = [row[0] for row in self.connection.execute(
+                    "SELECT id FROM responses WHERE created < ? UNION "
+                    "SELECT id FROM (SELECT id FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (now - self.ttl, self.max_entries),
+                )]
+                if evicted:
+                    self.connection.executemany("DELETE FROM responses WHERE id = ?", [(entry_id,) for entry_id in evicted])
+                    self.remove_entries(evicted)
+
+    def clear(self):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM responses")
+            self.entries = {}
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": sum(len(ids) for ids, _ in self.entries.values()),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
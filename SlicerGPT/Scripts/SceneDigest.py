@@ -0,0 +1,154 @@
+# Node references that only point to nodes left out of the digest
+SKIPPED_REFERENCE_ROLES = ("display", "storage")
+SKIPPED_NODE_CLASSES = ("vtkMRMLDisplayNode", "vtkMRMLStorageNode")
+
+def describe_node(node) -> str:
+    """
+    One line summary of a MRML node: class, name, ID, key references and a few class specific details.
+
+    Args:
+        node (vtkMRMLNode): The node.
+
+    Returns:
+        str: The summary.
+    """
+    parts = [f'{node.GetClassName()} "{node.GetName()}" [{node.GetID()}]']
+    for i in range(node.GetNumberOfNodeReferenceRoles()):
+        role = node.GetNthNodeReferenceRole(i)
+        if role in SKIPPED_REFERENCE_ROLES:
+            continue
+        ids = [node.GetNthNodeReferenceID(role, n) for n in range(node.GetNumberOfNodeReferences(role))]
+        ids = [node_id for node_id in ids if node_id]
+        if ids:
+            parts.append(f"{role}={','.join(ids)}")
+
+    if node.IsA("vtkMRMLSegmentationNode") and node.GetSegmentation():
+        segmentation = node.GetSegmentation()
+        names = [segmentation.GetNthSegment(i).GetName() for i in range(segmentation.GetNumberOfSegments())]
+        parts.append(f"segments={names}")
+    elif node.IsA("vtkMRMLVolumeNode") and node.GetImageData():
+        parts.append(f"dimensions={list(node.GetImageData().GetDimensions())} spacing={[round(s, 3) for s in node.GetSpacing()]}")
+    elif node.IsA("vtkMRMLMarkupsNode"):
+        parts.append(f"control_points={node.GetNumberOfControlPoints()}")
+    return " ".join(parts)
+
+def digest_nodes(scene):
+    """
+    Nodes of the scene worth describing to the model: display, storage and hidden nodes
+    (views, cameras, selection...) are left out.
+
+    Returns:
+        Dict[str, vtkMRMLNode]: Nodes by ID.
+    """
+    nodes = {}
+    for node in scene.GetNodes():
+        if node.GetHideFromEditors() or any(node.IsA(class_name) for class_name in SKIPPED_NODE_CLASSES):
+            continue
+        nodes[node.GetID()] = node
+    return nodes
+
+
+class SceneDigest:
+    """
+    Slicer side of the scene digest: describes the scene one line per node and only
+    sends the nodes added, modified (by node modification time) or removed since the
+    previous request.
+    """
+
+    def __init__(self):
+        self.sent = {}
+        self.revision = 0
+        # Revision and node modification times of the last delta, until the server accepts it
+        self.pending = None
+
+    def reset(self):
+        """
+        Forget what was sent, the next delta will contain the whole digest.
+        """
+        self.sent = {}
+        self.pending = None
+
+    def commit(self, revision: int):
+        """
+        Mark a delta as received by the server, the next delta starts from it. Until then the
+        deltas are computed from the last committed one, so a failed request loses no change.
+
+        Args:
+            revision (int): The `revision` of the delta.
+        """
+        if self.pending is not None and self.pending[0] == revision:
+            self.revision, self.sent = self.pending
+            self.pending = None
+
+    def delta(self, scene=None) -> dict:
+        """
+        Compute the changes of the scene since the last committed delta.
+
+        Args:
+            scene (vtkMRMLScene): The scene, defaults to `slicer.mrmlScene`.
+
+        Returns:
+            dict: `full` (the delta is the whole digest), `base` and `revision` (revisions the delta goes
+            from and to), `header`, `nodes` (ID to summary of added and modified nodes) and `removed` IDs.
+        """
+        import slicer
+        scene = scene or slicer.mrmlScene
+
+        full = not self.sent
+        nodes = digest_nodes(scene)
+        current = {node_id: node.GetMTime() for node_id, node in nodes.items()}
+        changed = {
+            node_id: describe_node(nodes[node_id])
+            for node_id, mtime in current.items()
+            if self.sent.get(node_id) != mtime
+        }
+        removed = [node_id for node_id in self.sent if node_id not in current]
+
+        self.pending = (self.revision + 1, current)
+        return {
+            "full": full,
+            "base": self.revision,
+            "revision": self.revision + 1,
+            "header": f"3D Slicer {slicer.app.applicationVersion}, {len(nodes)} nodes",
+            "nodes": changed,
+            "removed": removed,
+        }
+
+
+class SceneState:
+    """
+    Server side of the scene digest: rebuilds the complete digest from the deltas.
+    """
+
+    def __init__(self):
+        self.header = ""
+        self.nodes = {}
+        self.revision = 0
+
+    def apply(self, delta: dict) -> bool:
+        """
+        Apply a delta computed by `SceneDigest.delta`.
+
+        Args:
+            delta (dict): The delta.
+
+        Returns:
+            bool: False if the delta does not follow the known revision (e.g. after a server restart),
+            the client must then send a full digest next time.
+        """
+        in_sync = delta.get("full", False) or delta.get("base") == self.revision
+        if delta.get("full"):
+            self.nodes = {}
+        self.nodes.update(delta.get("nodes", {}))
+        for node_id in delta.get("removed", []):
+            self.nodes.pop(node_id, None)
+        self.header = delta.get("header", self.header)
+        self.revision = delta.get("revision", self.revision)
+        return in_sync
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: The digest, one line per node.
+        """
+        return "\n".join([self.header] + [self.nodes[node_id] for node_id in sorted(self.nodes)])
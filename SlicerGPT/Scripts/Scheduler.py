@@ -0,0 +1,238 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+class QueueFullError(Exception):
+    """
+    Raised when a request is submitted while the scheduler queue is full.
+    """
+
+    def __init__(self, depth: int, retry_after: float):
+        super().__init__(f"The request queue is full ({depth} waiting requests)")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class RequestCancelled(Exception):
+    """
+    Raised in the inference worker when a request is cancelled or exceeds its deadline.
+    """
+
+
+class RequestControl:
+    """
+    Cancellation flag and deadline of one request, checked by the model between tokens.
+    """
+
+    def __init__(self, request_id: str, timeout: float = None):
+        """
+        Args:
+            request_id (str): The request ID.
+            timeout (float): Seconds from now after which the request is aborted, None for no deadline.
+        """
+        self.request_id = request_id
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason: str = "cancelled"):
+        self.reason = self.reason or reason
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self.event.is_set() and self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel("deadline exceeded")
+        return self.event.is_set()
+
+    def check(self):
+        """
+        Raises:
+            RequestCancelled: If the request was cancelled or is past its deadline.
+        """
+        if self.cancelled:
+            raise RequestCancelled(f"Request {self.request_id} {self.reason}")
+
+    def stopping_criteria(self, tokens, logits) -> bool:
+        """
+        llama.cpp stopping criteria ending the generation at the next token once cancelled.
+        """
+        return self.cancelled
+
+
+class Job:
+    def __init__(self, session_id: str, fn, control: RequestControl = None):
+        self.session_id = session_id
+        self.fn = fn
+        self.control = control
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+
+class RequestScheduler:
+    """
+    Runs the inference requests one at a time on a worker thread.
+
+    The base model has a single llama.cpp context, so requests are serialized, but in a fair
+    order: every session has its own FIFO queue and the worker takes one request of each
+    session in turn. The total number of waiting requests is bounded, beyond it `submit`
+    raises `QueueFullError` so the server can answer 429 instead of queueing forever.
+    """
+
+    def __init__(self, max_queue: int = 16, history: int = 100):
+        """
+        Args:
+            max_queue (int): Maximum number of waiting requests, all sessions included.
+            history (int): Number of recent requests the wait and service time statistics are computed on.
+        """
+        self.max_queue = max_queue
+        self.queues = OrderedDict()
+        self.depth = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.running_job = None
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.wait_times = deque(maxlen=history)
+        self.service_times = deque(maxlen=history)
+        self.worker = threading.Thread(target=self.run, name="inference-worker", daemon=True)
+        self.worker.start()
+
+    def submit(self, session_id: str, fn, control: RequestControl = None) -> Future:
+        """
+        Queue a request.
+
+        Args:
+            session_id (str): Session the request belongs to.
+            fn (Callable[[], Any]): The work, run on the worker thread.
+            control (RequestControl): Cancellation and deadline of the request.
+
+        Returns:
+            Future: Resolved with the result of `fn`.
+        """
+        with self.condition:
+            if self.depth >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(self.depth, self.estimated_wait())
+            job = Job(session_id, fn, control)
+            self.queues.setdefault(session_id, deque()).append(job)
+            self.depth += 1
+            self.condition.notify()
+            return job.future
+
+    def next_job(self) -> Job:
+        # Round robin: the session served goes to the back of the line if it has more requests
+        session_id, queue = next(iter(self.queues.items()))
+        job = queue.popleft()
+        if queue:
+            self.queues.move_to_end(session_id)
+        else:
+            del self.queues[session_id]
+        self.depth -= 1
+        return job
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.depth:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                job = self.next_job()
+
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            with self.condition:
+                self.running_job = job
+            try:
+                if job.control is not None:
+                    # Expired or cancelled while waiting in the queue
+                    job.control.check()
+                job.future.set_result(job.fn())
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                with self.condition:
+                    self.running_job = None
+                    if job.control is not None and job.control.cancelled:
+                        self.cancelled += 1
+                    self.completed += 1
+                    self.wait_times.append(started - job.submitted)
+                    self.service_times.append(time.monotonic() - started)
+
+    def jobs(self):
+        """
+        Returns:
+            List[Job]: The running job and the waiting ones. Must be called with the condition held.
+        """
+        jobs = [job for queue in self.queues.values() for job in queue]
+        return jobs + [self.running_job] if self.running_job is not None else jobs
+
+    def cancel(self, request_id: str = None, session_id: str = None, reason: str = "cancelled") -> int:
+        """
+        Cancel the requests with this ID, or all the requests of a session.
+        A running request stops at its next token, a waiting one fails as soon as the worker reaches it.
+
+        Returns:
+            int: Number of requests cancelled.
+        """
+        with self.condition:
+            matching = [
+                job for job in self.jobs()
+                if job.control is not None and (job.control.request_id == request_id or
+                                                (session_id is not None and job.session_id == session_id))
+            ]
+        for job in matching:
+            job.control.cancel(reason)
+        return len(matching)
+
+    def cancel_all(self, reason: str = "cancelled") -> int:
+        with self.condition:
+            jobs = [job for job in self.jobs() if job.control is not None]
+        for job in jobs:
+            job.control.cancel(reason)
+        return len(jobs)
+
+    def estimated_wait(self) -> float:
+        """
+        Returns:
+            float: Seconds before a request submitted now would start, from the recent service times.
+        """
+        service_time = sum(self.service_times) / len(self.service_times) if self.service_times else 1.0
+        return service_time * (self.depth + 1)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Queue depth, sessions waiting, completed and rejected counts, and recent wait times in seconds.
+        """
+        with self.condition:
+            waits = sorted(self.wait_times)
+            return {
+                "depth": self.depth,
+                "max_queue": self.max_queue,
+                "sessions_waiting": len(self.queues),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "running": self.running_job is not None,
+                "wait_mean_s": sum(waits) / len(waits) if waits else 0.0,
+                "wait_p95_s": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+                "estimated_wait_s": self.estimated_wait(),
+            }
+
+    def shutdown(self):
+        with self.condition:
+            self.running = False
+            for job in self.jobs():
+                if job.control is not None:
+                    job.control.cancel("server shutting down")
+            for queue in self.queues.values():
+                for job in queue:
+                    job.future.cancel()
+            self.queues.clear()
+            self.depth = 0
+            self.condition.notify_all()
@@ -0,0 +1,70 @@
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_SESSION = "default"
+
+class Session:
+    """
+    Conversation state of one client: its history and the scene rebuilt from its digest deltas.
+    """
+
+    def __init__(self, session_id: str, conversation, scene):
+        """
+        Args:
+            session_id (str): The session ID chosen by the client.
+            conversation (ConversationHistory): The conversation history.
+            scene (SceneState): The scene digest of the client.
+        """
+        self.session_id = session_id
+        self.conversation = conversation
+        self.scene = scene
+        self.scene_in_sync = True
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """
+    Thread-safe store of the sessions, evicting the least recently used ones beyond
+    `max_sessions` and the ones idle for more than `ttl` seconds.
+    """
+
+    def __init__(self, factory, max_sessions: int = 32, ttl: float = 24 * 3600):
+        """
+        Args:
+            factory (Callable[[str], Session]): Creates the session of an unknown ID.
+            max_sessions (int): Maximum number of sessions kept.
+            ttl (float): Idle time in seconds after which a session is dropped.
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id: str = None) -> Session:
+        """
+        Returns:
+            Session: The session of this ID, created if needed.
+        """
+        session_id = session_id or DEFAULT_SESSION
+        now = time.monotonic()
+        with self.lock:
+            for expired in [key for key, session in self.sessions.items() if now - session.last_used > self.ttl]:
+                del self.sessions[expired]
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                session = self.factory(session_id)
+            session.last_used = now
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return session
+
+    def remove(self, session_id: str) -> bool:
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
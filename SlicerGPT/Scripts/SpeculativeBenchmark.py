@@ -0,0 +1,103 @@
+"""
+Decoding speed and output equality of the speculative decoding modes, against normal decoding.
+
+Every prompt is a question with its retrieved context documents, like the ones `Model` builds,
+answered greedily so that speculative decoding must reproduce the normal answer token for token.
+
+Usage (from the Scripts directory):
+    python SpeculativeBenchmark.py --modes none lookup --max-tokens 256
+    python SpeculativeBenchmark.py --modes none draft --draft-repo <repo> --draft-file <file>.gguf
+"""
+import os
+import time
+import argparse
+import numpy as np
+from llama_cpp import Llama
+import LlamaCalibration
+from IndexBenchmark import PROMPTS
+from SpeculativeDecoding import SPECULATIVE_MODES, create_draft_model
+from VectorStoreManager import VectorStoreManager
+
+def build_prompts(manager, questions, k: int):
+    """
+    Returns:
+        List[List[dict]]: Chat messages of every question, with its context documents.
+    """
+    prompts = []
+    for question, docs in zip(questions, manager.search_many(questions, k=k)):
+        context = "\n---\n".join(doc.page_content for doc in docs)
+        prompts.append([
+            {"role": "system", "content": "You are an expert 3D Slicer technical assistant."},
+            {"role": "user", "content": f"Context documents:\n{context}\n\nUser question: {question} /no_think"},
+        ])
+    return prompts
+
+def run(llm, prompts, max_tokens: int):
+    """
+    Answer every prompt, timing the prompt evaluation (first token) apart from the decoding.
+
+    Returns:
+        Tuple[List[str], float, float]: The answers, decoding speed in tokens per second and mean first token latency.
+    """
+    answers, decoded_tokens, decode_time, first_token = [], 0, 0.0, []
+    for messages in prompts:
+        llm.reset()
+        start = time.perf_counter()
+        first = None
+        chunks = []
+        for chunk in llm.create_chat_completion(messages=messages, temperature=0.0, max_tokens=max_tokens, stream=True):
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                first = first or time.perf_counter()
+                chunks.append(content)
+        end = time.perf_counter()
+        answer = "".join(chunks)
+        answers.append(answer)
+        if first is not None:
+            first_token.append(first - start)
+            # The first token comes with the prompt evaluation
+            decoded_tokens += max(len(llm.tokenize(answer.encode("utf-8"), add_bos=False)) - 1, 0)
+            decode_time += end - first
+    return answers, decoded_tokens / decode_time if decode_time else 0.0, float(np.mean(first_token or [0.0]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default="unsloth/Qwen3-0.6B-GGUF")
+    parser.add_argument("--file", default="Qwen3-0.6B-Q8_0.gguf")
+    parser.add_argument("--modes", nargs="+", default=["none", "lookup"], choices=["none", *SPECULATIVE_MODES])
+    parser.add_argument("--num-pred-tokens", type=int, nargs="+", default=[10])
+    parser.add_argument("--draft-repo")
+    parser.add_argument("--draft-file")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--prompts", type=int, default=len(PROMPTS))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--index-root", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "SlicerFAISS"))
+    args = parser.parse_args()
+
+    prompts = build_prompts(VectorStoreManager(args.index_root), PROMPTS[:args.prompts], args.k)
+    params = LlamaCalibration.load_params(args.file)
+
+    reference = None
+    baseline = None
+    print(f"{len(prompts)} prompts, {args.max_tokens} tokens max, greedy decoding")
+    print(f"{'mode':<8}{'draft':>7}{'tok/s':>10}{'speedup':>9}{'first s':>9}{'identical':>11}")
+    for mode in args.modes:
+        for num_pred_tokens in ([None] if mode == "none" else args.num_pred_tokens):
+            draft_model = None
+            if mode != "none":
+                draft_model = create_draft_model(mode, num_pred_tokens, args.draft_repo, args.draft_file, **params)
+            llm = Llama.from_pretrained(repo_id=args.repo, filename=args.file, verbose=False, n_gpu_layers=-1,
+                                        draft_model=draft_model, logits_all=draft_model is not None, **params)
+            try:
+                answers, speed, first_token = run(llm, prompts, args.max_tokens)
+            finally:
+                llm.close()
+
+            if reference is None:
+                reference, baseline = answers, speed
+            identical = sum(answer == expected for answer, expected in zip(answers, reference))
+            print(f"{mode:<8}{num_pred_tokens or '-':>7}{speed:>10.1f}{speed / baseline if baseline else 0.0:>8.2f}x"
+                  f"{first_token:>9.2f}{identical:>6}/{len(prompts)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+# "lookup" drafts the continuation of the last n-gram from an earlier occurrence in the prompt,
+# "draft" asks a small GGUF model sharing the tokenizer of the base model
+SPECULATIVE_MODES = ("lookup", "draft")
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    Draft model of llama.cpp speculative decoding backed by a small GGUF model.
+
+    The draft model greedily proposes `num_pred_tokens` tokens, the base model evaluates them
+    in one batch and keeps the ones it would have sampled itself, so the answer is unchanged.
+    The draft KV cache is reused across calls through the `generate` prefix matching, only the
+    tokens accepted since the previous call are evaluated.
+    """
+
+    def __init__(self, llm: Llama, num_pred_tokens: int = 8):
+        """
+        Args:
+            llm (Llama): The draft model, with the same vocabulary as the base model.
+            num_pred_tokens (int): Number of tokens proposed at every step.
+        """
+        self.llm = llm
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = []
+        eos = self.llm.token_eos()
+        for token in self.llm.generate(input_ids.tolist(), temp=0.0):
+            if token == eos:
+                break
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return np.array(draft, dtype=np.intc)
+
+
+def create_draft_model(mode: str, num_pred_tokens: int = 10, draft_model_name: str = None,
+                       draft_file_name: str = None, **llama_params) -> LlamaDraftModel:
+    """
+    Create the draft model given to `Llama(draft_model=...)`.
+
+    Args:
+        mode (str): One of SPECULATIVE_MODES, or None to disable speculative decoding.
+        num_pred_tokens (int): Number of tokens drafted at every step.
+        draft_model_name (str): HuggingFace repository of the draft GGUF ("draft" mode).
+        draft_file_name (str): GGUF file of the repository.
+        **llama_params: Runtime parameters of the draft model (n_ctx, n_threads...).
+
+    Returns:
+        LlamaDraftModel | None: The draft model.
+    """
+    if mode is None:
+        return None
+    if mode == "lookup":
+        # Answers copy API names, menu paths and script lines from the retrieved context
+        return LlamaPromptLookupDecoding(max_ngram_size=3, num_pred_tokens=num_pred_tokens)
+    if mode == "draft":
+        if not draft_model_name or not draft_file_name:
+            raise ValueError("The draft speculative mode needs a draft model repository and file")
+        llm = Llama.from_pretrained(repo_id=draft_model_name, filename=draft_file_name, verbose=False, **llama_params)
+        return GGUFDraftModel(llm, num_pred_tokens)
+    raise ValueError(f"Unknown speculative mode {mode}, expected one of {SPECULATIVE_MODES}")
+
+def scores_memory(n_ctx: int, n_vocab: int) -> int:
+    """
+    Speculative decoding needs the logits of every evaluated token: llama-cpp-python
+    then keeps an (n_ctx, n_vocab) float32 array.
+
+    Returns:
+        int: Size of the array in bytes.
+    """
+    return n_ctx * n_vocab * 4
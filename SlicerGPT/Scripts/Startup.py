@@ -0,0 +1,65 @@
+import time
+import threading
+from concurrent.futures import Future
+
+class StartupStages:
+    """
+    Progress of the server initialization, loaded in background threads while the server
+    already answers: every stage is "pending", "loading", "ready" or "failed", with its timings.
+    """
+
+    def __init__(self, names):
+        """
+        Args:
+            names (List[str]): The stages, in the order they are reported.
+        """
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stages = {name: {"status": "pending"} for name in names}
+
+    def run(self, name: str, fn, *args) -> Future:
+        """
+        Run a stage in a new thread.
+
+        Args:
+            name (str): The stage.
+            fn (Callable): The loading work, called with `args`.
+
+        Returns:
+            Future: Resolved with the result of `fn`, or its exception.
+        """
+        future = Future()
+
+        def target():
+            start = time.time()
+            with self.lock:
+                self.stages[name] = {"status": "loading", "started_s": start - self.started}
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                with self.lock:
+                    self.stages[name].update(status="failed", error=str(e), elapsed_s=time.time() - start)
+                future.set_exception(e)
+            else:
+                with self.lock:
+                    self.stages[name].update(status="ready", elapsed_s=time.time() - start)
+                future.set_result(result)
+
+        threading.Thread(target=target, name=f"startup-{name}", daemon=True).start()
+        return future
+
+    def is_ready(self, *names) -> bool:
+        with self.lock:
+            return all(self.stages[name]["status"] == "ready" for name in names)
+
+    def failed(self) -> bool:
+        with self.lock:
+            return any(stage["status"] == "failed" for stage in self.stages.values())
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: Copy of every stage status and timings, in seconds since the server start.
+        """
+        with self.lock:
+            return {name: dict(stage) for name, stage in self.stages.items()}
@@ -0,0 +1,233 @@
+"""
+Per-request traces: nested timed spans of the request stages, and an optional sampling profiler.
+
+A trace is activated on the thread running the request, the code then opens spans with
+`span(...)` or `start_span(...)` without passing the trace around. They do nothing when the
+thread has no active trace, so the instrumented code costs nothing for untraced requests.
+"""
+import os
+import sys
+import time
+import threading
+from collections import deque, Counter
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Span:
+    def __init__(self, trace, name: str, parent, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, **attributes):
+        if self.end is None:
+            self.attributes.update(attributes)
+            self.end = time.perf_counter()
+            self.trace.stack.remove(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            "start_ms": (self.start - origin) * 1000,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+
+class NullSpan:
+    """
+    Span of an untraced thread.
+    """
+
+    def set(self, **attributes):
+        pass
+
+    def finish(self, **attributes):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Trace:
+    def __init__(self, request_id: str, **attributes):
+        """
+        Args:
+            request_id (str): The request ID.
+            **attributes: Request attributes reported with the trace (session, model...).
+        """
+        self.request_id = request_id
+        self.created = time.time()
+        self.root = Span(self, "request", None, attributes)
+        self.stack = [self.root]
+        self.profile = None
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """
+        Open a child span of the innermost open span. It must be closed with `finish`.
+        """
+        parent = self.stack[-1]
+        span = Span(self, name, parent, attributes)
+        parent.children.append(span)
+        self.stack.append(span)
+        return span
+
+    def finish(self, **attributes):
+        for span in reversed(self.stack[1:]):
+            span.finish()
+        self.root.finish(**attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def summary(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "created": self.created,
+            "duration_ms": self.duration_ms,
+            "attributes": self.root.attributes,
+            # Time of every top level stage, the first thing to look at in a slow request
+            "stages_ms": {span.name: span.duration_ms for span in self.root.children},
+            "profile": self.profile,
+        }
+
+    def to_dict(self) -> dict:
+        return {**self.summary(), "spans": self.root.to_dict(self.root.start)}
+
+
+def current():
+    """
+    Returns:
+        Trace | None: The trace active on this thread.
+    """
+    return getattr(_local, "trace", None)
+
+@contextmanager
+def activate(trace: Trace):
+    """
+    Make `trace` the active trace of this thread, None to run untraced.
+    """
+    previous = current()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+def start_span(name: str, **attributes):
+    """
+    Returns:
+        Span | NullSpan: A span of the active trace to close with `finish`, a no-op span without trace.
+    """
+    trace = current()
+    return trace.start_span(name, **attributes) if trace is not None else NULL_SPAN
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the enclosed block as a span of the active trace.
+    """
+    opened = start_span(name, **attributes)
+    try:
+        yield opened
+    except BaseException as e:
+        opened.set(error=type(e).__name__)
+        raise
+    finally:
+        opened.finish()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of one thread: samples its Python stack every `interval` seconds from
+    another thread and counts the collapsed stacks, the "folded" format read by flamegraph.pl,
+    speedscope or inferno.
+    """
+
+    def __init__(self, thread_id: int = None, interval: float = 0.005):
+        """
+        Args:
+            thread_id (int): Identifier of the profiled thread, defaults to the calling thread.
+            interval (float): Sampling period in seconds.
+        """
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.folded())
+
+
+class TraceStore:
+    """
+    Bounded ring buffer of the finished traces.
+    """
+
+    def __init__(self, max_traces: int = 100):
+        self.traces = deque(maxlen=max_traces)
+        self.lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self.lock:
+            self.traces.append(trace)
+
+    def list(self, min_duration_ms: float = 0.0, limit: int = 20):
+        """
+        Returns:
+            List[dict]: Summaries of the most recent traces lasting at least `min_duration_ms`, newest first.
+        """
+        with self.lock:
+            traces = [trace for trace in reversed(self.traces) if trace.duration_ms >= min_duration_ms]
+        return [trace.summary() for trace in traces[:limit]]
+
+    def get(self, request_id: str):
+        with self.lock:
+            for trace in self.traces:
+                if trace.request_id == request_id:
+                    return trace.to_dict()
+        return None
@@ -1,26 +1,112 @@
+class SceneSerializer:
+    """
+    Serializes a MRML scene to an XML string in memory, without the temporary file round trip.
+
+    The XML is cached and reused while no node of the scene was modified (MTimes unchanged),
+    scene observers drop the cache when nodes are added or removed or the scene is closed or loaded.
+    """
+
+    def __init__(self, scene=None):
+        """
+        Args:
+            scene (vtkMRMLScene): The scene, defaults to `slicer.mrmlScene`.
+        """
+        import slicer
+        self.scene = scene or slicer.mrmlScene
+        self.cached_text = None
+        self.cached_mtime = None
+        self.observers = [
+            self.scene.AddObserver(event, self.invalidate)
+            for event in (
+                self.scene.NodeAddedEvent, self.scene.NodeRemovedEvent,
+                self.scene.EndCloseEvent, self.scene.EndImportEvent, self.scene.EndRestoreEvent,
+            )
+        ]
+
+    def invalidate(self, caller=None, event=None):
+        self.cached_text = None
+        self.cached_mtime = None
+
+    def scene_mtime(self) -> int:
+        """
+        Returns:
+            int: The most recent modification time of the scene and its nodes.
+        """
+        return max([self.scene.GetMTime()] + [node.GetMTime() for node in self.scene.GetNodes()])
+
+    def commit_to_string(self) -> str:
+        self.scene.SetSaveToXMLString(1)
+        try:
+            self.scene.Commit()
+            return self.scene.GetSceneXMLString()
+        finally:
+            self.scene.SetSaveToXMLString(0)
+
+    def commit_to_file(self) -> str:
+        """
+        Fallback for Slicer versions without in-memory serialization.
+        """
+        import tempfile
+        import os
+
+        temp_file = tempfile.NamedTemporaryFile(suffix=".mrml", delete=False)
+        temp_file_path = temp_file.name
+        temp_file.close()
+
+        try:
+            self.scene.Commit(temp_file_path)
+
+            with open(temp_file_path, 'r', encoding='utf-8') as file:
+                return file.read()
+        finally:
+            os.remove(temp_file_path)
+
+    def text(self) -> str:
+        """
+        Returns:
+            str: The scene as MRML XML, from the cache when the scene did not change.
+        """
+        mtime = self.scene_mtime()
+        if self.cached_text is not None and mtime == self.cached_mtime:
+            return self.cached_text
+
+        if hasattr(self.scene, "GetSceneXMLString"):
+            text = self.commit_to_string()
+        else:
+            text = self.commit_to_file()
+        # Toggling SaveToXMLString modifies the scene, the time is taken after it
+        self.cached_text = text
+        self.cached_mtime = self.scene_mtime()
+        return text
+
+    def cleanup(self):
+        for observer in self.observers:
+            self.scene.RemoveObserver(observer)
+        self.observers = []
+        self.invalidate()
+
+
+scene_serializer = None
 
 def extract_mrml_scene_as_text():
     """
     Extracts the current MRML scene in 3D Slicer, converts it to XML format,
     and returns the content as a string. Useful for injecting into an LLM via RAG.
+    The XML is serialized in memory and cached until the scene is modified.
     """
-    import slicer
-    import tempfile
-    import os
-
-    temp_file = tempfile.NamedTemporaryFile(suffix=".mrml", delete=False)
-    temp_file_path = temp_file.name
-    temp_file.close()
-
-    try:
-        slicer.mrmlScene.Commit(temp_file_path)
+    global scene_serializer
+    if scene_serializer is None:
+        scene_serializer = SceneSerializer()
+    return scene_serializer.text()
 
-        with open(temp_file_path, 'r', encoding='utf-8') as file:
-            mrml_text = file.read()
-
-        return mrml_text
-    finally:
-        os.remove(temp_file_path)
+def release_scene_serializer():
+    """
+    Remove the scene observers of the cached serializer.
+    """
+    global scene_serializer
+    if scene_serializer is not None:
+        scene_serializer.cleanup()
+        scene_serializer = None
 
 def markdown_to_html(content: str) -> str:
     import re
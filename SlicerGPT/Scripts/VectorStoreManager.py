@@ -1,31 +1,402 @@
 # pip install langchain langchain_community langchain_huggingface faiss-cpu
 import os
+import time
+import uuid
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from QueryCache import LRUCache, normalize_query
+from IndexStore import IndexStore, compute_fingerprint, read_fingerprint
+import AnnIndex
+import Metrics
+from Embeddings import create_embeddings
+
+MERGED_STORE = "merged"
+RETRIEVAL_MODES = ("dense", "hybrid")
+# Reciprocal rank fusion constant, 60 is the value of the original paper
+RRF_K = 60
 
 class VectorStoreManager:
-    def __init__(self, index_root: str, embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, index_root: str, embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 merged_index_path: str = None, mmap: bool = False,
+                 index_type: str = "flat", search_params: dict = None,
+                 embedding_cache_bytes: int = 8 * 1024 * 1024, result_cache_bytes: int = 1024 * 1024,
+                 sharded: bool = False, shard_index_path: str = None, max_workers: int = None,
+                 compaction_threshold: int = 1000, retrieval_mode: str = "dense",
+                 embedding_backend: str = "huggingface", embedding_options: dict = None, embeddings=None):
         """
         Initialize the vector store manager.
 
         Args:
             index_root (str): Path to the directory containing all FAISS sub-indexes.
             embedding_model (str): HuggingFace model name used to generate embeddings.
+            merged_index_path (str): Directory where the pre-merged index is persisted.
+                Defaults to a `SlicerFAISSMerged` directory next to `index_root`.
+            mmap (bool): Memory-map the merged vectors read-only instead of loading them in the heap,
+                so several server processes share the same physical pages. Only supported by the flat index.
+            index_type (str): Vector index used for search, one of `AnnIndex.INDEX_TYPES`
+                ("flat" is exact search, the others are approximate and built once from it).
+            search_params (dict): Search-time parameters of the index, e.g. {"nprobe": 16} or {"efSearch": 128}.
+            embedding_cache_bytes (int): Size budget of the query embedding LRU cache.
+            result_cache_bytes (int): Size budget of the (query, k) -> hits LRU cache.
+            sharded (bool): Keep every sub-index as its own shard instead of merging them,
+                shards are searched in parallel and can be filtered by source.
+            shard_index_path (str): Directory where the persisted shards are kept.
+                Defaults to a `SlicerFAISSShards` directory next to `index_root`.
+            max_workers (int): Size of the shard fan-out thread pool. Defaults to one thread per shard.
+            compaction_threshold (int): Number of pending added/deleted documents in a store
+                that triggers a background compaction.
+            retrieval_mode (str): Default retrieval mode, "dense" (embeddings only) or "hybrid"
+                (embeddings fused with BM25 by reciprocal rank fusion).
+            embedding_backend (str): Query embedding backend, one of `Embeddings.EMBEDDING_BACKENDS`.
+                "onnx" runs the int8 quantized export of the same model on ONNX Runtime, without torch,
+                and stays searchable against indexes built with "huggingface".
+            embedding_options (dict): Extra keyword arguments of the embedding backend.
+            embeddings (Embeddings): An already created embedder of `embedding_model`, e.g. a
+                `DeferredEmbeddings` loading concurrently with the index. Overrides the backend options.
         """
+        if index_type not in AnnIndex.INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {AnnIndex.INDEX_TYPES}")
+        if mmap and index_type != "flat":
+            raise ValueError("Memory mapping is only supported with the flat index type.")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}', expected one of {RETRIEVAL_MODES}")
+
         self.index_root = index_root
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+        self.embedding_model = embedding_model
+        data_dir = os.path.dirname(os.path.normpath(index_root))
+        self.merged_index_path = merged_index_path or os.path.join(data_dir, "SlicerFAISSMerged")
+        self.shard_index_path = shard_index_path or os.path.join(data_dir, "SlicerFAISSShards")
+        self.mmap = mmap
+        self.index_type = index_type
+        self.search_params = search_params or {}
+        self.sharded = sharded
+        self.max_workers = max_workers
+        self.executor = None
+        self.executor_workers = 0
+        self.compaction_threshold = compaction_threshold
+        self.update_lock = threading.Lock()
+        self.compaction_thread = None
+        # Error of the last background compaction, None once one succeeds
+        self.compaction_error = None
+        self.retrieval_mode = retrieval_mode
+
+        self.embedding_backend = embedding_backend
+        self.embeddings = embeddings or create_embeddings(embedding_backend, embedding_model, **(embedding_options or {}))
         self.index = None
+        self.stores = {}
+        # Guards the swap of `stores` and the cache generation against searches taking their snapshot
+        self.stores_lock = threading.RLock()
+        # Bumped by every index change, cached hits of another generation are stale
+        self.cache_generation = 0
+        self.embedding_cache = LRUCache(embedding_cache_bytes, sizeof=lambda vector: vector.nbytes)
+        self.result_cache = LRUCache(result_cache_bytes, sizeof=lambda entry: 64 * (len(entry[1]) + 1))
+        self.load_index()
+
+    def list_index_dirs(self):
+        """
+        List the FAISS sub-index directories in a stable order.
+
+        Returns:
+            List[str]: Sorted paths of the sub-index directories.
+        """
+        return sorted(
+            os.path.join(self.index_root, d)
+            for d in os.listdir(self.index_root)
+            if os.path.isdir(os.path.join(self.index_root, d))
+        )
+
+    def compute_fingerprint(self) -> str:
+        """
+        Hash the content of every sub-index together with the embedding model name.
+
+        Returns:
+            str: Hex digest identifying the current set of sub-indexes.
+        """
+        return compute_fingerprint(self.list_index_dirs(), self.embedding_model)
+
+    def load_index(self):
+        """
+        Load the merged index, or every shard in sharded mode.
+        """
+        if self.sharded:
+            self.load_shards()
+        else:
+            self.load_merged()
+
+    def load_merged(self):
+        """
+        Load the persisted merged index if it matches the current sub-indexes,
+        otherwise merge the sub-indexes and persist the result for the next start.
+        """
+        fingerprint = self.compute_fingerprint()
+
+        if read_fingerprint(self.merged_index_path) == fingerprint:
+            try:
+                self.set_stores({MERGED_STORE: self.open_store(MERGED_STORE, self.merged_index_path)})
+                print(f"Loaded merged index from: {self.merged_index_path}")
+                return
+            except Exception as e:
+                print(f"Could not load the merged index ({e}), rebuilding it...")
+
         self.load_and_merge_indexes()
+        try:
+            self.save_merged_index(self.merged_index_path, fingerprint)
+        except OSError as e:
+            print(f"Could not persist the merged index ({e}), it will be rebuilt on next start.")
+            self.set_stores({MERGED_STORE: IndexStore.from_langchain(MERGED_STORE, self.index)})
+            return
+
+        # Drop the unpickled copy built while merging and switch to the persisted format
+        self.set_stores({MERGED_STORE: self.open_store(MERGED_STORE, self.merged_index_path)})
+        self.index = None
+
+    def load_shards(self):
+        """
+        Load one store per sub-index directory, rebuilding only the shards whose source changed.
+        """
+        names = [os.path.basename(d) for d in self.list_index_dirs()]
+        if not names:
+            raise ValueError(f"No FAISS indexes found in {self.index_root}")
+        self.set_stores({name: self.build_shard(name) for name in names})
+
+    def reload_shard(self, name: str):
+        """
+        Add, hot-swap or remove a single shard after its sub-index directory changed,
+        without touching the other shards.
+
+        Args:
+            name (str): Name of the sub-index directory under `index_root`.
+        """
+        if not self.sharded:
+            raise RuntimeError("reload_shard() requires the sharded mode.")
+        stores = dict(self.stores)
+        if os.path.isdir(os.path.join(self.index_root, name)):
+            stores[name] = self.build_shard(name)
+        else:
+            stores.pop(name, None)
+        self.set_stores(stores)
+
+    def build_shard(self, name: str):
+        """
+        Open the persisted copy of one sub-index, converting it first if it is missing or stale.
+
+        Args:
+            name (str): Name of the sub-index directory under `index_root`.
+
+        Returns:
+            IndexStore: The shard.
+        """
+        source_dir = os.path.join(self.index_root, name)
+        shard_path = os.path.join(self.shard_index_path, name)
+        fingerprint = compute_fingerprint([source_dir], self.embedding_model)
+
+        if read_fingerprint(shard_path) == fingerprint:
+            try:
+                return self.open_store(name, shard_path)
+            except Exception as e:
+                print(f"Could not load shard {name} ({e}), rebuilding it...")
+
+        store = FAISS.load_local(source_dir, self.embeddings, allow_dangerous_deserialization=True)
+        try:
+            os.makedirs(self.shard_index_path, exist_ok=True)
+            # A loaded shard being replaced may still be searched, it deletes its version once retired
+            IndexStore.persist(store, shard_path, fingerprint, self.embedding_model, keep_previous=name in self.stores)
+        except OSError as e:
+            print(f"Could not persist shard {name} ({e}), it will be rebuilt on next start.")
+            return IndexStore.from_langchain(name, store)
+        print(f"Shard saved to: {shard_path}")
+        return self.open_store(name, shard_path)
+
+    def open_store(self, name: str, path: str):
+        store = IndexStore.open(name, path, mmap=self.mmap, index_type=self.index_type, search_params=self.search_params)
+        if self.retrieval_mode == "hybrid":
+            store.lexical_index()
+        return store
+
+    def set_stores(self, stores: dict):
+        """
+        Swap the searchable stores and drop the results cached for the previous ones.
+
+        Args:
+            stores (Dict[str, IndexStore]): Stores by name.
+        """
+        with self.stores_lock:
+            replaced = [store for store in self.stores.values() if all(store is not new for new in stores.values())]
+            self.stores = stores
+            self.invalidate_caches()
+            if self.executor is not None and (self.max_workers or len(stores)) > self.executor_workers:
+                # Searches in progress keep their queued work, the next ones use a larger pool
+                self.executor.shutdown(wait=False)
+                self.executor = None
+        # Replaced stores are closed when the last in-flight search releases them
+        for store in replaced:
+            store.retire()
+
+    def update_store(self, source: str = None):
+        """
+        Args:
+            source (str): Shard to update, required in sharded mode.
+
+        Returns:
+            IndexStore: The store receiving document updates.
+        """
+        if not self.sharded:
+            if source is not None:
+                raise ValueError("Updating a source requires the sharded mode.")
+            source = MERGED_STORE
+        elif source is None:
+            raise ValueError(f"A source is required in sharded mode, available: {sorted(self.stores)}")
+        if source not in self.stores:
+            raise ValueError(f"Unknown source {source}, available: {sorted(self.stores)}")
+        return self.stores[source]
+
+    def add_documents(self, documents, ids=None, source: str = None):
+        """
+        Add documents to the delta segment of a store. They are searchable immediately
+        and persisted on disk, so a server restart picks them up without a rebuild.
+
+        Documents added or deleted this way live in the persisted store only: they are lost
+        if the source sub-indexes change and the store is rebuilt from them.
+
+        Args:
+            documents (List[Document]): Documents to add.
+            ids (List[str]): Docstore ids of the documents, generated if omitted.
+            source (str): Shard to add the documents to, required in sharded mode.
+
+        Returns:
+            List[str]: The docstore ids of the added documents.
+        """
+        documents = list(documents)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in documents]
+        if len(ids) != len(documents):
+            raise ValueError("`ids` and `documents` must have the same length.")
+        vectors = np.asarray(self.embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+        with self.update_lock:
+            store = self.update_store(source)
+            store.add(list(zip(ids, documents)), vectors)
+            self.invalidate_caches()
+        self.maybe_compact(store.name)
+        return ids
+
+    def delete_documents(self, ids, source: str = None) -> int:
+        """
+        Delete documents by docstore id. Main-segment documents are hidden with a tombstone
+        until the next compaction.
+
+        Args:
+            ids (List[str]): Docstore ids to delete.
+            source (str): Shard holding the documents, required in sharded mode.
+
+        Returns:
+            int: Number of documents deleted.
+        """
+        with self.update_lock:
+            store = self.update_store(source)
+            deleted = store.delete(ids)
+            self.invalidate_caches()
+        self.maybe_compact(store.name)
+        return deleted
+
+    def maybe_compact(self, name: str):
+        if self.stores[name].pending_updates() >= self.compaction_threshold:
+            self.compact(name if self.sharded else None, background=True)
+
+    def compact(self, source: str = None, background: bool = True):
+        """
+        Fold pending additions and tombstones into the main segment of a store and reopen it.
+
+        Args:
+            source (str): Shard to compact, required in sharded mode.
+            background (bool): Run the compaction on a background thread. Searches keep using
+                the current store meanwhile, updates wait for the compaction to finish.
+                A failed background compaction is kept in `compaction_error`, its updates stay pending.
+
+        Returns:
+            threading.Thread | None: The compaction thread when running in the background.
+
+        Raises:
+            Exception: The compaction error, when not running in the background.
+        """
+        name = self.update_store(source).name
+
+        def compact_store():
+            with self.update_lock:
+                store = self.stores[name]
+                if not store.pending_updates():
+                    return
+                start = time.time()
+                store.compact()
+                stores = dict(self.stores)
+                stores[name] = self.open_store(name, store.path)
+                self.set_stores(stores)
+                self.compaction_error = None
+                print(f"Compacted {name} in {time.time() - start:.2f} seconds")
+
+        def run():
+            try:
+                compact_store()
+            except Exception as e:
+                self.compaction_error = e
+                print(f"Compaction of {name} failed ({e}), its updates stay in the delta segment.")
+
+        if not background:
+            compact_store()
+            return None
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return self.compaction_thread
+        self.compaction_thread = threading.Thread(target=run, name=f"compact-{name}", daemon=True)
+        self.compaction_thread.start()
+        return self.compaction_thread
+
+    def invalidate_caches(self, embeddings: bool = False):
+        """
+        Drop cached search results. Must be called whenever the index content changes.
+
+        Args:
+            embeddings (bool): Also drop cached query embeddings (only needed if the embedder changes).
+        """
+        with self.stores_lock:
+            self.cache_generation += 1
+            self.result_cache.clear()
+        if embeddings:
+            self.embedding_cache.clear()
+
+    def cache_stats(self) -> dict:
+        """
+        Returns:
+            dict: Hit/miss counters and sizes of the embedding and result caches.
+        """
+        return {"embeddings": self.embedding_cache.stats(), "results": self.result_cache.stats()}
+
+    def embed_queries(self, queries):
+        """
+        Embed normalized queries, reusing cached vectors and encoding the others in one batch.
+
+        Args:
+            queries (List[str]): Normalized query texts.
+
+        Returns:
+            np.ndarray: The float32 query embeddings, one row per query.
+        """
+        vectors = [self.embedding_cache.get(query) for query in queries]
+        missing = [query for query, vector in zip(queries, vectors) if vector is None]
+        if missing:
+            start = time.perf_counter()
+            batch = np.asarray(self.embeddings.embed_documents(missing), dtype=np.float32)
+            Metrics.QUERY_EMBEDDING_SECONDS.observe(time.perf_counter() - start)
+            encoded = {query: vector.copy() for query, vector in zip(missing, batch)}
+            for query, vector in encoded.items():
+                self.embedding_cache.put(query, vector)
+            vectors = [vector if vector is not None else encoded[query] for query, vector in zip(queries, vectors)]
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
 
     def load_and_merge_indexes(self):
         """
         Load all FAISS sub-indexes from the specified directory and merge them into a single index.
         """
-        index_dirs = [
-            os.path.join(self.index_root, d) 
-            for d in os.listdir(self.index_root) 
-            if os.path.isdir(os.path.join(self.index_root, d))
-        ]
+        index_dirs = self.list_index_dirs()
 
         if not index_dirs:
             raise ValueError(f"No FAISS indexes found in {self.index_root}")
@@ -38,31 +409,266 @@ class VectorStoreManager:
             sub_index = FAISS.load_local(sub_index_dir, self.embeddings, allow_dangerous_deserialization=True)
             self.index.merge_from(sub_index)
 
-    def search(self, query: str, k: int = 5):
+    def search(self, query: str, k: int = 5, sources=None, mode: str = None):
         """
         Perform a similarity search on the merged index.
 
         Args:
             query (str): The text query to search for.
             k (int): Number of top results to return.
+            sources (List[str]): Only search these shards (sharded mode only).
+            mode (str): "dense" or "hybrid", defaults to the manager's retrieval mode.
 
         Returns:
             List[Document]: The top-k most similar documents.
         """
-        if self.index is None:
-            raise RuntimeError("Index not loaded. Call `load_and_merge_indexes()` first.")
-        return self.index.similarity_search(query, k=k)
+        return [doc for doc, _ in self.search_with_score(query, k=k, sources=sources, mode=mode)]
+
+    def search_with_score(self, query: str, k: int = 5, sources=None, mode: str = None, timings: dict = None):
+        """
+        Perform a similarity search and return the score of every hit.
+
+        Args:
+            query (str): The text query to search for.
+            k (int): Number of top results to return.
+            sources (List[str]): Only search these shards (sharded mode only).
+            mode (str): "dense" or "hybrid", defaults to the manager's retrieval mode.
+            timings (dict): Filled with the seconds spent searching each store, empty on a cache hit.
+
+        Returns:
+            List[Tuple[Document, float]]: The top-k documents with their FAISS distance (lower is closer for L2)
+            in dense mode, or their reciprocal rank fusion score (higher is better) in hybrid mode.
+        """
+        return self.search_many_with_score([query], k=k, sources=sources, mode=mode, timings=timings)[0]
+
+    def search_many(self, queries, k: int = 5, sources=None, mode: str = None):
+        """
+        Perform a similarity search for several queries at once.
+
+        Args:
+            queries (List[str]): The text queries to search for.
+            k (int): Number of top results to return per query.
+            sources (List[str]): Only search these shards (sharded mode only).
+            mode (str): "dense" or "hybrid", defaults to the manager's retrieval mode.
+
+        Returns:
+            List[List[Document]]: The top-k documents of each query, in the order of `queries`.
+        """
+        return [
+            [doc for doc, _ in results]
+            for results in self.search_many_with_score(queries, k=k, sources=sources, mode=mode)
+        ]
+
+    def search_many_with_score(self, queries, k: int = 5, sources=None, mode: str = None, timings: dict = None):
+        """
+        Batched similarity search: the uncached queries are embedded in a single forward
+        pass and searched with a single matrix FAISS call per store.
+
+        Args:
+            queries (List[str]): The text queries to search for.
+            k (int): Number of top results to return per query.
+            sources (List[str]): Only search these shards (sharded mode only).
+            mode (str): "dense" or "hybrid", defaults to the manager's retrieval mode.
+            timings (dict): Filled with the seconds spent searching each store by this call,
+                left empty when every query was cached.
+
+        Returns:
+            List[List[Tuple[Document, float]]]: The scored top-k documents of each query, in order.
+        """
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        stores, generation = self.acquire_stores(sources)
+        try:
+            source_key = tuple(sorted(store.name for store in stores))
+            queries = [normalize_query(query) for query in queries]
+            # Hits address positions of the stores they were found in, only this snapshot's ones are valid
+            cached = [self.result_cache.get((query, k, source_key, mode)) for query in queries]
+            hits = [entry[1] if entry is not None and entry[0] == generation else None for entry in cached]
+
+            missing = list(dict.fromkeys(query for query, query_hits in zip(queries, hits) if query_hits is None))
+            if missing:
+                vectors = self.embed_queries(missing)
+                start = time.perf_counter()
+                if mode == "hybrid":
+                    found, store_timings = self.hybrid_search_stores(stores, missing, vectors, k)
+                else:
+                    found, store_timings = self.search_stores(stores, vectors, k)
+                found = dict(zip(missing, found))
+                if timings is not None:
+                    timings.update(store_timings)
+                Metrics.VECTOR_SEARCH_SECONDS.observe(time.perf_counter() - start)
+                with self.stores_lock:
+                    # The index changed during the search, these positions must not outlive it
+                    if generation == self.cache_generation:
+                        for query, query_hits in found.items():
+                            self.result_cache.put((query, k, source_key, mode), (generation, query_hits))
+                hits = [query_hits if query_hits is not None else found[query] for query, query_hits in zip(queries, hits)]
+
+            by_name = {store.name: store for store in stores}
+            return [self.materialize(query_hits, by_name) for query_hits in hits]
+        finally:
+            self.release_stores(stores)
+
+    def select_stores(self, sources=None):
+        """
+        Args:
+            sources (List[str]): Shard names to keep, None for all of them.
+
+        Returns:
+            List[IndexStore]: The stores to search.
+        """
+        if not self.stores:
+            raise RuntimeError("Index not loaded. Call `load_index()` first.")
+        if sources is None:
+            return list(self.stores.values())
+        if not self.sharded:
+            raise ValueError("Filtering by source requires the sharded mode.")
+        unknown = set(sources) - set(self.stores)
+        if unknown:
+            raise ValueError(f"Unknown sources {sorted(unknown)}, available: {sorted(self.stores)}")
+        return [self.stores[name] for name in sources]
+
+    def acquire_stores(self, sources=None):
+        """
+        Select the stores to search and keep them open until `release_stores`, even if they are
+        replaced meanwhile by a shard reload or a compaction.
+
+        Returns:
+            Tuple[List[IndexStore], int]: The stores to search, and the cache generation they belong to.
+        """
+        with self.stores_lock:
+            return [store.acquire() for store in self.select_stores(sources)], self.cache_generation
+
+    def release_stores(self, stores):
+        for store in stores:
+            store.release()
+
+    def search_stores(self, stores, vectors, k: int):
+        """
+        Search the stores, in parallel when there are several, and merge their top-k by score.
+
+        Args:
+            stores (List[IndexStore]): Stores to search.
+            vectors (np.ndarray): Query embeddings.
+            k (int): Number of hits per query.
+
+        Returns:
+            Tuple[List[Tuple[Tuple[str, int, float], ...]], Dict[str, float]]: Merged (store name, position, score)
+            hits of each query, and the seconds spent searching each store.
+        """
+        def timed_search(store):
+            start = time.perf_counter()
+            result = store.search(vectors, k)
+            return store.name, result, time.perf_counter() - start
+
+        if len(stores) == 1:
+            results = [timed_search(stores[0])]
+        else:
+            with self.stores_lock:
+                # Submitted under the lock, so that `set_stores` cannot shut the pool down in between
+                if self.executor is None:
+                    self.executor_workers = self.max_workers or len(self.stores)
+                    self.executor = ThreadPoolExecutor(max_workers=self.executor_workers,
+                                                       thread_name_prefix="shard-search")
+                futures = [self.executor.submit(timed_search, store) for store in stores]
+            # FAISS and numpy release the GIL while searching, so the shards really run concurrently
+            results = [future.result() for future in futures]
+        timings = {name: elapsed for name, _, elapsed in results}
+
+        if len(results) == 1:
+            return results[0][1], timings
+
+        reverse = not stores[0].lower_is_better
+        merged = []
+        for query_index in range(len(vectors)):
+            candidates = [hit for _, result, _ in results for hit in result[query_index]]
+            candidates.sort(key=lambda hit: hit[2], reverse=reverse)
+            merged.append(tuple(candidates[:k]))
+        return merged, timings
+
+    def hybrid_search_stores(self, stores, queries, vectors, k: int):
+        """
+        Fuse the dense ranking and the BM25 ranking of every store with reciprocal rank fusion.
+
+        Args:
+            stores (List[IndexStore]): Stores to search.
+            queries (List[str]): Normalized query texts.
+            vectors (np.ndarray): Their embeddings.
+            k (int): Number of hits per query.
+
+        Returns:
+            Tuple[List[Tuple[Tuple[str, int, float], ...]], Dict[str, float]]: (store name, position, fused score)
+            hits of each query, and the seconds spent in the dense search of each store.
+        """
+        candidates = max(4 * k, 20)
+        dense, timings = self.search_stores(stores, vectors, candidates)
+        fused = []
+        for query, dense_hits in zip(queries, dense):
+            # BM25 scores depend on the IDF and mean length of their shard and cannot be compared
+            # across shards, every shard ranking is fused on its own
+            lexical_rankings = [store.lexical_search(query, candidates) for store in stores]
+
+            scores = {}
+            for ranking in (dense_hits, *lexical_rankings):
+                for rank, (name, position, _) in enumerate(ranking):
+                    scores[(name, position)] = scores.get((name, position), 0.0) + 1.0 / (RRF_K + rank + 1)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            fused.append(tuple((name, position, score) for (name, position), score in best))
+        return fused, timings
+
+    def materialize(self, hits, stores):
+        """
+        Fetch the documents of (store name, position, score) hits from their docstores.
+
+        Args:
+            hits (Tuple[Tuple[str, int, float], ...]): The hits.
+            stores (Dict[str, IndexStore]): The stores the hits were found in, by name.
+
+        Returns:
+            List[Tuple[Document, float]]: The scored documents, in hit order.
+        """
+        by_store = {}
+        for name, position, _ in hits:
+            by_store.setdefault(name, []).append(position)
+        docs = {}
+        for name, positions in by_store.items():
+            for position, doc in stores[name].get_by_position(positions).items():
+                docs[(name, position)] = doc
+        return [(docs[(name, position)], score) for name, position, score in hits if (name, position) in docs]
+
+    def memory_report(self) -> dict:
+        """
+        Report the memory used by the vector index.
+
+        Returns:
+            dict: `mode`, `index_type`, `mapped_bytes` and `resident_bytes` summed over all stores,
+            and the per-store reports under `stores`. In memory mode the whole index is resident.
+        """
+        if not self.stores:
+            raise RuntimeError("Index not loaded. Call `load_index()` first.")
+        reports = {name: store.memory_report() for name, store in self.stores.items()}
+        resident = [report["resident_bytes"] for report in reports.values()]
+        return {
+            "mode": "mmap" if self.mmap else "memory",
+            "index_type": self.index_type,
+            "mapped_bytes": sum(report["mapped_bytes"] for report in reports.values()),
+            "resident_bytes": None if None in resident else sum(resident),
+            "stores": reports,
+        }
 
-    def save_merged_index(self, path: str):
+    def save_merged_index(self, path: str, fingerprint: str = None):
         """
         Save the merged FAISS index to a specified directory.
 
         Args:
             path (str): Path to the output directory where the index will be saved.
+            fingerprint (str): Sub-index fingerprint stored with the index. Computed if omitted.
         """
         if self.index is None:
-            raise RuntimeError("No index to save. Call `load_and_merge_indexes()` first.")
-        self.index.save_local(path)
+            raise RuntimeError("No in-memory index to save. Call `load_and_merge_indexes()` first.")
+        IndexStore.persist(self.index, path, fingerprint or self.compute_fingerprint(), self.embedding_model,
+                           keep_previous=MERGED_STORE in self.stores)
         print(f"Merged index saved to: {path}")
 
 if __name__ == "__main__":
@@ -70,4 +676,4 @@ if __name__ == "__main__":
 
     results = manager.search("Hey can you write python code who draws a red sphere with 80cm diameter ?", k=5)
     for doc in results:
-        print(doc.page_content)
\ No newline at end of file
+        print(doc.page_content)
@@ -130,6 +130,8 @@ class SlicerGPTWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.logic.widget = self
 
         self.applyButtonEnabled = True
+        # Last /ready status while the server loads, tells which model can already answer
+        self.serverStatus = None
 
         # Connections
 
@@ -138,6 +140,8 @@ class SlicerGPTWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         # Buttons
         self.ui.applyButton.connect("clicked(bool)", self.onApplyButton)
         self.ui.thinkBox.toggled.connect(self.onThinkBoxToggled)
+        self.ui.fullSceneBox.toggled.connect(self.onFullSceneBoxToggled)
+        self.ui.stopButton.connect("clicked(bool)", self.onStopButton)
 
         self.ui.apiKeyButton.connect("clicked(bool)", self.onApiKeyInserted)
 
@@ -149,12 +153,15 @@ class SlicerGPTWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         logging.info("Cleaning up SlicerGPT module")
         
         if hasattr(self, "logic") and hasattr(self.logic, "proc"):
+            self.logic.readyTimer.stop()
             try:
                 import requests
                 requests.get("http://127.0.0.1:8081/shutdown", timeout=1.0)
                 logging.info("Sent shutdown request to server")
             except:
                 pass
+            # Releases the request workers, even the ones waiting for a stuck server
+            self.logic.async_request.close()
             
             if self.logic.proc.state() == qt.QProcess.Running:
                 logging.info("Terminating server process")
@@ -192,13 +199,16 @@ class SlicerGPTWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         
         if hasattr(self, "logic") and hasattr(self.logic, "proc"):
             self.logic.proc = None
+
+        from Scripts.Utils import release_scene_serializer
+        release_scene_serializer()
         
         self.removeObservers()
 
     def onPromptTextChanged(self) -> None:
         """Called when the prompt text is changed."""
         if self.applyButtonEnabled:
-            if self.ui.prompt.toPlainText():
+            if self.ui.prompt.toPlainText() and self.canAnswer():
                 self.ui.applyButton.enabled = True
             else:
                 self.ui.applyButton.enabled = False
@@ -209,16 +219,52 @@ class SlicerGPTWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self.logic.setModel(True)
         else:
             self.logic.setModel(False)
+        self.onPromptTextChanged()
 
     def onThinkBoxToggled(self, checked):
         self.logic.setThinking(checked)
 
+    def onFullSceneBoxToggled(self, checked):
+        self.logic.setSceneMode("xml" if checked else "digest")
+
+    def onStopButton(self):
+        """Stop the answer being generated, it ends like a failed request: the partial answer is followed by an error message."""
+        self.ui.stopButton.enabled = False
+        self.logic.cancelGeneration()
+
+    def onServerProgress(self, status):
+        """Called while the server loads, with the status reported by its /ready endpoint."""
+        self.serverStatus = status
+        stages = ", ".join(f"{name}: {stage['status']}" for name, stage in status["stages"].items())
+        if status.get("failed"):
+            self.loadingLabel.setText(f"The local AI server failed to start ({stages}).")
+        elif status.get("retrieval"):
+            # The API key can be entered, questions are only sent once the selected model can answer
+            if status.get("api_model"):
+                self.loadingLabel.setText(f"Loading the local model, the API model is available ({stages})...")
+            else:
+                self.loadingLabel.setText(f"Loading the local model, add an API key to use the API model now ({stages})...")
+            self.uiWidget.setEnabled(True)
+            self.onPromptTextChanged()
+        else:
+            self.loadingLabel.setText(f"Launching local AI server... Please wait ({stages}).")
+
+    def canAnswer(self):
+        """Whether the model selected in the UI can answer, the base model only once it is loaded."""
+        status = self.serverStatus
+        if status is None or status.get("ready"):
+            return status is not None
+        return bool(status.get("api_model") if self.logic.useApi else status.get("local_model"))
+
     def onServerReady(self):
+        self.serverStatus = {"ready": True}
         if hasattr(self, 'loadingLabel'):
             self.loadingLabel.hide()
         if hasattr(self, 'uiWidget'):
             self.uiWidget.setEnabled(True)
         self.applyButtonEnabled = True
+        if hasattr(self, 'ui'):
+            self.onPromptTextChanged()
 
     def onApiKeyInserted(self):
         """Insert the API key to the logic."""
@@ -237,8 +283,17 @@ class SlicerGPTWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self.ui.apiKeyButton.enabled = False
             self.applyButtonEnabled = False
             dialogue = self.logic.process(message)
+            self.ui.stopButton.enabled = True
             self.ui.conversation.setText(dialogue)
 
+    def showPartialConversation(self, dialogue_text):
+        """
+        Display the answer being streamed, the inputs stay disabled until it is complete.
+        """
+        self.ui.conversation.setText(dialogue_text)
+        scrollBar = self.ui.conversation.verticalScrollBar()
+        scrollBar.setValue(scrollBar.maximum)
+
     def updateConversation(self, dialogue_text):
         """
         Update the UI with the response generated.
@@ -247,6 +302,7 @@ class SlicerGPTWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.conversation.setText(dialogue_text)
         
         self.ui.apiKeyButton.enabled = True
+        self.ui.stopButton.enabled = False
         self.applyButtonEnabled = True
     
     @staticmethod
@@ -274,6 +330,12 @@ import sys
 from Scripts.Utils import extract_mrml_scene_as_text
 from Scripts.Utils import markdown_to_html
 import json
+import time
+
+# Interval of the server readiness polling while the models load
+READY_POLL_INTERVAL_MS = 1000
+# Minimum delay in seconds between two refreshes of the conversation while an answer is streamed
+STREAM_RENDER_INTERVAL = 0.05
 
 class SlicerGPTLogic(ScriptedLoadableModuleLogic):
     """This class should implement all the actual
@@ -309,12 +371,29 @@ class SlicerGPTLogic(ScriptedLoadableModuleLogic):
         self.async_request = AsyncRequest()
         self.async_request.requestFinished.connect(self.handleResponse)
         self.async_request.requestFailed.connect(self.handleError)
+        self.async_request.tokenReceived.connect(self.handleToken)
+        self.streaming = False
+        self.lastRender = 0.0
 
         self.widget = None
         self.serverReady = False
+        # Polls /ready once the server listens, the models load in the background
+        self.readyTimer = qt.QTimer()
+        self.readyTimer.setInterval(READY_POLL_INTERVAL_MS)
+        self.readyTimer.timeout.connect(self.pollReadiness)
 
         self.think = False
         self.useApi = False
+        # Identifies this Slicer instance's conversation on the server
+        import uuid
+        self.sessionId = uuid.uuid4().hex
+
+        # "digest" sends a compact per-node summary of the scene changes, "xml" the whole serialized scene
+        from Scripts.SceneDigest import SceneDigest
+        self.sceneMode = "digest"
+        self.sceneDigest = SceneDigest()
+        # Revision of the scene delta sent with the request in progress
+        self.sceneRevision = None
 
         
     def getParameterNode(self):
@@ -325,11 +404,29 @@ class SlicerGPTLogic(ScriptedLoadableModuleLogic):
         self.proc.start()
 
     def checkServerInitialised(self, output):
-        if "Uvicorn running on http://127.0.0.1:8081" in output:
+        if "Uvicorn running on http://127.0.0.1:8081" in output and not self.readyTimer.isActive():
+            print("[INFO] Server listening, waiting for the models to load")
+            self.readyTimer.start()
+
+    def pollReadiness(self):
+        """
+        Report the loading progress of the server, until everything is loaded or a stage failed.
+        """
+        # A poll still waiting for its answer is coalesced with this one
+        self.async_request.get("http://127.0.0.1:8081/ready", callback=self.onReadiness, timeout=(0.5, 0.5))
+
+    def onReadiness(self, status, error):
+        if error is not None or not self.readyTimer.isActive():
+            return
+        if status.get("ready") or status.get("failed"):
+            self.readyTimer.stop()
+        if status.get("ready"):
             print("[INFO] Server ready")
             self.serverReady = True
             if self.widget:
                 self.widget.onServerReady()
+        elif self.widget:
+            self.widget.onServerProgress(status)
 
     def handle_stdout(self):
         output = self.proc.readAllStandardOutput().data().decode()
@@ -351,16 +448,41 @@ class SlicerGPTLogic(ScriptedLoadableModuleLogic):
         """
         print(response_data)
 
+        if isinstance(response_data, dict):
+            if response_data.get("scene_resync"):
+                self.sceneDigest.reset()
+            elif self.sceneRevision is not None:
+                # The server applied the scene changes, the next delta starts from them
+                self.sceneDigest.commit(self.sceneRevision)
+            response_data = response_data.get("content", "")
+
         self.dialogue.pop()
         self.dialogue.append({"role": "assistant", "content": response_data})
 
         if self.widget:
             self.widget.updateConversation(self.formatDialogue())
             
+    def handleToken(self, token):
+        """
+        Append a streamed chunk to the answer being generated.
+        """
+        if not self.streaming:
+            self.streaming = True
+            self.dialogue[-1]["content"] = ""
+        self.dialogue[-1]["content"] += token
+
+        # Re-rendering the whole dialogue for every token would make long answers stutter
+        now = time.monotonic()
+        if self.widget and now - self.lastRender >= STREAM_RENDER_INTERVAL:
+            self.lastRender = now
+            self.widget.showPartialConversation(self.formatDialogue())
+
     def handleError(self, error_message):
         """
         Handle errors during the async request.
         """
+        # The server may not have received the last scene changes
+        self.sceneDigest.reset()
 
         self.dialogue.append({"role": "assistant", "content": f"Erreur de communication avec le serveur: {error_message}"})
         
@@ -376,6 +498,15 @@ class SlicerGPTLogic(ScriptedLoadableModuleLogic):
     def setModel(self, apiModel):
         self.useApi = apiModel
 
+    def setSceneMode(self, mode):
+        """
+        Choose how the scene is sent: "digest" (compact, only the changes) or "xml" (full serialized scene).
+        """
+        if mode not in ("digest", "xml"):
+            raise ValueError(f"Unknown scene mode {mode}")
+        self.sceneMode = mode
+        self.sceneDigest.reset()
+
     def checkStatus(self, data):
         if data.get("status") == "ok":
             return True
@@ -383,7 +514,12 @@ class SlicerGPTLogic(ScriptedLoadableModuleLogic):
     
     def addApiKey(self, key):
         apiKey = {"key": key}
-        requests.post("http://127.0.0.1:8081/addKey", json=apiKey)
+
+        def onKeyAdded(data, error):
+            if error is not None:
+                logging.error(f"Could not add the API key: {error}")
+
+        self.async_request.post("http://127.0.0.1:8081/addKey", apiKey, callback=onKeyAdded)
     
     def formatDialogue(self) -> str:
         """
@@ -412,43 +548,61 @@ class SlicerGPTLogic(ScriptedLoadableModuleLogic):
         temp_message = {"role": "assistant", "content": "Generating response..."}
         self.dialogue.append(temp_message)
         
-        message["mrml_scene"] = extract_mrml_scene_as_text()
+        self.sceneRevision = None
+        if self.sceneMode == "xml":
+            message["mrml_scene"] = extract_mrml_scene_as_text()
+        else:
+            message["scene_delta"] = self.sceneDigest.delta()
+            self.sceneRevision = message["scene_delta"]["revision"]
         message["think"] = self.think
         message["use_api"] = self.useApi
-
-        print(message["mrml_scene"])
+        message["session_id"] = self.sessionId
+        import uuid
+        self.requestId = uuid.uuid4().hex
+        message["request_id"] = self.requestId
         
         formatted_dialogue = self.formatDialogue()
         
-        self.async_request.post("http://127.0.0.1:8081/generate", message)
+        self.streaming = False
+        self.async_request.stream("http://127.0.0.1:8081/generateStream", message)
         
         return formatted_dialogue
     
-    def performTest(self):
-        
-        try:
-            response = requests.get("http://127.0.0.1:8081/health")
-            
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if data.get("status") == "ok":
-                print(f"Test passed : status = {data.get('status')}")
-                return {"passed": True, "status": data.get("status")}
-            else:
-                print(f"Test failed : status = {data.get('status')}")
-                return {"passed": False, "status": data.get("status")}
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Request error : {e}")
-            return {"passed": False, "status": e}
-        except json.JSONDecodeError as e:
-            print(f"Parsing JSON error : {e}")
-            return {"passed": False, "status": e}
-        except Exception as e:
-            print(f"Unexpected error : {e}")
-            return {"passed": False, "status": e}
+    def cancelGeneration(self):
+        """
+        Ask the server to stop the answer being generated, it stops at the next token.
+        """
+        if getattr(self, "requestId", None) is None:
+            return
+
+        def onCancelled(data, error):
+            if error is not None:
+                logging.warning(f"Could not cancel the generation: {error}")
+
+        self.async_request.post("http://127.0.0.1:8081/cancel", {"request_id": self.requestId},
+                                callback=onCancelled, timeout=(1.0, 1.0))
+
+    def testResult(self, data, error):
+        if error is not None:
+            print(f"Request error : {error}")
+            return {"passed": False, "status": error}
+        if data.get("status") == "ok":
+            print(f"Test passed : status = {data.get('status')}")
+            return {"passed": True, "status": data.get("status")}
+        print(f"Test failed : status = {data.get('status')}")
+        return {"passed": False, "status": data.get("status")}
+
+    def performTest(self, callback, timeout=5.0):
+        """
+        Check the server health on a request worker, without blocking the main thread.
+
+        Args:
+            callback: called on the main thread with the result {"passed", "status"}
+            timeout: seconds to wait for the server
+        """
+        # The callback keeps the result away from the signals, they would hand it to the conversation
+        self.async_request.get("http://127.0.0.1:8081/health", timeout=(timeout, timeout),
+                               callback=lambda data, error: callback(self.testResult(data, error)))
 
 
 
@@ -492,7 +646,14 @@ class SlicerGPTTest(ScriptedLoadableModuleTest):
 
         logic = SlicerGPTLogic()
         time.sleep(30.0)
-        response = logic.performTest()
+        results = []
+        logic.performTest(results.append)
+        # The result arrives as a Qt event, processed while waiting
+        deadline = time.monotonic() + 15.0
+        while not results and time.monotonic() < deadline:
+            slicer.app.processEvents()
+            time.sleep(0.05)
+        response = results[0] if results else {"passed": False, "status": "no answer from the server"}
 
         if response.get("passed") is True:
             self.delayDisplay("Test passed")
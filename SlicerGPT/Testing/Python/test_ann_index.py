@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+import AnnIndex
+from AnnIndex import factory_string
+
+D = 384
+
+
+class FactoryStringTest(unittest.TestCase):
+
+    def test_exact_types(self):
+        self.assertEqual(factory_string("flat", 100000, D), "Flat")
+        self.assertEqual(factory_string("hnsw", 10, D), "HNSW32")
+        self.assertEqual(factory_string("sq_fp16", 10, D), "SQfp16")
+
+    def test_small_corpus_falls_back_to_exact_search(self):
+        below = AnnIndex.MIN_IVF_VECTORS - 1
+        self.assertEqual(factory_string("ivf_flat", below, D), "Flat")
+        self.assertEqual(factory_string("ivf_pq", below, D), "Flat")
+        # HNSW needs no training
+        self.assertEqual(factory_string("hnsw", below, D), "HNSW32")
+        self.assertTrue(factory_string("ivf_flat", AnnIndex.MIN_IVF_VECTORS, D).startswith("IVF"))
+
+    def test_nlist_keeps_39_training_points_per_list(self):
+        # 4 * sqrt(n) would ask for 128 lists, 1024 points only train 26
+        self.assertEqual(factory_string("ivf_flat", 1024, D), "IVF26,Flat")
+        # Large corpora use 4 * sqrt(n)
+        self.assertEqual(factory_string("ivf_flat", 1000000, D), "IVF4000,Flat")
+
+    def test_pq_bits_follow_the_training_set(self):
+        # 8-bit codebooks need 256 centroids of 39 points
+        self.assertEqual(factory_string("ivf_pq", 39 * 256, D), "IVF256,PQ48x8")
+        self.assertEqual(factory_string("ivf_pq", 39 * 256 - 1, D), "IVF255,PQ48x7")
+        self.assertEqual(factory_string("ivf_pq", 1024, D), "IVF26,PQ48x4")
+        self.assertEqual(factory_string("ivf_pq", 10000000, D), "IVF12649,PQ48x8")
+
+    def test_pq_sub_vectors_divide_the_dimension(self):
+        for d, m in ((384, 48), (12, 1), (20, 2), (7, 1)):
+            self.assertEqual(factory_string("ivf_pq", 100000, d).split(",")[1].split("x")[0], f"PQ{m}")
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            factory_string("lsh", 1000, D)
+
+
+class BuildIndexTest(unittest.TestCase):
+
+    def test_every_type_builds_and_searches(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((2048, 16), dtype=np.float32)
+        for index_type in AnnIndex.INDEX_TYPES:
+            index = AnnIndex.build_index(vectors, faiss.METRIC_L2, index_type)
+            self.assertEqual(index.ntotal, len(vectors))
+            _, ids = index.search(vectors[:5], 3)
+            self.assertTrue(((ids >= 0) & (ids < len(vectors))).all(), index_type)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import qt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from AsyncRequest import AsyncRequest
+
+TIMEOUT = 5.0
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers after a delay so that identical requests overlap, "/fail" answers 500."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.hits.append((self.path, body))
+        time.sleep(0.2)
+        status, payload = (500, b"{}") if self.path == "/fail" else (200, body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AsyncRequestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.hits = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.async_request = AsyncRequest(workers=2, retries=0)
+
+    def tearDown(self):
+        self.async_request.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for(self, condition):
+        # The results are delivered as Qt events
+        deadline = time.monotonic() + TIMEOUT
+        while not condition() and time.monotonic() < deadline:
+            qt.QApplication.processEvents()
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_identical_requests_share_one_call(self):
+        results = []
+        for _ in range(3):
+            self.async_request.post(f"{self.url}/echo", {"content": "hello"},
+                                    callback=lambda data, error: results.append((data, error)))
+        self.wait_for(lambda: len(results) == 3)
+        self.assertEqual(results, [({"content": "hello"}, None)] * 3)
+        self.assertEqual(len(self.server.hits), 1)
+        self.assertEqual(self.async_request.stats()["coalesced"], 2)
+
+    def test_different_bodies_are_sent_separately(self):
+        results = []
+        for content in ("a", "b"):
+            self.async_request.post(f"{self.url}/echo", {"content": content},
+                                    callback=lambda data, error: results.append(data))
+        self.wait_for(lambda: len(results) == 2)
+        self.assertEqual(len(self.server.hits), 2)
+
+    def test_error_reaches_every_callback(self):
+        errors = []
+        for _ in range(2):
+            self.async_request.post(f"{self.url}/fail", {"content": "hello"},
+                                    callback=lambda data, error: errors.append((data, error)))
+        self.wait_for(lambda: len(errors) == 2)
+        self.assertEqual(len(self.server.hits), 1)
+        for data, error in errors:
+            self.assertIsNone(data)
+            self.assertIn("500", error)
+
+    def test_signal_callers_share_one_emission(self):
+        finished, called = [], []
+        self.async_request.requestFinished.connect(finished.append)
+        self.async_request.post(f"{self.url}/echo", {"content": "hello"})
+        self.async_request.post(f"{self.url}/echo", {"content": "hello"})
+        self.async_request.post(f"{self.url}/echo", {"content": "hello"},
+                                callback=lambda data, error: called.append(data))
+        self.wait_for(lambda: finished and called)
+        # Let a second emission arrive if there was one
+        self.wait_for(lambda: not self.async_request.inflight)
+        qt.QApplication.processEvents()
+        self.assertEqual(finished, [{"content": "hello"}])
+        self.assertEqual(called, [{"content": "hello"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from ContextPacker import GAP_MARKER, ContextPacker, split_segments
+
+VOCABULARY = ["volume", "load", "segment", "editor", "markups", "python", "threshold", "view"]
+
+
+def embed(texts):
+    """Bag of words over a small vocabulary, with a constant dimension so no text embeds to zero."""
+    vectors = np.zeros((len(texts), len(VOCABULARY) + 1), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = text.lower().replace(".", " ").split()
+        for column, term in enumerate(VOCABULARY):
+            vectors[row, column] = sum(word.startswith(term) for word in words)
+        vectors[row, -1] = 0.1
+    return vectors
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class SplitSegmentsTest(unittest.TestCase):
+
+    def test_sentences_and_code(self):
+        text = "Open the Data module. Load the volume.\n\n```python\nslicer.util.loadVolume(path)\n```\nDone."
+        self.assertEqual(split_segments(text), [
+            "Open the Data module.", "Load the volume.", "```python\nslicer.util.loadVolume(path)\n```", "Done.",
+        ])
+
+
+class ContextPackerTest(unittest.TestCase):
+
+    def pack(self, question, contents, **kwargs):
+        packer = ContextPacker(embed, count_words, **kwargs)
+        return packer.pack(embed([question])[0], [Document(page_content=content) for content in contents])
+
+    def test_duplicate_chunks_are_dropped(self):
+        chunk = "Load the volume with the Data module. The volume appears in the view."
+        texts, stats = self.pack("load a volume", [chunk, chunk, "The segment editor has a threshold effect."])
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(stats["documents"], 2)
+        self.assertEqual(len(texts), 2)
+
+    def test_chunks_are_trimmed_to_the_budget(self):
+        chunk = ("The segment editor edits segments. Markups are placed in the view. "
+                 "Python scripts run in the console. The threshold effect of the segment editor selects voxels.")
+        texts, stats = self.pack("segment editor threshold", [chunk], max_tokens=16)
+        self.assertLessEqual(stats["tokens"], 16 + 2 * len(GAP_MARKER.split()))
+        self.assertIn("The threshold effect of the segment editor selects voxels.", texts[0])
+        self.assertNotIn("Markups", texts[0])
+        self.assertIn(GAP_MARKER, texts[0])
+
+    def test_every_chunk_keeps_its_best_segment(self):
+        texts, _ = self.pack("load a volume", [
+            "Load the volume from the Data module.",
+            "Markups are placed in the view.",
+        ])
+        self.assertEqual(texts, ["Load the volume from the Data module.", "Markups are placed in the view."])
+
+    def test_empty_retrieval(self):
+        texts, stats = self.pack("load a volume", [])
+        self.assertEqual((texts, stats["documents"]), ([], 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from ConversationHistory import ConversationHistory, strip_reasoning
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class StripReasoningTest(unittest.TestCase):
+
+    def test_think_blocks_are_removed(self):
+        self.assertEqual(strip_reasoning("<think>\nlet me see\n</think>\n\nThe answer."), "The answer.")
+        self.assertEqual(strip_reasoning("<think></think>Summary"), "Summary")
+        # A reasoning cut by the token limit has no closing tag
+        self.assertEqual(strip_reasoning("<think>unfinished"), "")
+
+
+class ConversationHistoryTest(unittest.TestCase):
+
+    def history(self, **kwargs):
+        return ConversationHistory("system prompt", count_words, max_tokens=20, keep_turns=1, **kwargs)
+
+    def test_turns_are_stored_without_reasoning(self):
+        history = self.history()
+        history.add_turn("question", "<think>hidden</think>answer")
+        messages, usage = history.messages()
+        self.assertEqual([message["content"] for message in messages], ["system prompt", "question", "answer"])
+        self.assertEqual(usage, {"system": 2, "summary": 0, "history": 2})
+
+    def test_oldest_turns_are_summarized_over_budget(self):
+        history = self.history()
+        for i in range(3):
+            history.add_turn(f"question {i}", " ".join(["word"] * 8))
+        # Folding the first turn brings the turns back within the budget
+        self.assertEqual([user["content"] for user, _, _ in history.turns], ["question 1", "question 2"])
+        self.assertLessEqual(history.summary_size, history.max_tokens // 2)
+        self.assertIn("The user asked: question 0", history.summary)
+        messages, _ = history.messages()
+        self.assertTrue(messages[1]["content"].startswith("Summary of the earlier conversation"))
+
+    def test_deferred_compression_uses_the_given_summarizer(self):
+        history = self.history()
+        for i in range(3):
+            history.add_turn(f"question {i}", " ".join(["word"] * 8), compress=False)
+        self.assertEqual(len(history.turns), 3)
+        history.compress(summarize=lambda summary, messages: f"<think>reasoning</think>{len(messages)} messages")
+        self.assertEqual(history.summary, "2 messages")
+        self.assertEqual(len(history.turns), 2)
+
+    def test_failing_summarizer_keeps_the_questions(self):
+        def fail(summary, messages):
+            raise RuntimeError("model unavailable")
+
+        history = self.history(summarize=fail)
+        for i in range(3):
+            history.add_turn(f"question {i}", " ".join(["word"] * 8))
+        self.assertIn("The user asked: question 0", history.summary)
+
+    def test_messages_fit_the_available_tokens(self):
+        history = self.history()
+        history.add_turn("first question", "first answer")
+        history.add_turn("second question", "second answer")
+        messages, usage = history.messages(available_tokens=5)
+        self.assertEqual([message["content"] for message in messages[1:]], ["second question", "second answer"])
+        self.assertEqual(usage["history"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from DeltaSegment import DeltaSegment
+from Docstore import SQLiteDocstore
+from IndexStore import IndexStore, current_path, read_current_version
+
+D = 4
+
+
+def vector(i):
+    v = np.zeros(D, dtype=np.float32)
+    v[i % D] = 1.0 + i // D
+    return v
+
+
+def document(i):
+    return f"doc-{i}", Document(page_content=f"text {i}", metadata={"source": "test"})
+
+
+class DocstoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        SQLiteDocstore.build(self.path, [document(i) for i in range(3)])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_unknown_positions_are_missing(self):
+        docstore = SQLiteDocstore(self.path)
+        found = docstore.get([2, 7, 0])
+        self.assertEqual({position: doc.id for position, doc in found.items()}, {2: "doc-2", 0: "doc-0"})
+        docstore.close()
+
+
+class DeltaSegmentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_add_search_get(self):
+        delta = DeltaSegment(self.path, base=10, d=D, metric_type=faiss.METRIC_L2)
+        delta.add([document(0), document(1)], np.stack([vector(0), vector(1)]))
+        self.assertEqual(len(delta), 2)
+        scores, positions = delta.search(vector(1)[None], 1)
+        # Delta positions follow the main segment ones
+        self.assertEqual(int(positions[0][0]), 12)
+        self.assertEqual(delta.get([12])[12].page_content, "text 1")
+        delta.close()
+
+    def test_delete_and_reload(self):
+        delta = DeltaSegment(self.path, base=10, d=D, metric_type=faiss.METRIC_L2)
+        delta.add([document(0), document(1)], np.stack([vector(0), vector(1)]))
+        deleted = delta.delete(["doc-0", "doc-main"], {"doc-main": 3})
+        self.assertEqual(deleted, 2)
+        delta.close()
+
+        reloaded = DeltaSegment(self.path, base=10, d=D, metric_type=faiss.METRIC_L2)
+        self.assertEqual(len(reloaded), 1)
+        self.assertEqual(reloaded.tombstones, {3})
+        self.assertEqual([doc_id for doc_id, _, _ in reloaded.rows()], ["doc-1"])
+        reloaded.close()
+
+
+class IndexStoreCompactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        flat = faiss.IndexFlatL2(D)
+        flat.add(np.stack([vector(i) for i in range(4)]))
+        IndexStore.write(self.path, flat, [document(i) for i in range(4)], "fingerprint", "model")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def search_ids(self, store, i, k=1):
+        hits = store.search(vector(i)[None], k)[0]
+        return [doc.id for doc in store.get([position for _, position, _ in hits])]
+
+    def test_updates_are_searched_before_compaction(self):
+        store = IndexStore.open("test", self.path)
+        store.add([document(4)], vector(4)[None])
+        store.delete(["doc-1"])
+        self.assertEqual(store.pending_updates(), 2)
+        self.assertEqual(self.search_ids(store, 4), ["doc-4"])
+        self.assertNotIn("doc-1", self.search_ids(store, 1, k=5))
+        store.close()
+
+    def test_compaction_writes_a_new_version(self):
+        store = IndexStore.open("test", self.path)
+        old_version = store.version_path
+        store.add([document(4)], vector(4)[None])
+        store.delete(["doc-1"])
+        store.compact()
+
+        # The open store keeps serving its own version until it is closed
+        self.assertNotEqual(current_path(self.path), old_version)
+        self.assertTrue(os.path.isdir(old_version))
+        self.assertEqual(self.search_ids(store, 4), ["doc-4"])
+        store.retire()
+        self.assertFalse(os.path.isdir(old_version))
+
+        compacted = IndexStore.open("test", self.path)
+        self.assertEqual(compacted.pending_updates(), 0)
+        self.assertEqual(compacted.vector_index.ntotal, 4)
+        self.assertEqual(self.search_ids(compacted, 4), ["doc-4"])
+        self.assertNotIn("doc-1", self.search_ids(compacted, 1, k=5))
+        compacted.close()
+
+    def test_retired_store_closes_after_its_last_user(self):
+        store = IndexStore.open("test", self.path)
+        old_version = store.version_path
+        store.compact()
+        store.acquire()
+        store.retire()
+        self.assertTrue(os.path.isdir(old_version))
+        with self.assertRaises(RuntimeError):
+            store.acquire()
+        store.release()
+        self.assertFalse(os.path.isdir(old_version))
+
+    def test_interrupted_write_keeps_the_live_version(self):
+        version = read_current_version(self.path)
+        # A crash before the pointer swap leaves an unreferenced directory behind
+        os.makedirs(os.path.join(self.path, "20000101-000000-deadbeef"))
+        self.assertEqual(read_current_version(self.path), version)
+        store = IndexStore.open("test", self.path)
+        self.assertEqual(store.vector_index.ntotal, 4)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from LexicalIndex import BM25Index, tokenize
+
+DOCUMENTS = [
+    "Load a volume with slicer.util.loadVolume",
+    "The segment editor creates segments in a vtkMRMLSegmentationNode",
+    "Markups control points can be placed in the 3D view",
+    "Use slicer.util.getNode to find a node by name",
+]
+
+
+class TokenizeTest(unittest.TestCase):
+
+    def test_dotted_identifiers_are_kept_whole(self):
+        self.assertEqual(tokenize("Call slicer.util.loadVolume()"),
+                         ["call", "slicer.util.loadvolume", "slicer", "util", "loadvolume"])
+
+
+class BM25IndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BM25Index.build(enumerate(DOCUMENTS))
+
+    def test_identifier_query(self):
+        hits = self.index.search("slicer.util.loadVolume", k=2)
+        self.assertEqual(hits[0][0], 0)
+        # getNode shares the slicer and util terms
+        self.assertEqual(hits[1][0], 3)
+        self.assertGreater(hits[0][1], hits[1][1])
+
+    def test_unknown_terms_return_nothing(self):
+        self.assertEqual(self.index.search("tractography", k=5), [])
+
+    def test_excluded_positions_are_skipped(self):
+        hits = self.index.search("slicer util", k=5, exclude={0})
+        self.assertEqual([position for position, _ in hits], [3])
+
+    def test_saved_index_gives_the_same_ranking(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "bm25")
+            self.index.save(path)
+            self.assertTrue(BM25Index.exists(path))
+            loaded = BM25Index.load(path)
+            for query in ("segment editor", "control points in the 3D view"):
+                self.assertEqual(loaded.search(query, k=3), self.index.search(query, k=3))
+            del loaded
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
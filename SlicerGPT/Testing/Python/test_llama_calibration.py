@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+import LlamaCalibration
+from LlamaCalibration import load_params, select_best
+
+MODEL = "model.gguf"
+CALIBRATED = {"n_ctx": 4096, "n_threads": 6, "n_threads_batch": 12, "n_batch": 256}
+
+
+class LoadParamsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "LlamaConfig.json")
+        # The machine environment must not leak into the tests
+        environment = {key: value for key, value in os.environ.items()
+                       if key not in LlamaCalibration.ENV_OVERRIDES.values()}
+        patcher = mock.patch.dict(os.environ, environment, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_calibration(self, model=MODEL, cpu_count=None):
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({"model": model, "cpu_count": cpu_count or multiprocessing.cpu_count(),
+                       "params": CALIBRATED}, file)
+
+    def test_defaults_without_calibration(self):
+        params = load_params(MODEL, self.path)
+        self.assertEqual(params, {**LlamaCalibration.DEFAULT_PARAMS,
+                                  "n_threads_batch": LlamaCalibration.DEFAULT_PARAMS["n_threads"]})
+
+    def test_calibration_of_this_model_and_machine(self):
+        self.write_calibration()
+        self.assertEqual(load_params(MODEL, self.path), CALIBRATED)
+
+    def test_calibration_of_another_model_or_machine_is_ignored(self):
+        for model, cpu_count in (("other.gguf", None), (MODEL, multiprocessing.cpu_count() + 1)):
+            self.write_calibration(model, cpu_count)
+            self.assertEqual(load_params(MODEL, self.path)["n_ctx"], LlamaCalibration.DEFAULT_PARAMS["n_ctx"])
+
+    def test_environment_overrides_the_calibration(self):
+        self.write_calibration()
+        os.environ["SLICERGPT_N_CTX"] = "2048"
+        os.environ["SLICERGPT_N_BATCH"] = ""
+        params = load_params(MODEL, self.path)
+        self.assertEqual(params["n_ctx"], 2048)
+        # Empty variables are ignored
+        self.assertEqual(params["n_batch"], CALIBRATED["n_batch"])
+
+    def test_explicit_overrides_come_first(self):
+        self.write_calibration()
+        os.environ["SLICERGPT_N_CTX"] = "2048"
+        params = load_params(MODEL, self.path, {"n_ctx": 1024, "n_batch": None})
+        self.assertEqual(params["n_ctx"], 1024)
+        self.assertEqual(params["n_batch"], CALIBRATED["n_batch"])
+
+    def test_overridden_threads_set_the_batch_threads(self):
+        self.write_calibration()
+        self.assertEqual(load_params(MODEL, self.path, {"n_threads": 2})["n_threads_batch"], 2)
+        os.environ["SLICERGPT_N_THREADS"] = "3"
+        self.assertEqual(load_params(MODEL, self.path)["n_threads_batch"], 3)
+        # Unless the batch threads are given too
+        os.environ["SLICERGPT_N_THREADS_BATCH"] = "8"
+        self.assertEqual(load_params(MODEL, self.path, {"n_threads": 2})["n_threads_batch"], 8)
+
+
+class SelectBestTest(unittest.TestCase):
+
+    @staticmethod
+    def measurement(n_ctx, n_threads, n_batch, latency_s):
+        return {"n_ctx": n_ctx, "n_threads": n_threads, "n_threads_batch": n_threads, "n_batch": n_batch,
+                "latency_s": latency_s}
+
+    def test_lowest_latency(self):
+        best = select_best([self.measurement(4096, 4, 256, 2.0), self.measurement(4096, 8, 512, 1.0)])
+        self.assertEqual(best, {"n_ctx": 4096, "n_threads": 8, "n_threads_batch": 8, "n_batch": 512})
+
+    def test_larger_context_within_tolerance(self):
+        measurements = [self.measurement(4096, 8, 512, 1.0), self.measurement(8192, 8, 512, 1.04),
+                        self.measurement(16384, 8, 512, 1.5)]
+        self.assertEqual(select_best(measurements)["n_ctx"], 8192)
+        self.assertEqual(select_best(measurements, tolerance=0.01)["n_ctx"], 4096)
+
+
+if __name__ == "__main__":
+    unittest.main()
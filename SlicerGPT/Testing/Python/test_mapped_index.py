@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from MappedIndex import MappedVectorIndex
+
+D = 16
+
+
+class MappedVectorIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def mapped(self, flat):
+        MappedVectorIndex.export(flat, self.path)
+        return MappedVectorIndex(self.path)
+
+    def assertSameResults(self, flat, mapped, queries, k, **kwargs):
+        expected_scores, expected_ids = flat.search(queries, k)
+        scores, ids = mapped.search(queries, k, **kwargs)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-4)
+
+    def test_l2_matches_faiss(self):
+        vectors = self.rng.standard_normal((1000, D), dtype=np.float32)
+        flat = faiss.IndexFlatL2(D)
+        flat.add(vectors)
+        queries = self.rng.standard_normal((20, D), dtype=np.float32)
+        # Several blocks, the last one partial
+        self.assertSameResults(flat, self.mapped(flat), queries, k=10, block_size=300)
+
+    def test_inner_product_matches_faiss(self):
+        vectors = self.rng.standard_normal((1000, D), dtype=np.float32)
+        flat = faiss.IndexFlatIP(D)
+        flat.add(vectors)
+        queries = self.rng.standard_normal((20, D), dtype=np.float32)
+        self.assertSameResults(flat, self.mapped(flat), queries, k=10, block_size=128)
+
+    def test_k_larger_than_ntotal_is_padded(self):
+        for flat in (faiss.IndexFlatL2(D), faiss.IndexFlatIP(D)):
+            flat.add(self.rng.standard_normal((5, D), dtype=np.float32))
+            queries = self.rng.standard_normal((3, D), dtype=np.float32)
+            mapped = self.mapped(flat)
+            scores, ids = mapped.search(queries, 8, block_size=2)
+            self.assertEqual(ids.shape, (3, 8))
+            self.assertTrue((ids[:, 5:] == -1).all())
+            expected_scores, expected_ids = flat.search(queries, 5)
+            np.testing.assert_array_equal(ids[:, :5], expected_ids)
+            np.testing.assert_allclose(scores[:, :5], expected_scores, rtol=1e-4, atol=1e-4)
+
+    def test_export_keeps_the_metric(self):
+        flat = faiss.IndexFlatIP(D)
+        flat.add(self.rng.standard_normal((4, D), dtype=np.float32))
+        mapped = self.mapped(flat)
+        self.assertTrue(MappedVectorIndex.exists(self.path))
+        self.assertEqual((mapped.metric, mapped.ntotal, mapped.d), ("ip", 4, D))
+
+
+if __name__ == "__main__":
+    unittest.main()
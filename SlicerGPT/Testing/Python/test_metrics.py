@@ -0,0 +1,69 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from Metrics import Counter, FileExporter, Gauge, Histogram, Registry
+
+
+class PrometheusFormatTest(unittest.TestCase):
+
+    def test_counter_labels_are_escaped(self):
+        counter = Counter("errors_total", "Errors.")
+        counter.inc(reason='quote " backslash \\ newline \n')
+        counter.inc(2, reason="timeout")
+        self.assertEqual(counter.render(), [
+            "# HELP errors_total Errors.",
+            "# TYPE errors_total counter",
+            'errors_total{reason="quote \\" backslash \\\\ newline \\n"} 1',
+            'errors_total{reason="timeout"} 2',
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1.0"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 4.25",
+            "latency_seconds_count 4",
+        ])
+
+    def test_histogram_labels_come_before_le(self):
+        histogram = Histogram("tokens", "Tokens.", buckets=(10,))
+        histogram.observe(5, model="local")
+        self.assertIn('tokens_bucket{model="local",le="10"} 1', histogram.render())
+        self.assertIn('tokens_count{model="local"} 1', histogram.render())
+
+    def test_gauge_callback(self):
+        self.assertEqual(Gauge("memory_bytes", "Memory.", lambda: 42).render()[2:], ["memory_bytes 42"])
+        # A value that cannot be read is left out
+        self.assertEqual(Gauge("memory_bytes", "Memory.", lambda: None).render()[2:], [])
+
+    def test_registry_render(self):
+        registry = Registry()
+        registry.register(Counter("a_total", "A.")).inc()
+        registry.register(Gauge("b", "B.")).set(1.5)
+        self.assertEqual(registry.render(), "# HELP a_total A.\n# TYPE a_total counter\na_total 1\n"
+                                            "# HELP b B.\n# TYPE b gauge\nb 1.5\n")
+
+    def test_file_exporter(self):
+        directory = tempfile.mkdtemp()
+        try:
+            registry = Registry()
+            registry.register(Counter("a_total", "A.")).inc()
+            path = os.path.join(directory, "metrics", "slicergpt.prom")
+            FileExporter(path, registry=registry).write()
+            with open(path, "r", encoding="utf-8") as file:
+                self.assertTrue(file.read().startswith(registry.render()))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from llama_cpp.llama import LlamaState
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from PromptCache import PromptCache
+
+
+def make_state(rows=1, vocab=32):
+    rng = np.random.default_rng(0)
+    return LlamaState(
+        input_ids=np.arange(16, dtype=np.intc),
+        scores=rng.random((rows, vocab), dtype=np.single),
+        n_tokens=12,
+        llama_state=bytes(range(200)) + b"\x00" * 56,
+        llama_state_size=200,
+        seed=42,
+    )
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "prefix.state")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        state = make_state(rows=3)
+        PromptCache.write_state(state, self.path)
+        restored = PromptCache.read_state(self.path)
+        np.testing.assert_array_equal(restored.input_ids, state.input_ids)
+        np.testing.assert_array_equal(restored.scores, state.scores)
+        self.assertEqual(restored.n_tokens, 12)
+        self.assertEqual(restored.seed, 42)
+        # Only the used part of the llama.cpp state buffer is written
+        self.assertEqual(restored.llama_state_size, 200)
+        self.assertEqual(bytes(restored.llama_state), bytes(range(200)))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_truncated_file_is_rejected(self):
+        PromptCache.write_state(make_state(), self.path)
+        with open(self.path, "rb") as file:
+            data = file.read()
+        with open(self.path, "wb") as file:
+            file.write(data[:-10])
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            PromptCache.read_state(self.path)
+
+    def test_trailing_data_is_rejected(self):
+        PromptCache.write_state(make_state(), self.path)
+        with open(self.path, "ab") as file:
+            file.write(b"\x00")
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            PromptCache.read_state(self.path)
+
+    def test_unknown_version_is_rejected(self):
+        with open(self.path, "wb") as file:
+            file.write(b'{"version": 2}\n')
+        with self.assertRaisesRegex(ValueError, "version"):
+            PromptCache.read_state(self.path)
+
+    def test_pickle_is_not_a_snapshot(self):
+        with open(self.path, "wb") as file:
+            file.write(b"\x80\x04\x95\x00\x00\x00\x00\x00\x00\x00\x00.")
+        with self.assertRaises(ValueError):
+            PromptCache.read_state(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from QueryCache import LRUCache, normalize_query
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_put(self):
+        cache = LRUCache(max_bytes=1000, sizeof=lambda value: 10)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_evicts_least_recently_used(self):
+        entry_size = 10 + sys.getsizeof("a")
+        cache = LRUCache(max_bytes=3 * entry_size, sizeof=lambda value: 10)
+        for key in ("a", "b", "c"):
+            cache.put(key, key)
+        # "a" becomes the most recently used, "b" is evicted first
+        cache.get("a")
+        cache.put("d", "d")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual([cache.get(key) for key in ("a", "c", "d")], ["a", "c", "d"])
+        self.assertLessEqual(cache.stats()["bytes"], cache.max_bytes)
+
+    def test_replacing_a_key_updates_the_size(self):
+        cache = LRUCache(max_bytes=1000, sizeof=len)
+        cache.put("a", "x" * 10)
+        cache.put("a", "x" * 20)
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.stats()["bytes"], 20 + sys.getsizeof("a"))
+
+    def test_oversized_value_is_not_cached(self):
+        cache = LRUCache(max_bytes=100, sizeof=lambda value: 1000)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_clear(self):
+        cache = LRUCache(max_bytes=1000, sizeof=lambda value: 10)
+        cache.put("a", 1)
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+
+class NormalizeQueryTest(unittest.TestCase):
+
+    def test_case_and_whitespace(self):
+        self.assertEqual(normalize_query("  How to   LOAD\ta volume? "), "how to load a volume?")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from ResponseCache import ResponseCache, fingerprint
+
+
+def embedding(*values):
+    return np.array(values, dtype=np.float32)
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_similar_question_hits(self):
+        cache = ResponseCache(threshold=0.95)
+        cache.put(embedding(1, 0, 0), "scene", "How to load a volume?", "answer")
+        # Scaled embeddings have the same direction
+        self.assertEqual(cache.get(embedding(2, 0.1, 0), "scene"), "answer")
+        self.assertIsNone(cache.get(embedding(0, 1, 0), "scene"))
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_key_must_match(self):
+        cache = ResponseCache()
+        cache.put(embedding(1, 0, 0), fingerprint("scene a", "base"), "question", "answer")
+        self.assertIsNone(cache.get(embedding(1, 0, 0), fingerprint("scene b", "base")))
+        self.assertIsNone(cache.get(embedding(1, 0, 0), fingerprint("scene a", "api")))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put(embedding(1, 0, 0), "scene", "a", "answer a")
+        time.sleep(0.01)
+        cache.put(embedding(0, 1, 0), "scene", "b", "answer b")
+        time.sleep(0.01)
+        cache.get(embedding(1, 0, 0), "scene")
+        time.sleep(0.01)
+        cache.put(embedding(0, 0, 1), "scene", "c", "answer c")
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertIsNone(cache.get(embedding(0, 1, 0), "scene"))
+        self.assertEqual(cache.get(embedding(1, 0, 0), "scene"), "answer a")
+        self.assertEqual(cache.get(embedding(0, 0, 1), "scene"), "answer c")
+
+    def test_expired_answer_is_not_reused(self):
+        cache = ResponseCache(ttl=0.05)
+        cache.put(embedding(1, 0, 0), "scene", "question", "answer")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(embedding(1, 0, 0), "scene"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_persisted_answers_are_reloaded(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "responses.sqlite")
+            cache = ResponseCache(path)
+            cache.put(embedding(1, 0, 0), "scene", "question", "answer")
+            cache.close()
+            reopened = ResponseCache(path)
+            self.assertEqual(reopened.get(embedding(1, 0, 0), "scene"), "answer")
+            reopened.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from SceneDigest import SceneState
+
+
+def delta(base, revision, nodes=None, removed=(), full=False):
+    return {"full": full, "base": base, "revision": revision, "header": "3D Slicer 5.8, nodes",
+            "nodes": nodes or {}, "removed": list(removed)}
+
+
+class SceneStateTest(unittest.TestCase):
+
+    def test_deltas_rebuild_the_digest(self):
+        state = SceneState()
+        self.assertTrue(state.apply(delta(0, 1, {"vtkMRMLScalarVolumeNode1": "volume"}, full=True)))
+        self.assertTrue(state.apply(delta(1, 2, {"vtkMRMLSegmentationNode1": "segmentation"})))
+        self.assertTrue(state.apply(delta(2, 3, {"vtkMRMLScalarVolumeNode1": "volume, modified"},
+                                          removed=["vtkMRMLSegmentationNode1"])))
+        self.assertEqual(state.render(), "3D Slicer 5.8, nodes\nvolume, modified")
+
+    def test_missed_delta_asks_for_a_full_digest(self):
+        state = SceneState()
+        state.apply(delta(0, 1, {"a": "node a"}, full=True))
+        # The delta from revision 1 to 2 never arrived
+        self.assertFalse(state.apply(delta(2, 3, {"b": "node b"})))
+        self.assertTrue(state.apply(delta(0, 4, {"b": "node b"}, full=True)))
+        self.assertEqual(state.render(), "3D Slicer 5.8, nodes\nnode b")
+
+    def test_delta_retried_after_a_failed_request(self):
+        state = SceneState()
+        state.apply(delta(0, 1, {"a": "node a"}, full=True))
+        # The client did not commit revision 2, its next delta starts from revision 1 again
+        state.apply(delta(1, 2, {"b": "node b"}))
+        self.assertFalse(state.apply(delta(1, 2, {"b": "node b", "c": "node c"})))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from Scheduler import QueueFullError, RequestCancelled, RequestControl, RequestScheduler
+
+TIMEOUT = 5.0
+
+
+class RequestSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = RequestScheduler(max_queue=8)
+        # Keeps the worker busy while the test fills the queues
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+        def block():
+            self.started.set()
+            self.release.wait(TIMEOUT)
+
+        self.blocker = self.scheduler.submit("blocker", block)
+        self.assertTrue(self.started.wait(TIMEOUT))
+
+    def tearDown(self):
+        self.release.set()
+        self.scheduler.shutdown()
+
+    def test_sessions_are_served_round_robin(self):
+        order = []
+        futures = [
+            self.scheduler.submit(session_id, lambda name=name: order.append(name))
+            for session_id, name in (("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1"))
+        ]
+        self.assertEqual(self.scheduler.stats()["sessions_waiting"], 3)
+        self.release.set()
+        for future in futures:
+            future.result(TIMEOUT)
+        self.assertEqual(order, ["a1", "b1", "c1", "a2", "a3"])
+
+    def test_full_queue_is_rejected(self):
+        scheduler = RequestScheduler(max_queue=2)
+        release, started = threading.Event(), threading.Event()
+        try:
+            scheduler.submit("a", lambda: (started.set(), release.wait(TIMEOUT)))
+            # The running request does not count, two more can wait
+            self.assertTrue(started.wait(TIMEOUT))
+            scheduler.submit("a", lambda: None)
+            scheduler.submit("b", lambda: None)
+            with self.assertRaises(QueueFullError) as context:
+                scheduler.submit("c", lambda: None)
+            self.assertEqual(context.exception.depth, 2)
+            self.assertGreater(context.exception.retry_after, 0)
+            self.assertEqual(scheduler.stats()["rejected"], 1)
+        finally:
+            release.set()
+            scheduler.shutdown()
+
+    def test_cancelled_request_does_not_run(self):
+        ran = []
+        control = RequestControl("request")
+        future = self.scheduler.submit("a", lambda: ran.append(True), control)
+        self.assertEqual(self.scheduler.cancel(request_id="request"), 1)
+        self.release.set()
+        with self.assertRaises(RequestCancelled):
+            future.result(TIMEOUT)
+        self.assertEqual(ran, [])
+
+    def test_expired_request_does_not_run(self):
+        control = RequestControl("request", timeout=1e-6)
+        future = self.scheduler.submit("a", lambda: "answer", control)
+        self.release.set()
+        with self.assertRaises(RequestCancelled):
+            future.result(TIMEOUT)
+        self.assertEqual(control.reason, "deadline exceeded")
+
+    def test_cancel_session(self):
+        controls = [RequestControl(f"request-{i}") for i in range(2)]
+        futures = [self.scheduler.submit("a", lambda: None, control) for control in controls]
+        self.scheduler.submit("b", lambda: None, RequestControl("other"))
+        self.assertEqual(self.scheduler.cancel(session_id="a"), 2)
+        self.release.set()
+        for future in futures:
+            with self.assertRaises(RequestCancelled):
+                future.result(TIMEOUT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+import Sessions
+from Sessions import DEFAULT_SESSION, Session, SessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SessionStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(Sessions.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.created = []
+
+    def factory(self, session_id):
+        self.created.append(session_id)
+        return Session(session_id, conversation=None, scene=None)
+
+    def test_sessions_are_reused(self):
+        store = SessionStore(self.factory)
+        self.assertIs(store.get("a"), store.get("a"))
+        self.assertEqual(store.get().session_id, DEFAULT_SESSION)
+        self.assertEqual(self.created, ["a", DEFAULT_SESSION])
+
+    def test_least_recently_used_is_evicted(self):
+        store = SessionStore(self.factory, max_sessions=2)
+        first = store.get("a")
+        store.get("b")
+        # "a" is used again, "b" becomes the least recently used
+        self.assertIs(store.get("a"), first)
+        store.get("c")
+        self.assertEqual(len(store), 2)
+        self.assertEqual(list(store.sessions), ["a", "c"])
+        store.get("b")
+        self.assertEqual(self.created, ["a", "b", "c", "b"])
+
+    def test_idle_sessions_expire(self):
+        store = SessionStore(self.factory, ttl=60)
+        first = store.get("a")
+        store.get("b")
+        self.clock.now += 30
+        store.get("a")
+        self.clock.now += 45
+        # "b" was idle for 75 seconds, "a" for 45
+        store.get("c")
+        self.assertEqual(list(store.sessions), ["a", "c"])
+        self.assertIs(store.get("a"), first)
+
+    def test_remove(self):
+        store = SessionStore(self.factory)
+        store.get("a")
+        self.assertTrue(store.remove("a"))
+        self.assertFalse(store.remove("a"))
+        self.assertEqual(len(store), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
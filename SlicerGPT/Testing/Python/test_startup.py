@@ -0,0 +1,63 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from Startup import StartupStages
+
+TIMEOUT = 5.0
+
+
+class StartupStagesTest(unittest.TestCase):
+
+    def test_stage_transitions(self):
+        stages = StartupStages(["embeddings", "model"])
+        self.assertEqual(stages.report(), {"embeddings": {"status": "pending"}, "model": {"status": "pending"}})
+
+        started, release = threading.Event(), threading.Event()
+
+        def load():
+            started.set()
+            release.wait(TIMEOUT)
+            return "llm"
+
+        future = stages.run("model", load)
+        self.assertTrue(started.wait(TIMEOUT))
+        self.assertEqual(stages.report()["model"]["status"], "loading")
+        self.assertFalse(stages.is_ready("model"))
+
+        release.set()
+        self.assertEqual(future.result(TIMEOUT), "llm")
+        report = stages.report()["model"]
+        self.assertEqual(report["status"], "ready")
+        self.assertGreaterEqual(report["elapsed_s"], 0)
+        self.assertIn("started_s", report)
+        self.assertTrue(stages.is_ready("model"))
+        # The embeddings are still pending
+        self.assertFalse(stages.is_ready("embeddings", "model"))
+        self.assertFalse(stages.failed())
+
+    def test_failed_stage(self):
+        stages = StartupStages(["index"])
+
+        def fail():
+            raise FileNotFoundError("no index")
+
+        future = stages.run("index", fail)
+        with self.assertRaises(FileNotFoundError):
+            future.result(TIMEOUT)
+        report = stages.report()["index"]
+        self.assertEqual((report["status"], report["error"]), ("failed", "no index"))
+        self.assertTrue(stages.failed())
+        self.assertFalse(stages.is_ready("index"))
+
+    def test_report_is_a_copy(self):
+        stages = StartupStages(["index"])
+        stages.report()["index"]["status"] = "ready"
+        self.assertFalse(stages.is_ready("index"))
+
+
+if __name__ == "__main__":
+    unittest.main()
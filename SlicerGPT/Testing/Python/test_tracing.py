@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+import Tracing
+from Tracing import SamplingProfiler, Trace, TraceStore
+
+TIMEOUT = 5.0
+
+
+class TraceTest(unittest.TestCase):
+
+    def test_spans_nest_in_the_active_trace(self):
+        trace = Trace("request", session="a")
+        with Tracing.activate(trace):
+            with Tracing.span("retrieval", k=8):
+                with Tracing.span("embedding"):
+                    pass
+            with Tracing.span("generation") as span:
+                span.set(tokens=12)
+        trace.finish(status="ok")
+
+        spans = trace.to_dict()["spans"]
+        self.assertEqual([child["name"] for child in spans["children"]], ["retrieval", "generation"])
+        self.assertEqual(spans["children"][0]["children"][0]["name"], "embedding")
+        self.assertEqual(spans["children"][1]["attributes"], {"tokens": 12})
+        self.assertEqual(trace.summary()["attributes"], {"session": "a", "status": "ok"})
+        self.assertEqual(set(trace.summary()["stages_ms"]), {"retrieval", "generation"})
+        self.assertIsNone(Tracing.current())
+
+    def test_threads_keep_their_own_trace(self):
+        traces = {name: Trace(name) for name in ("a", "b")}
+        barrier = threading.Barrier(2, timeout=TIMEOUT)
+
+        def run(name):
+            with Tracing.activate(traces[name]):
+                with Tracing.span(f"outer-{name}"):
+                    # Both threads hold an open span at the same time
+                    barrier.wait()
+                    with Tracing.span(f"inner-{name}"):
+                        barrier.wait()
+            traces[name].finish()
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in traces]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(TIMEOUT)
+
+        for name, trace in traces.items():
+            outer, = trace.root.children
+            self.assertEqual(outer.name, f"outer-{name}")
+            self.assertEqual([span.name for span in outer.children], [f"inner-{name}"])
+
+    def test_untraced_thread_is_a_no_op(self):
+        def work():
+            with Tracing.span("worker"):
+                pass
+
+        trace = Trace("request")
+        with Tracing.activate(trace):
+            # The trace is only active on the thread that activated it
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join(TIMEOUT)
+        self.assertEqual(trace.root.children, [])
+        self.assertIs(Tracing.start_span("outside"), Tracing.NULL_SPAN)
+
+    def test_error_is_recorded(self):
+        trace = Trace("request")
+        with Tracing.activate(trace), self.assertRaises(ValueError):
+            with Tracing.span("generation"):
+                raise ValueError("boom")
+        self.assertEqual(trace.root.children[0].attributes, {"error": "ValueError"})
+
+    def test_finish_closes_the_open_spans(self):
+        trace = Trace("request")
+        span = trace.start_span("generation")
+        trace.finish()
+        self.assertIsNotNone(span.end)
+        self.assertEqual(trace.stack, [])
+
+
+class TraceStoreTest(unittest.TestCase):
+
+    @staticmethod
+    def finished_trace(request_id, duration_ms):
+        trace = Trace(request_id)
+        trace.finish()
+        trace.root.end = trace.root.start + duration_ms / 1000
+        return trace
+
+    def test_slow_trace_filter(self):
+        store = TraceStore()
+        for request_id, duration_ms in (("fast", 5), ("slow", 500), ("slower", 900)):
+            store.add(self.finished_trace(request_id, duration_ms))
+        self.assertEqual([t["request_id"] for t in store.list(min_duration_ms=100)], ["slower", "slow"])
+        self.assertEqual([t["request_id"] for t in store.list(limit=1)], ["slower"])
+
+    def test_oldest_traces_are_evicted(self):
+        store = TraceStore(max_traces=2)
+        for request_id in ("a", "b", "c"):
+            store.add(self.finished_trace(request_id, 1))
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(store.get("c")["request_id"], "c")
+        self.assertEqual([t["request_id"] for t in store.list()], ["c", "b"])
+
+
+class SamplingProfilerTest(unittest.TestCase):
+
+    def test_samples_the_profiled_thread(self):
+        def busy_loop():
+            deadline = time.perf_counter() + 0.2
+            while time.perf_counter() < deadline:
+                pass
+
+        profiler = SamplingProfiler(interval=0.001).start()
+        busy_loop()
+        profiler.stop()
+        self.assertGreater(profiler.samples, 0)
+        self.assertIn("busy_loop", profiler.folded())
+        stack, count = profiler.folded().splitlines()[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
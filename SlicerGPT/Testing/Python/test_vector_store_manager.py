@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "Scripts"))
+
+from IndexStore import current_path
+from VectorStoreManager import VectorStoreManager
+
+WORDS = ("volume", "segment", "markup", "model", "transform", "sequence", "table", "plot")
+
+
+class WordEmbeddings(Embeddings):
+    """One dimension per known word, enough to tell the test documents apart without a model."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = np.array([text.lower().split().count(word) for word in WORDS], dtype=np.float32)
+        return (vector / max(np.linalg.norm(vector), 1.0)).tolist()
+
+
+class ShardedManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.index_root = os.path.join(self.root, "SlicerFAISS")
+        self.embeddings = WordEmbeddings()
+        self.write_source("first", ["volume rendering", "segment editor"])
+        self.write_source("second", ["markup curve", "model display"])
+        self.manager = VectorStoreManager(self.index_root, sharded=True, embeddings=self.embeddings)
+
+    def tearDown(self):
+        for store in self.manager.stores.values():
+            store.close()
+        shutil.rmtree(self.root)
+
+    def write_source(self, name, texts):
+        store = FAISS.from_documents([Document(page_content=text) for text in texts], self.embeddings)
+        store.save_local(os.path.join(self.index_root, name))
+
+    def test_timings_are_returned_per_search(self):
+        timings = {}
+        docs = self.manager.search_with_score("markup", k=1, timings=timings)
+        self.assertEqual(docs[0][0].page_content, "markup curve")
+        self.assertEqual(set(timings), {"first", "second"})
+        # Cached results search no store
+        cached = {}
+        self.manager.search_with_score("markup", k=1, timings=cached)
+        self.assertEqual(cached, {})
+
+    def test_added_shard_grows_the_search_pool(self):
+        self.manager.search("volume", k=1)
+        self.assertEqual(self.manager.executor_workers, 2)
+        self.write_source("third", ["transform hierarchy"])
+        self.manager.reload_shard("third")
+        timings = {}
+        docs = self.manager.search_with_score("transform", k=1, timings=timings)
+        self.assertEqual(docs[0][0].page_content, "transform hierarchy")
+        self.assertEqual(self.manager.executor_workers, 3)
+        self.assertEqual(len(timings), 3)
+
+    def test_reloaded_shard_keeps_the_version_of_running_searches(self):
+        stores, _ = self.manager.acquire_stores(["first"])
+        old_version = stores[0].version_path
+        self.write_source("first", ["sequence browser", "table view"])
+        self.manager.reload_shard("first")
+        shard_path = os.path.join(self.manager.shard_index_path, "first")
+        self.assertNotEqual(current_path(shard_path), old_version)
+        # The search started before the reload still reads its version
+        self.assertTrue(os.path.isdir(old_version))
+        self.assertEqual([doc.page_content for doc in stores[0].get([1])], ["segment editor"])
+        self.manager.release_stores(stores)
+        self.assertFalse(os.path.isdir(old_version))
+        self.assertEqual(self.manager.search("table", k=1, sources=["first"])[0].page_content, "table view")
+
+
+if __name__ == "__main__":
+    unittest.main()